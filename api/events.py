@@ -0,0 +1,148 @@
+import asyncio
+import json
+import os
+import threading
+
+from api.jobs import FAILED_STAGES
+
+# events kept per subscriber before the oldest ones are dropped
+EVENT_QUEUE_SIZE = int(os.getenv("EVENT_QUEUE_SIZE", "32"))
+
+# seconds between heartbeat comments on idle streams (keeps proxies from closing them)
+EVENT_HEARTBEAT_SECONDS = float(os.getenv("EVENT_HEARTBEAT_SECONDS", "15"))
+
+
+class Subscription:
+    """one connected client listening to a job."""
+
+    def __init__(self, job_id, loop, queue_size):
+        self.job_id = job_id
+        self.loop = loop
+        self.queue = asyncio.Queue(maxsize=queue_size)
+        self.dropped = 0
+
+
+class EventBroker:
+    """
+    Fans job events out to subscribed clients.
+
+    publish() can be called from any thread (sync routes run in the threadpool),
+    events are handed to each subscriber's loop. Every subscriber has a bounded
+    queue, a slow client loses its oldest events instead of growing memory.
+    """
+
+    def __init__(self, queue_size=EVENT_QUEUE_SIZE):
+        self.queue_size = queue_size
+        self._subscribers = {}  # job_id -> set of Subscription
+        self._lock = threading.Lock()
+
+    def subscribe(self, job_id):
+        sub = Subscription(job_id, asyncio.get_running_loop(), self.queue_size)
+        with self._lock:
+            self._subscribers.setdefault(job_id, set()).add(sub)
+        return sub
+
+    def unsubscribe(self, sub):
+        with self._lock:
+            subs = self._subscribers.get(sub.job_id)
+            if subs:
+                subs.discard(sub)
+                if not subs:
+                    del self._subscribers[sub.job_id]
+
+    def publish(self, job_id, event, data):
+        with self._lock:
+            subs = list(self._subscribers.get(job_id, ()))
+        for sub in subs:
+            sub.loop.call_soon_threadsafe(_offer, sub, {"event": event, "data": data})
+
+    def subscriber_count(self):
+        with self._lock:
+            return sum(len(subs) for subs in self._subscribers.values())
+
+
+def _offer(sub, message):
+    """put a message on a subscriber queue, dropping the oldest one when it is full."""
+    if sub.queue.full():
+        sub.queue.get_nowait()
+        sub.dropped += 1
+    sub.queue.put_nowait(message)
+
+
+def format_sse(event, data):
+    """encode one server-sent event."""
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+async def job_event_stream(broker, registry, job_id, heartbeat=EVENT_HEARTBEAT_SECONDS):
+    """
+    Async generator of server-sent events for one job.
+    Sends the current stage first, then every change, and closes after the result
+    (or an "error" event once the job failed, a failed stage ends the stream too).
+
+    Events published in this process arrive through the broker. With a shared state
+    backend the job is also polled, so changes made by another worker show up too.
+    """
+    sub = broker.subscribe(job_id)
+    try:
+        job = await registry.get_async(job_id)
+        if job is None:
+            yield format_sse("error", {"detail": "Unknown or expired job."})
+            return
+
+        yield format_sse("status", {"job_id": job_id, "status": job.stage, "progress": job.progress})
+        if job.done or job.stage in FAILED_STAGES:
+            yield _final_event(job)
+            return
+
+        last_stage = job.stage
+        poll = registry.poll_interval if registry.shared else None
+        wait = min(poll, heartbeat) if poll else heartbeat
+        idle = 0.0
+        while True:
+            try:
+                message = await asyncio.wait_for(sub.queue.get(), timeout=wait)
+            except asyncio.TimeoutError:
+                idle += wait
+                if poll:
+                    job = await registry.get_async(job_id)
+                    if job is None:
+                        yield format_sse("error", {"detail": "Job expired."})
+                        return
+                    if job.done or job.stage in FAILED_STAGES:
+                        yield format_sse("status", {"job_id": job_id, "status": job.stage})
+                        yield _final_event(job)
+                        return
+                    if job.stage != last_stage:
+                        last_stage, idle = job.stage, 0.0
+                        yield format_sse("status", {"job_id": job_id, "status": job.stage})
+                        continue
+                if idle >= heartbeat:
+                    idle = 0.0
+                    yield ": heartbeat\n\n"
+                continue
+
+            idle = 0.0
+            if message["event"] == "status":
+                last_stage = message["data"].get("status")
+            yield format_sse(message["event"], message["data"])
+            if message["event"] in ("result", "error"):
+                return
+            if message["event"] == "status" and last_stage in FAILED_STAGES:
+                # nothing else is coming, end with the stored error (fail() writes it before telling anyone)
+                yield _final_event(await registry.get_async(job_id) or job)
+                return
+    finally:
+        broker.unsubscribe(sub)
+
+
+def _final_event(job):
+    """the event a finished (or failed) job ends its stream with."""
+    if job.error or job.stage in FAILED_STAGES:
+        detail = job.error or f"Job ended with '{job.stage}'."
+        return format_sse("error", {"job_id": job.id, "status": job.stage, "detail": detail})
+    return format_sse("result", job.result)
+
+
+# process wide broker used by the routes
+event_broker = EventBroker()
@@ -0,0 +1,271 @@
+import asyncio
+import os
+import threading
+import time
+import uuid
+
+from metrics import registry
+from state.backends import get_state_backend
+
+# how long finished jobs are kept around for late waiters (seconds)
+JOB_RETENTION_SECONDS = float(os.getenv("JOB_RETENTION_SECONDS", "600"))
+
+# how long a job that never finishes is kept before it is dropped (seconds)
+JOB_MAX_AGE_SECONDS = float(os.getenv("JOB_MAX_AGE_SECONDS", "3600"))
+
+# with a shared state backend, how often waiters check for a result posted to another worker (seconds)
+JOB_POLL_SECONDS = float(os.getenv("JOB_POLL_SECONDS", "0.5"))
+
+# unfinished jobs (id -> stage, created_at, expires_at), what lookups without a job id and the queue metrics read
+PENDING_KEY = "jobs:pending"
+
+TIMING_PREFIX = "timing:"
+
+# stages a job can't recover from, reported through set_stage by older callers: they end the job (see fail())
+FAILED_STAGES = ("upload_failed", "detection_failed", "failed")
+
+
+class Job:
+    """a single upload -> detection -> recommendation run (a snapshot of its stored state)."""
+
+    def __init__(self, job_id):
+        self.id = job_id
+        self.stage = None
+        self.progress = None  # e.g. {"received_bytes": ..., "total_bytes": ...} while uploading
+        self.result = None
+        self.done = False
+        self.created_at = time.time()
+        self.finished_at = None
+        self.stage_started = self.created_at
+        self.timings = {}  # name -> seconds: time per stage plus detection / recommendation steps
+        self.content_hash = None  # sha256 of the uploaded video, the key of its result in api.result_cache
+
+    @property
+    def error(self):
+        """why the job failed (see JobRegistry.fail), None while running or after a result."""
+        return self.result.get("error") if self.done and isinstance(self.result, dict) else None
+
+    @classmethod
+    def from_record(cls, job_id, record):
+        job = cls(job_id)
+        for field in ("stage", "progress", "result", "created_at", "finished_at", "stage_started", "content_hash"):
+            setattr(job, field, record.get(field))
+        job.done = bool(record.get("done"))
+        job.timings = {field[len(TIMING_PREFIX):]: value for field, value in record.items()
+                       if field.startswith(TIMING_PREFIX)}
+        return job
+
+
+class JobRegistry:
+    """
+    Registry of jobs, stored in the state backend so every worker process sees them.
+
+    Status updates and results can come from sync routes (threadpool) while waiters
+    await an asyncio future per job, so no thread is held while a job is running.
+    A result posted to this process wakes its waiters straight away, with a shared
+    backend waiters also poll for results that another worker received.
+    """
+
+    def __init__(self, retention=JOB_RETENTION_SECONDS, max_age=JOB_MAX_AGE_SECONDS, backend=None,
+                 poll_interval=JOB_POLL_SECONDS):
+        self.retention = retention
+        self.max_age = max_age
+        self.poll_interval = poll_interval
+        self._backend = backend
+        self._waiters = {}  # job_id -> (loop, future) pairs waiting in this process
+        self._lock = threading.Lock()
+        self._listeners = []  # callables (job_id, event, data) told about stage changes and results
+
+    @property
+    def backend(self):
+        # resolved on first use, so importing this module doesn't open the backend
+        return self._backend or get_state_backend()
+
+    @property
+    def shared(self):
+        """True if other processes can change jobs behind our back (poll instead of only waiting)."""
+        return self.backend.shared
+
+    @staticmethod
+    def _key(job_id):
+        return f"job:{job_id}"
+
+    def add_listener(self, listener):
+        """register a callable that is told about stage changes ("status") and results ("result") in this process."""
+        self._listeners.append(listener)
+
+    def _notify(self, job_id, event, data):
+        for listener in self._listeners:
+            listener(job_id, event, data)
+
+    def create(self):
+        """register a new job and return its id."""
+        job_id = uuid.uuid4().hex
+        now = time.time()
+        self.backend.hset(self._key(job_id), {"stage": None, "done": False, "created_at": now, "stage_started": now},
+                          ttl=self.max_age)
+        self.backend.hset(PENDING_KEY, {job_id: {"stage": None, "created_at": now, "expires_at": now + self.max_age}})
+        return job_id
+
+    def get(self, job_id):
+        if not job_id:
+            return None
+        record = self.backend.hgetall(self._key(job_id))
+        return Job.from_record(job_id, record) if record else None
+
+    def resolve(self, job_id=None):
+        """
+        Return the id of an existing job.
+        Without an id (older clients / notebook) the newest unfinished job is used.
+        """
+        if job_id:
+            return job_id if self.backend.hgetall(self._key(job_id)) else None
+        pending = self._pending()
+        return max(pending, key=lambda pending_id: pending[pending_id]["created_at"]) if pending else None
+
+    def _update(self, job_id, update, ttl=None):
+        """atomically apply update(record) -> fields to an unfinished job, returns what was written (None/{} if nothing)."""
+        return self.backend.hupdate(self._key(job_id), lambda record: None if record.get("done") else update(record),
+                                    ttl=ttl)
+
+    @staticmethod
+    def _closed_stage(record, now):
+        """timing field holding the time spent in the current stage, added to what is already there."""
+        if not record.get("stage"):
+            return {}
+        field = f"{TIMING_PREFIX}stage.{record['stage']}"
+        return {field: (record.get(field) or 0) + now - (record.get("stage_started") or now)}
+
+    def set_stage(self, job_id, stage):
+        now = time.time()
+        if not self._update(job_id, lambda record: {**self._closed_stage(record, now),
+                                                    "stage": stage, "stage_started": now}):
+            return False
+        # only touches the entry if the job is still pending (complete() may have removed it meanwhile)
+        self.backend.hupdate(PENDING_KEY, lambda pending: {job_id: {**pending[job_id], "stage": stage}}
+                             if job_id in pending else None)
+        self._notify(job_id, "status", {"job_id": job_id, "status": stage})
+        return True
+
+    def set_progress(self, job_id, **progress):
+        return bool(self._update(job_id, lambda record: {"progress": progress}))
+
+    def set_content_hash(self, job_id, content_hash):
+        """remember which video the job is for, so its detection result can be cached."""
+        return bool(self._update(job_id, lambda record: {"content_hash": content_hash}))
+
+    def record_timing(self, job_id, name, seconds):
+        """attach a timing (seconds) to a job, e.g. detection stages reported by the worker."""
+        field = f"{TIMING_PREFIX}{name}"
+        return bool(self._update(job_id, lambda record: {field: (record.get(field) or 0) + seconds}))
+
+    def _finish(self, job_id, result, stage):
+        """mark the job done with its result (only the first one counts), returns False if nothing was written."""
+        now = time.time()
+        if not self._update(job_id, lambda record: {
+            **self._closed_stage(record, now),
+            "result": result, "done": True, "stage": stage, "finished_at": now, "stage_started": now,
+        }, ttl=self.retention):
+            return False
+        self.backend.hdel(PENDING_KEY, job_id)
+
+        with self._lock:
+            waiters = self._waiters.pop(job_id, [])
+        for loop, future in waiters:
+            loop.call_soon_threadsafe(_set_future_result, future, result)
+        self._notify(job_id, "status", {"job_id": job_id, "status": stage})
+        return True
+
+    def complete(self, job_id, result):
+        """store the result and wake up everyone waiting on the job in this process (only the first result counts)."""
+        if not self._finish(job_id, result, "done"):
+            return False
+        self._notify(job_id, "result", result)
+        return True
+
+    def fail(self, job_id, detail, stage="failed"):
+        """
+        end the job with an error instead of a result, waiters get {"error": detail, "status": stage}
+        and stream listeners an "error" event, so nobody waits for a result that won't come.
+        """
+        if not self._finish(job_id, {"error": detail, "status": stage}, stage):
+            return False
+        self._notify(job_id, "error", {"job_id": job_id, "status": stage, "detail": detail})
+        return True
+
+    async def get_async(self, job_id):
+        """get() for async code, shared backends do blocking I/O so it runs in a thread."""
+        if not self.shared:
+            return self.get(job_id)
+        return await asyncio.to_thread(self.get, job_id)
+
+    async def wait(self, job_id, timeout):
+        """wait for the job result without tying up a thread. raises asyncio.TimeoutError."""
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        with self._lock:
+            self._waiters.setdefault(job_id, []).append((loop, future))
+
+        try:
+            job = await self.get_async(job_id)
+            if job is None:
+                raise KeyError(job_id)
+            if job.done:
+                return job.result
+            if not self.shared:
+                return await asyncio.wait_for(future, timeout=timeout)
+
+            deadline = loop.time() + timeout
+            while True:
+                remaining = deadline - loop.time()
+                if remaining <= 0:
+                    raise asyncio.TimeoutError()
+                try:
+                    return await asyncio.wait_for(asyncio.shield(future), timeout=min(self.poll_interval, remaining))
+                except asyncio.TimeoutError:
+                    pass
+                # the result may have been posted to another worker
+                job = await self.get_async(job_id)
+                if job is None:
+                    raise KeyError(job_id)
+                if job.done:
+                    return job.result
+        finally:
+            with self._lock:
+                waiters = self._waiters.get(job_id)
+                if waiters and (loop, future) in waiters:
+                    waiters.remove((loop, future))
+                    if not waiters:
+                        del self._waiters[job_id]
+
+    def _pending(self):
+        """unfinished jobs in one read, entries of jobs that expired without a result are dropped."""
+        now = time.time()
+        pending = self.backend.hgetall(PENDING_KEY)
+        for job_id in [job_id for job_id, entry in pending.items() if entry["expires_at"] <= now]:
+            self.backend.hdel(PENDING_KEY, job_id)
+            del pending[job_id]
+        return pending
+
+    def pending_count(self):
+        return len(self._pending())
+
+    def stage_counts(self):
+        """number of unfinished jobs per stage (the job queue depth)."""
+        counts = {}
+        for entry in self._pending().values():
+            counts[entry["stage"] or "created"] = counts.get(entry["stage"] or "created", 0) + 1
+        return counts
+
+
+def _set_future_result(future, result):
+    if not future.done():
+        future.set_result(result)
+
+
+# process wide registry used by the routes
+job_registry = JobRegistry()
+
+registry.gauge("jobs_pending", "Unfinished jobs per stage.",
+               lambda: {(stage,): count for stage, count in job_registry.stage_counts().items()}, labels=("stage",))
+registry.gauge("jobs_queue_depth", "Jobs waiting for upload, detection or recommendation.", job_registry.pending_count)
@@ -0,0 +1,199 @@
+"""
+Detection results keyed by the content hash of the uploaded video.
+
+Users often upload the same clip again (e.g. after a timeout), a hit lets
+/upload_video skip Drive and detection and go straight to recommendations.
+Entries live in SQLite so they survive restarts and are shared by every worker
+on the host, the least recently used ones are evicted above RESULT_CACHE_MAXSIZE.
+
+    python -m api.result_cache status     # entries, hits, misses
+    python -m api.result_cache clear      # e.g. after changing the detection model
+"""
+import argparse
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+
+from metrics import registry
+
+# setting up the logger
+logger = logging.getLogger(__name__)
+
+# where cached detection results are stored
+RESULT_CACHE_PATH = os.getenv("RESULT_CACHE_PATH", "results.sqlite3")
+
+# most results kept (least recently used are evicted), 0 turns the cache off
+RESULT_CACHE_MAXSIZE = int(os.getenv("RESULT_CACHE_MAXSIZE", "1000"))
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS results (
+    content_hash TEXT PRIMARY KEY,
+    emotion TEXT NOT NULL,
+    breakdown TEXT NOT NULL,
+    created_at REAL NOT NULL,
+    last_used REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS results_by_last_used ON results (last_used);
+CREATE TABLE IF NOT EXISTS stats (name TEXT PRIMARY KEY, value INTEGER NOT NULL);
+"""
+
+
+class ResultCache:
+    """content hash -> {"emotion", "breakdown"}, bounded LRU in a SQLite file."""
+
+    def __init__(self, path=RESULT_CACHE_PATH, maxsize=RESULT_CACHE_MAXSIZE):
+        self.path = path
+        self.maxsize = maxsize
+        self._local = threading.local()
+        self._schema_ready = False
+        self._schema_lock = threading.Lock()
+
+    @property
+    def enabled(self):
+        return self.maxsize > 0
+
+    def _connection(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=10, isolation_level=None, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA busy_timeout=10000")
+            self._local.conn = conn
+        # created on first use, so importing the routes doesn't touch the disk
+        with self._schema_lock:
+            if not self._schema_ready:
+                conn.executescript(SCHEMA)
+                self._schema_ready = True
+        return conn
+
+    def _count(self, conn, name):
+        conn.execute(
+            "INSERT INTO stats (name, value) VALUES (?, 1) ON CONFLICT(name) DO UPDATE SET value = value + 1",
+            (name,),
+        )
+
+    def get(self, content_hash):
+        """cached result for the hash or None, counts a hit or a miss."""
+        if not self.enabled or not content_hash:
+            return None
+        conn = self._connection()
+        # a plain read (WAL readers don't lock), the bookkeeping below is written afterwards
+        row = conn.execute("SELECT emotion, breakdown FROM results WHERE content_hash = ?",
+                           (content_hash,)).fetchone()
+        try:
+            if row:
+                conn.execute("UPDATE results SET last_used = ? WHERE content_hash = ?", (time.time(), content_hash))
+            self._count(conn, "hits" if row else "misses")
+        except sqlite3.OperationalError as e:
+            # e.g. the database stayed locked, the result is still good
+            logger.warning(f"result cache: could not record the lookup: {str(e)}")
+        return {"emotion": row[0], "breakdown": json.loads(row[1])} if row else None
+
+    def put(self, content_hash, emotion, breakdown):
+        """store a detection result, evicting the least recently used entries above maxsize."""
+        if not self.enabled or not content_hash:
+            return
+        now = time.time()
+        conn = self._connection()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.execute(
+                "INSERT INTO results (content_hash, emotion, breakdown, created_at, last_used) VALUES (?, ?, ?, ?, ?) "
+                "ON CONFLICT(content_hash) DO UPDATE SET emotion = excluded.emotion, "
+                "breakdown = excluded.breakdown, last_used = excluded.last_used",
+                (content_hash, emotion, json.dumps(breakdown), now, now),
+            )
+            evicted = conn.execute(
+                "DELETE FROM results WHERE content_hash IN "
+                "(SELECT content_hash FROM results ORDER BY last_used DESC LIMIT -1 OFFSET ?)",
+                (self.maxsize,),
+            ).rowcount
+            if evicted > 0:
+                conn.execute(
+                    "INSERT INTO stats (name, value) VALUES ('evictions', ?) "
+                    "ON CONFLICT(name) DO UPDATE SET value = value + excluded.value",
+                    (evicted,),
+                )
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+
+    def stats(self):
+        """entries, hits, misses, evictions and hit ratio (counted over every worker since the file was created)."""
+        if not self.enabled:
+            return {"enabled": False}
+        counts = dict(self._connection().execute(
+            "SELECT name, value FROM stats UNION ALL SELECT 'entries', COUNT(*) FROM results"
+        ).fetchall())
+        hits, misses = counts.get("hits", 0), counts.get("misses", 0)
+        return {
+            "enabled": True,
+            "entries": counts["entries"],
+            "maxsize": self.maxsize,
+            "hits": hits,
+            "misses": misses,
+            "evictions": counts.get("evictions", 0),
+            "hit_ratio": round(hits / (hits + misses), 4) if hits + misses else None,
+        }
+
+    def clear(self):
+        conn = self._connection()
+        conn.execute("DELETE FROM results")
+        conn.execute("DELETE FROM stats")
+
+
+# process wide cache used by the routes
+result_cache = ResultCache()
+
+
+# how long one stats() read is reused, so a /metrics scrape reads the file once for all the metrics below
+STATS_SNAPSHOT_SECONDS = 1.0
+
+_snapshot = (0.0, {})
+_snapshot_lock = threading.Lock()
+
+
+def _stats_snapshot():
+    global _snapshot
+    if not result_cache.enabled:
+        return {}
+    with _snapshot_lock:
+        taken_at, stats = _snapshot
+        if time.monotonic() - taken_at >= STATS_SNAPSHOT_SECONDS:
+            stats = result_cache.stats()
+            _snapshot = (time.monotonic(), stats)
+        return stats
+
+
+def _stat(name):
+    return lambda: _stats_snapshot().get(name)
+
+
+registry.counter_callback("result_cache_lookups_total", "Uploads looked up by content hash, per outcome.",
+                          lambda: {(outcome,): _stats_snapshot()[outcome] for outcome in ("hits", "misses")}
+                          if result_cache.enabled else {}, labels=("outcome",))
+registry.counter_callback("result_cache_evictions_total", "Results evicted from the result cache.", _stat("evictions"))
+registry.gauge("result_cache_hit_ratio", "Share of uploads whose detection result was cached.", _stat("hit_ratio"))
+registry.gauge("result_cache_entries", "Detection results held in the result cache.", _stat("entries"))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Inspect the upload content-hash result cache.")
+    parser.add_argument("command", choices=["status", "clear"])
+    parser.add_argument("--path", default=RESULT_CACHE_PATH)
+    args = parser.parse_args()
+
+    cache = ResultCache(args.path, maxsize=max(RESULT_CACHE_MAXSIZE, 1))
+    if args.command == "clear":
+        cache.clear()
+        print(f"cleared {args.path}")
+    else:
+        print(json.dumps(cache.stats(), indent=2))
+
+
+if __name__ == "__main__":
+    main()
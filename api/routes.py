@@ -1,39 +1,56 @@
-from fastapi import APIRouter, Query, HTTPException, UploadFile, File
-from fastapi.responses import JSONResponse, RedirectResponse
-from recommendation.spotify_auth import get_spotify_oauth
-from recommendation.recommender import EmotionRecommender
-import json
+from fastapi import APIRouter, BackgroundTasks, Query, HTTPException, Request
+from fastapi.responses import JSONResponse, PlainTextResponse, RedirectResponse, StreamingResponse
+from recommendation.spotify_auth import StateTokenCache, get_spotify_oauth
+from recommendation.recommender import EmotionRecommender, format_recommendations
+from recommendation.cache import invalidate_user_profile
+from recommendation.catalog import get_catalog
+from api.jobs import FAILED_STAGES, job_registry
+from api.events import event_broker, job_event_stream
+from api.result_cache import result_cache
+from api.uploads import (
+    UPLOAD_FRAME_EXTRACTION, BadUpload, UploadTooLarge, check_upload_size, extract_frame_bundle, get_drive,
+    stream_to_disk, upload_to_drive,
+)
+from api.warmup import readiness
+from fastapi.concurrency import run_in_threadpool
+from metrics import DETECTION_STAGE_SECONDS, DETECTION_STAGES, add_span, registry
+import asyncio
+import hashlib
+import math
 import os
 import time
-from pydrive2.auth import GoogleAuth 
-from pydrive2.drive import GoogleDrive
-from threading import Event
-from dotenv import load_dotenv
-
-load_dotenv()
 
 router = APIRouter()
 sp_oauth = None  # 👈 initialized here, no early assignment
 
-# sets processing stage
-current_status = {"stage": None} 
+# push job stage changes and results to /status_stream subscribers
+job_registry.add_listener(event_broker.publish)
+
+# songs returned by /recommend/{emotion} for anonymous users
+RECOMMENDATION_COUNT = 30
 
-# storing emotion and playlist result here temporarily
-latest_result = {"ready": False, "data": None}
-response_event = Event()
+# how long /process_latest waits for Colab before giving up (seconds)
+PROCESS_TIMEOUT_SECONDS = float(os.getenv("PROCESS_TIMEOUT_SECONDS", "400"))
 
 @router.post("/logout", summary="Logout from Spotify")
 def logout():
     """
-    Deletes the Spotify .cache file to simulate logout.
+    Deletes the stored Spotify token (and any old .cache file) to log out.
     """
-    cache_file = ".cache"
+    token_cache = StateTokenCache()
 
-    if os.path.exists(cache_file):
-        try:
-            os.remove(cache_file)
-        except Exception as e:
-            return JSONResponse(content={"error": f"Error deleting cache: {e}"}, status_code=500)
+    try:
+        # forget the cached taste profile for this token before it goes away
+        token_info = token_cache.get_cached_token()
+        if token_info:
+            invalidate_user_profile(token_info.get("access_token"))
+    except Exception as e:
+        print(f"⚠️ Could not read token to clear profile cache: {e}")
+
+    try:
+        token_cache.clear()
+    except Exception as e:
+        return JSONResponse(content={"error": f"Error deleting cache: {e}"}, status_code=500)
 
     # 🧼 Reset the OAuth state after logout to prevent stale token usage
     global sp_oauth
@@ -42,11 +59,33 @@ def logout():
     return JSONResponse(content={"message": "Logged out successfully."}, status_code=200)
 
 @router.get("/status_check")
-def status_check():
+def status_check(job_id: str = Query(None)):
     """
     Frontend polls this to check current status (e.g., 'processing_started').
+    Without a job_id the newest unfinished job is reported.
     """
-    return {"status": current_status["stage"]}
+    job = job_registry.get(job_registry.resolve(job_id))
+    return {
+        "job_id": job.id if job else None,
+        "status": job.stage if job else None,
+        "progress": job.progress if job else None,
+    }
+
+@router.get("/status_stream")
+async def status_stream(job_id: str = Query(...)):
+    """
+    Server-Sent Events stream for a job, replaces polling /status_check.
+    Emits "status" events on every stage change, then one "result" event with the
+    colab_callback result and closes. Idle streams get a heartbeat comment.
+    """
+    if not await job_registry.get_async(job_id):
+        raise HTTPException(status_code=404, detail="Unknown or expired job.")
+
+    return StreamingResponse(
+        job_event_stream(event_broker, job_registry, job_id),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
 
 @router.post("/status_update")
 def status_update(data: dict):
@@ -55,33 +94,36 @@ def status_update(data: dict):
     Can be used by frontend to reflect real-time stages (example: processing started).
     """
     status = data.get("status")
-    print(f"📡 Colab status update: {status}")
-    current_status["stage"] = status  # change status
-    return {"message": f"Status '{status}' received"}
+    job_id = job_registry.resolve(data.get("job_id"))
+    print(f"📡 Colab status update: {status} (job {job_id})")
 
+    if not job_id:
+        raise HTTPException(status_code=404, detail="No matching job for status update.")
 
-@router.post("/colab_callback")
-def colab_callback(data: dict):
-    """
-    Called by Colab after processing to send the detected emotion.
-    Calls /recommend internally and stores response.
-    """
-    emotion = data.get("emotion")
-    breakdown = data.get("breakdown", [])  #  receive the breakdown from colab
-    access_token = data.get("access_token")  # optional
+    if status in FAILED_STAGES:
+        # nothing more will happen to the job, end it so waiters and streams don't hang
+        job_registry.fail(job_id, data.get("detail") or f"Job ended with '{status}'.", status)
+    else:
+        job_registry.set_stage(job_id, status)  # change status
+    return {"message": f"Status '{status}' received", "job_id": job_id}
 
-    if not emotion:
-        raise HTTPException(status_code=400, detail="Emotion not provided.")
 
+def finish_job(job_id, emotion, breakdown, access_token=None):
+    """recommend songs for the detected emotion, pick / create the playlist and complete the job."""
     # build recommender and get recommendations
+    started = time.perf_counter()
     recommender = EmotionRecommender(user_authenticated=bool(access_token), user_token=access_token)
-    recommendations = recommender.recommend_songs(emotion)
+    tracks = recommender.recommend_tracks(emotion, breakdown)
+    recommendations = format_recommendations(tracks)
+    job_registry.record_timing(job_id, "recommend", time.perf_counter() - started)
 
     # get either personal playlist or public
+    started = time.perf_counter()
     if access_token:
-        playlist = recommender.create_playlist(emotion, access_token)
+        playlist = recommender.create_playlist(emotion, access_token, recommendations=tracks)
     else:
         playlist = recommender.get_public_playlist_by_emotion(emotion)
+    job_registry.record_timing(job_id, "playlist", time.perf_counter() - started)
 
     # full result with breakdown
     result = {
@@ -91,29 +133,84 @@ def colab_callback(data: dict):
         "playlist_created": playlist
     }
 
-    latest_result["data"] = result
-    latest_result["ready"] = True
-    response_event.set()
+    job_registry.complete(job_id, result)
+    return result
 
-    return {"message": "✅ Callback received from Colab."}
+def finish_cached_job(job_id, cached):
+    """a re-uploaded video: reuse its detection result and go straight to recommendations."""
+    try:
+        # same token the worker would fetch from /token before posting its result
+        token_info = StateTokenCache().get_cached_token()
+        finish_job(job_id, cached["emotion"], cached["breakdown"], token_info.get("access_token") if token_info else None)
+    except Exception as e:
+        print(f"❌ Recommending for cached result failed (job {job_id}): {e}")
+        job_registry.fail(job_id, f"Recommending songs failed: {e}")
+
+def detection_timings(timings):
+    """
+    the worker's seconds per detection stage, only known stages with sane numbers are kept
+    (stage names become metric labels, and a bad value must not stop the job from finishing).
+    """
+    valid = {}
+    for stage, seconds in (timings.items() if isinstance(timings, dict) else ()):
+        if stage not in DETECTION_STAGES:
+            continue
+        try:
+            seconds = float(seconds)
+        except (TypeError, ValueError):
+            continue
+        if math.isfinite(seconds) and seconds >= 0:
+            valid[stage] = seconds
+    return valid
+
+@router.post("/colab_callback")
+def colab_callback(data: dict):
+    """
+    Called by Colab after processing to send the detected emotion.
+    Calls /recommend internally and stores response.
+    """
+    emotion = data.get("emotion")
+    breakdown = data.get("breakdown", [])  #  receive the breakdown from colab
+    access_token = data.get("access_token")  # optional
+
+    if not emotion:
+        raise HTTPException(status_code=400, detail="Emotion not provided.")
+    timings = detection_timings(data.get("timings"))
+
+    job_id = job_registry.resolve(data.get("job_id"))
+    if not job_id:
+        raise HTTPException(status_code=404, detail="No matching job for callback.")
+
+    # detection time per stage as measured by the worker / notebook
+    for stage, seconds in timings.items():
+        DETECTION_STAGE_SECONDS.observe(seconds, stage=stage)
+        job_registry.record_timing(job_id, f"detection.{stage}", seconds)
+
+    # remember the result in case the same video is uploaded again
+    job = job_registry.get(job_id)
+    if job and job.content_hash:
+        try:
+            result_cache.put(job.content_hash, emotion, breakdown)
+        except Exception as e:
+            print(f"⚠️ Could not cache detection result: {e}")
+
+    finish_job(job_id, emotion, breakdown, access_token)
+
+    return {"message": "✅ Callback received from Colab.", "job_id": job_id}
 
 
 @router.get("/token", summary="Get latest Spotify access token")
 def get_access_token():
-    """Reads the cached access token from the .cache file."""
-    cache_file = ".cache"
-
-    if os.path.exists(cache_file):
-        with open(cache_file, "r") as file:
-            token_data = json.load(file)
-            access_token = token_data.get("access_token")
-            if access_token:
-                return {"access_token": access_token}
+    """Reads the stored access token (shared by every worker, see state.backends)."""
+    token_data = StateTokenCache().get_cached_token()
+    access_token = token_data.get("access_token") if token_data else None
+    if access_token:
+        return {"access_token": access_token}
 
     raise HTTPException(status_code=404, detail="No valid access token found.")
 
 @router.post("/recommend")
-async def recommend_songs(data: dict):
+def recommend_songs(data: dict):
     """Receive emotion from detection model and return recommended songs (and create a playlist if authenticated)."""
     emotion = data.get("emotion", "").lower()
     access_token = data.get("access_token", None)  # Get access token
@@ -124,12 +221,13 @@ async def recommend_songs(data: dict):
     user_authenticated = bool(access_token)  # Determine if user is logged in
     recommender = EmotionRecommender(user_authenticated=user_authenticated, user_token=access_token)
 
-    recommendations = recommender.recommend_songs(emotion)
+    tracks = recommender.recommend_tracks(emotion)
+    recommendations = format_recommendations(tracks)
 
     # if a user is authenticated, create a playlist automatically
     playlist_response = None
     if user_authenticated:
-        playlist_response = recommender.create_playlist(emotion, access_token)
+        playlist_response = recommender.create_playlist(emotion, access_token, recommendations=tracks)
 
     return {
         "emotion": emotion,
@@ -151,6 +249,13 @@ def get_recommendations(emotion: str, access_token: str = None):
         raise HTTPException(status_code=400, detail=f"Invalid emotion: {emotion}. Valid emotions are {VALID_EMOTIONS}.")
 
     user_authenticated = bool(access_token)
+
+    # anonymous traffic is served from the local catalog snapshot when there is one
+    if not user_authenticated:
+        songs = get_catalog().sample(emotion, RECOMMENDATION_COUNT)
+        if songs:
+            return {"emotion": emotion, "recommended_songs": songs}
+
     recommender = EmotionRecommender(user_authenticated=user_authenticated, user_token=access_token)
 
     return {
@@ -158,6 +263,16 @@ def get_recommendations(emotion: str, access_token: str = None):
         "recommended_songs": recommender.recommend_songs(emotion),
     }
 
+@router.get("/catalog_status", summary="Local track catalog size and staleness")
+def catalog_status():
+    """Reports how many tracks the local catalog holds and how old the snapshot is."""
+    return get_catalog().status()
+
+@router.get("/metrics", summary="Prometheus metrics", response_class=PlainTextResponse)
+def metrics():
+    """Request latency, Spotify calls, cache hit ratios, job queue depth and detection timings."""
+    return PlainTextResponse(registry.render(), media_type="text/plain; version=0.0.4")
+
 @router.get("/login", summary="Login to Spotify")
 def login():
     """
@@ -172,7 +287,8 @@ def login():
 def callback(code: str = Query(None)):
     """
     Handles the OAuth callback from Spotify.
-    Stores access token in .cache and redirects back to frontend.
+    Stores the access token in the state backend (StateTokenCache, shared by every worker)
+    and redirects back to frontend.
     """
     if not code:
         raise HTTPException(status_code=400, detail="Authorization code is missing.")
@@ -196,52 +312,146 @@ def create_playlist(emotion: str, access_token: str):
     recommender = EmotionRecommender(user_authenticated=True, user_token=access_token)
     return recommender.create_playlist(emotion, access_token)
 
-# google drive integration
-if not os.path.exists("settings.yaml"):
-    raise RuntimeError("Missing Google Drive settings.yaml for PyDrive.")
-
-gauth = GoogleAuth(settings_file="settings.yaml")
-gauth.ServiceAuth()
-drive = GoogleDrive(gauth)
+@router.get("/ready", summary="Readiness probe")
+def ready():
+    """
+    200 once the clients needed to serve requests are warmed up, 503 before that.
+    Reports every component (spotify, drive, catalog) so a slow Drive login is visible.
+    """
+    is_ready, components = readiness()
+    return JSONResponse(content={"ready": is_ready, "components": components}, status_code=200 if is_ready else 503)
 
+# google drive integration, the client is created on first use (see api.uploads.get_drive)
 UPLOAD_FOLDER_ID = "1bb_NAIVPAy-LZiIAL5ydK21eR_8DlbaD"  # Replace with actual folder ID
 
-@router.post("/upload_video")
-async def upload_video(video: UploadFile = File(...)):
+# the body is parsed by hand (see api.uploads.stream_to_disk), this keeps the file field in the docs
+UPLOAD_VIDEO_OPENAPI = {
+    "requestBody": {
+        "required": True,
+        "content": {"multipart/form-data": {"schema": {
+            "type": "object", "required": ["video"], "properties": {"video": {"type": "string", "format": "binary"}},
+        }}},
+    },
+}
+
+@router.post("/upload_video", openapi_extra=UPLOAD_VIDEO_OPENAPI)
+async def upload_video(request: Request, background_tasks: BackgroundTasks):
+    """
+    Uploads the video (form field "video") to Google Drive and returns a job id.
+    The job id is part of the Drive filename so Colab can send it back with its results.
+
+    The multipart body is parsed as it arrives and the video written straight to disk,
+    uploads over MAX_UPLOAD_BYTES are refused from their Content-Length before anything
+    is read (or as soon as they pass the limit). The blocking Drive upload runs in the
+    threadpool so other requests keep being served.
+    A video seen before (same sha256) skips Drive and detection, its cached emotion
+    goes straight to recommendations (see api.result_cache).
+    """
     try:
-        contents = await video.read()
-        local_filename = f"temp_{int(time.time())}_{video.filename}"
-        with open(local_filename, "wb") as f:
-            f.write(contents)
+        total_bytes = check_upload_size(request)  # includes the multipart framing, close enough for progress
+    except UploadTooLarge as e:
+        raise HTTPException(status_code=413, detail=str(e))
 
-        gfile = drive.CreateFile({"parents": [{"id": UPLOAD_FOLDER_ID}]})
-        gfile.SetContentFile(local_filename)
-        gfile.Upload()
-
-        os.remove(local_filename)
-        return {"success": True, "filename": video.filename}
+    job_id = await run_in_threadpool(job_registry.create)
+    local_path = upload_path = None  # a frame bundle replaces the video with UPLOAD_FRAME_EXTRACTION
 
+    try:
+        await run_in_threadpool(job_registry.set_stage, job_id, "uploading")
+        hasher = hashlib.sha256()
+        filename, local_path, received = await stream_to_disk(
+            request,
+            "video",
+            # registry calls are blocking backend I/O, they go through the threadpool like the rest
+            on_progress=lambda n: run_in_threadpool(job_registry.set_progress, job_id,
+                                                    received_bytes=n, total_bytes=total_bytes),
+            hasher=hasher,
+        )
+        upload_path, upload_name = local_path, filename
+
+        content_hash = hasher.hexdigest()
+        await run_in_threadpool(job_registry.set_content_hash, job_id, content_hash)
+        try:
+            cached = await run_in_threadpool(result_cache.get, content_hash)
+        except Exception as e:
+            print(f"⚠️ Result cache lookup failed: {e}")
+            cached = None
+        if cached:
+            # recommendations run after the response is sent, /process_latest and /status_stream pick up the result
+            await run_in_threadpool(job_registry.set_stage, job_id, "cached_result")
+            background_tasks.add_task(finish_cached_job, job_id, cached)
+            return {"success": True, "filename": filename, "job_id": job_id, "size": received, "cached": True}
+
+        # optionally only the sampled frames go to Drive / the detector (falls back to the video)
+        if UPLOAD_FRAME_EXTRACTION:
+            await run_in_threadpool(job_registry.set_stage, job_id, "extracting_frames")
+            started = time.perf_counter()
+            bundle_path = await run_in_threadpool(extract_frame_bundle, local_path)
+            add_span("frame_extraction", time.perf_counter() - started)
+            if bundle_path:
+                upload_path, upload_name = bundle_path, os.path.splitext(filename)[0] + os.path.splitext(bundle_path)[1]
+
+        await run_in_threadpool(job_registry.set_stage, job_id, "uploading_to_drive")
+        drive_title = f"temp_{int(time.time())}_{job_id}_{upload_name}"
+        started = time.perf_counter()
+        try:
+            drive = await run_in_threadpool(get_drive)
+        except Exception as e:
+            await run_in_threadpool(job_registry.fail, job_id, f"Google Drive is not available: {e}", "upload_failed")
+            raise HTTPException(status_code=503, detail=f"Google Drive is not available: {e}")
+        await run_in_threadpool(upload_to_drive, drive, upload_path, UPLOAD_FOLDER_ID, drive_title)
+        add_span("drive_upload", time.perf_counter() - started)
+
+        await run_in_threadpool(job_registry.set_stage, job_id, "uploaded")
+        return {"success": True, "filename": filename, "job_id": job_id, "size": received, "cached": False,
+                "uploaded_bytes": os.path.getsize(upload_path)}
+
+    except UploadTooLarge as e:
+        await run_in_threadpool(job_registry.fail, job_id, str(e), "upload_failed")
+        raise HTTPException(status_code=413, detail=str(e))
+    except BadUpload as e:
+        await run_in_threadpool(job_registry.fail, job_id, str(e), "upload_failed")
+        raise HTTPException(status_code=400, detail=str(e))
+    except HTTPException:
+        raise
     except Exception as e:
+        await run_in_threadpool(job_registry.fail, job_id, str(e), "upload_failed")
         raise HTTPException(status_code=500, detail=str(e))
+    finally:
+        for path in {local_path, upload_path} - {None}:
+            if os.path.exists(path):
+                os.remove(path)
 
 @router.post("/process_latest")
-def process_latest():
+async def process_latest(job_id: str = Query(None)):
     """
     Waits for Colab to finish processing and calls back with the playlist.
+    Without a job_id the newest unfinished job is waited on.
     """
-    print("🧠 Waiting for Colab to respond with emotion...")
-
-    # Reset result before waiting
-    latest_result["ready"] = False
-    latest_result["data"] = None
-    response_event.clear()
+    job_id = await run_in_threadpool(job_registry.resolve, job_id)
+    if not job_id:
+        raise HTTPException(status_code=404, detail="No matching job to wait for.")
 
-    # Wait for Colab to send back emotion (timeout after 400s)
-    is_set = response_event.wait(timeout=400)
+    print(f"🧠 Waiting for Colab to respond with emotion (job {job_id})...")
 
-    if not is_set:
+    # Wait for Colab to send back emotion (timeout after PROCESS_TIMEOUT_SECONDS)
+    started = time.perf_counter()
+    try:
+        result = await job_registry.wait(job_id, timeout=PROCESS_TIMEOUT_SECONDS)
+    except asyncio.TimeoutError:
         raise HTTPException(status_code=504, detail="Colab processing timed out.")
-    
-    print("✅ Returning from /process_latest:", latest_result["data"])
+    except KeyError:
+        raise HTTPException(status_code=404, detail="Job expired before a result arrived.")
+    finally:
+        add_span("job_wait", time.perf_counter() - started)
+
+    if isinstance(result, dict) and result.get("error"):
+        raise HTTPException(status_code=502, detail=result["error"])
+
+    # where the job spent its time (upload stages, detection, recommendation), for X-Timing-Trace
+    job = await job_registry.get_async(job_id)
+    for name, seconds in (job.timings.items() if job else ()):
+        add_span(name, seconds)
+
+    print("✅ Returning from /process_latest:", result)
 
-    return latest_result["data"]
+    return result
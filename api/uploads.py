@@ -0,0 +1,261 @@
+import logging
+import os
+import tempfile
+import threading
+import time
+
+# setting up the logger
+logger = logging.getLogger(__name__)
+
+# write buffer of the file an upload is streamed into (bytes)
+UPLOAD_CHUNK_SIZE = int(os.getenv("UPLOAD_CHUNK_SIZE", str(1024 * 1024)))
+
+# largest video accepted by /upload_video (bytes)
+MAX_UPLOAD_BYTES = int(os.getenv("MAX_UPLOAD_BYTES", str(500 * 1024 * 1024)))
+
+# how often the upload progress of a job is stored while the video is received (seconds)
+UPLOAD_PROGRESS_SECONDS = float(os.getenv("UPLOAD_PROGRESS_SECONDS", "0.5"))
+
+
+# send only the sampled, downscaled frames (a .npz frame bundle) to Drive instead of the whole video (needs OpenCV)
+UPLOAD_FRAME_EXTRACTION = os.getenv("UPLOAD_FRAME_EXTRACTION", "false").lower() in ("1", "true", "yes")
+
+
+# PyDrive settings (service account) used for Google Drive uploads
+DRIVE_SETTINGS_FILE = os.getenv("DRIVE_SETTINGS_FILE", "settings.yaml")
+
+_drive = None
+_drive_lock = threading.Lock()
+
+
+def get_drive():
+    """
+    Google Drive client, authenticated on first use (a network round trip) instead of
+    at import time. Raises if the settings are missing or Drive can't be reached,
+    the next call tries again.
+    """
+    global _drive
+    with _drive_lock:
+        if _drive is None:
+            from pydrive2.auth import GoogleAuth
+            from pydrive2.drive import GoogleDrive
+
+            if not os.path.exists(DRIVE_SETTINGS_FILE):
+                raise RuntimeError(f"Missing Google Drive {DRIVE_SETTINGS_FILE} for PyDrive.")
+            gauth = GoogleAuth(settings_file=DRIVE_SETTINGS_FILE)
+            gauth.ServiceAuth()
+            _drive = GoogleDrive(gauth)
+        return _drive
+
+
+def set_drive(drive):
+    """use another Drive client (anything with CreateFile, e.g. a local fake for benchmarks)."""
+    global _drive
+    with _drive_lock:
+        _drive = drive
+
+
+class UploadTooLarge(Exception):
+    """raised when an upload goes over MAX_UPLOAD_BYTES."""
+
+
+class BadUpload(Exception):
+    """raised when the body isn't a multipart form with the expected file field."""
+
+
+# room for the multipart boundaries and part headers around the video (bytes)
+MULTIPART_OVERHEAD_BYTES = 64 * 1024
+
+
+def check_upload_size(request, max_bytes=MAX_UPLOAD_BYTES):
+    """
+    Refuse an upload from its Content-Length before any of the body is read.
+    Returns the announced body size (None for chunked uploads, those are checked while streaming).
+    """
+    content_length = request.headers.get("content-length")
+    if not content_length or not content_length.isdigit():
+        return None
+    if int(content_length) > max_bytes + MULTIPART_OVERHEAD_BYTES:
+        raise UploadTooLarge(f"Upload is larger than the {max_bytes} byte limit.")
+    return int(content_length)
+
+
+class _FilePartWriter:
+    """python-multipart callbacks writing one file field of the form straight to a temp file."""
+
+    def __init__(self, field_name, max_bytes, hasher):
+        self.field_name = field_name
+        self.max_bytes = max_bytes
+        self.hasher = hasher
+        self.filename = None
+        self.path = None
+        self.received = 0
+        self._file = None
+        self._writing = False
+        self._disposition = b""
+        self._header_name = b""
+        self._header_value = b""
+
+    def callbacks(self):
+        return {
+            "on_part_begin": self.on_part_begin,
+            "on_part_data": self.on_part_data,
+            "on_part_end": self.on_part_end,
+            "on_header_field": self.on_header_field,
+            "on_header_value": self.on_header_value,
+            "on_header_end": self.on_header_end,
+            "on_headers_finished": self.on_headers_finished,
+        }
+
+    def on_part_begin(self):
+        self._disposition = b""
+
+    def on_header_field(self, data, start, end):
+        self._header_name += data[start:end]
+
+    def on_header_value(self, data, start, end):
+        self._header_value += data[start:end]
+
+    def on_header_end(self):
+        if self._header_name.lower() == b"content-disposition":
+            self._disposition = self._header_value
+        self._header_name = b""
+        self._header_value = b""
+
+    def on_headers_finished(self):
+        """open the temp file when the (first) part named field_name with a filename starts."""
+        from python_multipart.multipart import parse_options_header
+
+        _, options = parse_options_header(self._disposition)
+        if self.path is not None or b"filename" not in options:
+            return
+        if options.get(b"name", b"").decode("latin-1") != self.field_name:
+            return
+        self.filename = os.path.basename(options[b"filename"].decode("utf-8", "replace")) or "video.mp4"
+        self.path = temp_upload_path(self.filename)
+        self._file = open(self.path, "wb", buffering=UPLOAD_CHUNK_SIZE)
+        self._writing = True
+
+    def on_part_data(self, data, start, end):
+        if not self._writing:
+            return  # other form fields are ignored
+        chunk = data[start:end]
+        self.received += len(chunk)
+        if self.received > self.max_bytes:
+            raise UploadTooLarge(f"Upload is larger than the {self.max_bytes} byte limit.")
+        self._file.write(chunk)
+        if self.hasher is not None:
+            self.hasher.update(chunk)
+
+    def on_part_end(self):
+        if self._writing:
+            self._file.close()
+            self._writing = False
+
+    def discard(self):
+        if self._file is not None:
+            self._file.close()
+        if self.path and os.path.exists(self.path):
+            os.remove(self.path)
+
+
+async def stream_to_disk(request, field_name="video", max_bytes=MAX_UPLOAD_BYTES, on_progress=None, hasher=None,
+                         progress_interval=UPLOAD_PROGRESS_SECONDS):
+    """
+    Parse a multipart upload while it is received and write its file field straight to a temp file.
+
+    Unlike UploadFile (which Starlette only hands over once the whole body is spooled), the
+    body is read from request.stream() so nothing is held in memory or written twice, and an
+    upload is cut off as soon as it passes max_bytes. on_progress(received_bytes) is awaited
+    at most every progress_interval seconds while data arrives and once at the end.
+    hasher (e.g. hashlib.sha256()) is fed the file so the content hash is ready without
+    reading it again.
+    Returns (filename, local_path, received_bytes), the caller removes local_path.
+    """
+    from python_multipart.exceptions import FormParserError
+    from python_multipart.multipart import MultipartParser, parse_options_header
+
+    content_type, params = parse_options_header(request.headers.get("content-type", ""))
+    if content_type != b"multipart/form-data" or not params.get(b"boundary"):
+        raise BadUpload("Expected a multipart/form-data upload.")
+
+    writer = _FilePartWriter(field_name, max_bytes, hasher)
+    parser = MultipartParser(params[b"boundary"], writer.callbacks())
+    body_bytes = 0
+    last_progress = time.monotonic()
+    try:
+        async for chunk in request.stream():
+            # chunked uploads have no Content-Length, count the raw body too
+            body_bytes += len(chunk)
+            if body_bytes > max_bytes + MULTIPART_OVERHEAD_BYTES:
+                raise UploadTooLarge(f"Upload is larger than the {max_bytes} byte limit.")
+            parser.write(chunk)
+            # network chunks are small, storing progress for each would be a backend write every few KB
+            if on_progress and writer.received and time.monotonic() - last_progress >= progress_interval:
+                last_progress = time.monotonic()
+                await on_progress(writer.received)
+        parser.finalize()
+        if on_progress and writer.received:
+            await on_progress(writer.received)
+    except FormParserError as e:
+        writer.discard()
+        raise BadUpload(f"Malformed multipart upload: {e}")
+    except BaseException:
+        # don't leave half written videos behind
+        writer.discard()
+        raise
+
+    if writer.path is None:
+        raise BadUpload(f"The upload has no '{field_name}' file.")
+    if writer._writing:
+        writer.discard()
+        raise BadUpload("The upload ended in the middle of the file.")
+    return writer.filename, writer.path, writer.received
+
+
+def temp_upload_path(filename):
+    """local path for a streamed upload, keeping the original extension."""
+    _, ext = os.path.splitext(filename or "")
+    fd, path = tempfile.mkstemp(prefix="upload_", suffix=ext or ".mp4")
+    os.close(fd)
+    return path
+
+
+def extract_frame_bundle(video_path):
+    """
+    Write the frames the detector would sample from video_path to a frame bundle in a temp
+    file of its own (see emotion_detection.bundle), meant to be run off the event loop.
+    Returns the bundle path, or None if OpenCV is missing or the video can't be decoded,
+    the video itself is uploaded then.
+    """
+    try:
+        # imported here, OpenCV is heavy and only needed with UPLOAD_FRAME_EXTRACTION
+        from emotion_detection.bundle import BUNDLE_EXTENSION, write_bundle
+    except ImportError as e:
+        logger.warning(f"Frame extraction needs OpenCV and numpy, uploading the video instead: {e}")
+        return None
+
+    # never derived from video_path, an uploaded .npz would otherwise be overwritten (and removed) by its bundle
+    fd, bundle_path = tempfile.mkstemp(prefix="bundle_", suffix=BUNDLE_EXTENSION)
+    os.close(fd)
+    try:
+        frames = write_bundle(video_path, bundle_path)
+    except Exception as e:
+        logger.warning(f"Frame extraction failed, uploading the video instead: {e}")
+        frames = 0
+    if not frames:
+        if os.path.exists(bundle_path):
+            os.remove(bundle_path)
+        return None
+    return bundle_path
+
+
+def upload_to_drive(drive, local_path, folder_id, title):
+    """
+    Blocking Google Drive upload, meant to be run off the event loop.
+    drive only needs CreateFile(), so a local fake can stand in for GoogleDrive.
+    """
+    gfile = drive.CreateFile({"title": title, "parents": [{"id": folder_id}]})
+    gfile.SetContentFile(local_path)
+    gfile.Upload()
+    return gfile.get("id")
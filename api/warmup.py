@@ -0,0 +1,95 @@
+"""
+Background warm-up of the lazily created clients, and the readiness state behind /ready.
+
+Nothing here runs at import time. main.py starts warm-up from the FastAPI lifespan,
+so the server accepts requests straight away while Spotify, Drive and the catalog
+get ready in a background thread.
+"""
+import logging
+import os
+import threading
+import time
+
+# setting up the logger
+logger = logging.getLogger(__name__)
+
+# components that have to be warmed up before /ready reports ready
+READY_REQUIRES = [name.strip() for name in os.getenv("READY_REQUIRES", "spotify").split(",") if name.strip()]
+
+# failed components are retried after this many seconds (0 = no retries)
+WARMUP_RETRY_SECONDS = float(os.getenv("WARMUP_RETRY_SECONDS", "30"))
+
+
+def _warm_spotify():
+    from recommendation.spotify_auth import get_app_client
+
+    # creates the shared client and fetches the app token once
+    get_app_client().auth_manager.get_access_token()
+
+
+def _warm_drive():
+    from api.uploads import get_drive
+
+    get_drive()
+
+
+def _warm_catalog():
+    from recommendation.catalog import get_catalog
+
+    get_catalog()
+
+
+WARMUP_TASKS = {
+    "spotify": _warm_spotify,
+    "drive": _warm_drive,
+    "catalog": _warm_catalog,
+}
+
+_status = {name: "pending" for name in WARMUP_TASKS}
+_status_lock = threading.Lock()
+_thread = None
+
+
+def _set_status(name, status):
+    with _status_lock:
+        _status[name] = status
+
+
+def warm_up(tasks=WARMUP_TASKS, retry_seconds=WARMUP_RETRY_SECONDS):
+    """run every warm-up task, retrying the failed ones until they all succeed."""
+    pending = list(tasks)
+    while pending:
+        failed = []
+        for name in pending:
+            started = time.perf_counter()
+            try:
+                tasks[name]()
+            except Exception as e:
+                logger.warning(f"warm-up of {name} failed: {str(e)}")
+                _set_status(name, f"failed: {str(e)}")
+                failed.append(name)
+                continue
+            _set_status(name, "ready")
+            logger.info(f"warm-up of {name} took {time.perf_counter() - started:.2f}s")
+
+        if not failed or retry_seconds <= 0:
+            return
+        pending = failed
+        time.sleep(retry_seconds)
+
+
+def start_warmup():
+    """start warm-up in a daemon thread (once per process)."""
+    global _thread
+    if _thread is None:
+        _thread = threading.Thread(target=warm_up, name="warmup", daemon=True)
+        _thread.start()
+    return _thread
+
+
+def readiness(required=None):
+    """(ready, {component: status}), ready once every required component is warmed up."""
+    with _status_lock:
+        components = dict(_status)
+    required = READY_REQUIRES if required is None else required
+    return all(components.get(name) == "ready" for name in required), components
@@ -0,0 +1,106 @@
+"""
+Stored benchmark baselines and regression checks.
+
+Results are flat dicts {case: {metric: value}} saved as JSON under benchmarks/baselines/.
+Metrics named *_ms or *seconds are better when lower, rps / fps when higher.
+"""
+import json
+import os
+import platform
+import time
+
+BASELINE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baselines")
+
+# allowed slowdown before a metric counts as a regression (0.2 = 20%)
+DEFAULT_TOLERANCE = float(os.getenv("BENCHMARK_TOLERANCE", "0.2"))
+
+HIGHER_IS_BETTER = ("rps", "fps")
+
+
+def baseline_path(name):
+    return os.path.join(BASELINE_DIR, f"{name}.json")
+
+
+def machine_info():
+    """where the numbers were measured, baselines only compare well on similar machines."""
+    return {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+        "measured_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+    }
+
+
+def save_baseline(name, results, settings=None):
+    os.makedirs(BASELINE_DIR, exist_ok=True)
+    data = {"machine": machine_info(), "settings": settings or {}, "results": results}
+    with open(baseline_path(name), "w") as file:
+        json.dump(data, file, indent=2, sort_keys=True)
+        file.write("\n")
+    return baseline_path(name)
+
+
+def load_baseline(name):
+    path = baseline_path(name)
+    if not os.path.exists(path):
+        return None
+    with open(path) as file:
+        return json.load(file)
+
+
+def _regressed(metric, current, baseline, tolerance):
+    if not baseline:
+        return False
+    if metric in HIGHER_IS_BETTER:
+        return current < baseline * (1 - tolerance)
+    if metric.endswith("_ms") or metric.endswith("seconds"):
+        return current > baseline * (1 + tolerance)
+    return False
+
+
+def compare(name, results, tolerance=DEFAULT_TOLERANCE):
+    """
+    Compare results with the stored baseline.
+    Returns (report lines, list of regressions), or (None, []) if there is no baseline yet.
+    """
+    baseline = load_baseline(name)
+    if baseline is None:
+        return None, []
+
+    lines, regressions = [], []
+    for case, metrics in sorted(results.items()):
+        old_metrics = baseline["results"].get(case)
+        if not old_metrics:
+            lines.append(f"{case}: new case, no baseline")
+            continue
+        for metric, value in sorted(metrics.items()):
+            old = old_metrics.get(metric)
+            if not isinstance(value, (int, float)) or not isinstance(old, (int, float)):
+                continue
+            change = (value - old) / old * 100 if old else 0.0
+            flag = ""
+            if _regressed(metric, value, old, tolerance):
+                flag = "  <-- regression"
+                regressions.append((case, metric, old, value))
+            lines.append(f"{case} {metric}: {old:g} -> {value:g} ({change:+.1f}%){flag}")
+    return lines, regressions
+
+
+def report(name, results, settings=None, save=False, check=False, tolerance=DEFAULT_TOLERANCE):
+    """print the comparison, optionally store the results as the new baseline. returns an exit code."""
+    exit_code = 0
+    if check:
+        lines, regressions = compare(name, results, tolerance)
+        if lines is None:
+            print(f"no baseline stored for '{name}' yet, run with --save-baseline first")
+        else:
+            print(f"\ncompared with baseline '{name}' (tolerance {tolerance:.0%}):")
+            for line in lines:
+                print(f"  {line}")
+            if regressions:
+                print(f"{len(regressions)} metric(s) regressed")
+                exit_code = 1
+
+    if save:
+        print(f"saved baseline to {save_baseline(name, results, settings)}")
+    return exit_code
@@ -0,0 +1,59 @@
+"""
+Stand-in for pydrive2's GoogleDrive, so /upload_video can be benchmarked without
+a service account. Only the calls upload_to_drive makes are implemented.
+"""
+import os
+import shutil
+import threading
+import time
+import uuid
+
+
+class FakeDriveFile:
+    def __init__(self, drive, metadata):
+        self.drive = drive
+        self.metadata = dict(metadata)
+        self.content_path = None
+
+    def __getitem__(self, key):
+        return self.metadata[key]
+
+    def get(self, key, default=None):
+        return self.metadata.get(key, default)
+
+    def SetContentFile(self, path):
+        self.content_path = path
+
+    def Upload(self):
+        size = os.path.getsize(self.content_path) if self.content_path else 0
+        self.drive._upload(self, size)
+
+
+class FakeGoogleDrive:
+    """
+    Records uploads instead of sending them to Drive.
+
+    - latency: seconds added to every upload (request overhead)
+    - bandwidth: bytes per second, 0 = unlimited
+    - folder: copy uploaded files there, e.g. the folder a local detection worker watches
+    """
+
+    def __init__(self, latency=0.0, bandwidth=0, folder=None):
+        self.latency = latency
+        self.bandwidth = bandwidth
+        self.folder = folder
+        self.uploads = []  # (title, size)
+        self._lock = threading.Lock()
+
+    def CreateFile(self, metadata=None):
+        return FakeDriveFile(self, metadata or {})
+
+    def _upload(self, gfile, size):
+        delay = self.latency + (size / self.bandwidth if self.bandwidth else 0.0)
+        if delay:
+            time.sleep(delay)
+        if self.folder and gfile.content_path:
+            shutil.copyfile(gfile.content_path, os.path.join(self.folder, gfile.metadata.get("title", "upload")))
+        with self._lock:
+            self.uploads.append((gfile.metadata.get("title"), size))
+        gfile.metadata["id"] = uuid.uuid4().hex
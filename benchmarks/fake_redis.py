@@ -0,0 +1,153 @@
+"""
+Local stand-in for Redis, covering the commands state.backends.RedisBackend uses.
+
+FakeRedis works in process. To share one between worker processes, serve it with
+multiprocessing's manager (no Redis server needed):
+
+    python -m benchmarks.fake_redis --port 8902            # then BENCH_FAKE_REDIS=127.0.0.1:8902
+"""
+import argparse
+import re
+import threading
+import time
+from multiprocessing.managers import BaseManager
+
+from state.backends import HASH_CAS_SCRIPT, HASH_DEL_SCRIPT
+
+AUTHKEY = b"emotionalrec-bench"
+
+
+class FakeRedis:
+    """thread safe dict based Redis subset with decode_responses=True semantics (str in, str out)."""
+
+    def __init__(self):
+        self._data = {}  # key -> value (str or dict)
+        self._expires = {}  # key -> time.time() deadline
+        self._lock = threading.Lock()
+
+    def _alive(self, key):
+        deadline = self._expires.get(key)
+        if deadline is not None and deadline <= time.time():
+            self._data.pop(key, None)
+            self._expires.pop(key, None)
+        return key in self._data
+
+    def ping(self):
+        return True
+
+    def get(self, name):
+        with self._lock:
+            return self._data[name] if self._alive(name) else None
+
+    def set(self, name, value, px=None):
+        with self._lock:
+            self._data[name] = str(value)
+            if px:
+                self._expires[name] = time.time() + px / 1000
+            else:
+                self._expires.pop(name, None)
+            return True
+
+    def delete(self, *names):
+        with self._lock:
+            removed = 0
+            for name in names:
+                if self._alive(name):
+                    removed += 1
+                self._data.pop(name, None)
+                self._expires.pop(name, None)
+            return removed
+
+    def scan_iter(self, match="*", count=None):
+        """only trailing-* patterns (what RedisBackend.delete_prefix sends), escapes are undone."""
+        prefix = re.sub(r"\\(.)", r"\1", match[:-1]) if match.endswith("*") else None
+        with self._lock:
+            names = [name for name in list(self._data) if self._alive(name)]
+        # a list, not a generator, so it can be sent back through the manager
+        return [name for name in names if (name.startswith(prefix) if prefix is not None else name == match)]
+
+    def pexpire(self, name, ms):
+        with self._lock:
+            if not self._alive(name):
+                return False
+            self._expires[name] = time.time() + ms / 1000
+            return True
+
+    def hset(self, name, key=None, value=None, mapping=None):
+        with self._lock:
+            if not self._alive(name):
+                self._data[name] = {}
+            fields = dict(mapping or {})
+            if key is not None:
+                fields[key] = value
+            self._data[name].update((field, str(val)) for field, val in fields.items())
+            return len(fields)
+
+    def hgetall(self, name):
+        with self._lock:
+            return dict(self._data[name]) if self._alive(name) else {}
+
+    def eval(self, script, numkeys, *keys_and_args):
+        """no Lua here: only the scripts RedisBackend sends are understood."""
+        if script == HASH_DEL_SCRIPT:
+            name, *fields = keys_and_args
+            with self._lock:
+                if self._alive(name):
+                    for field in fields:
+                        self._data[name].pop(field, None)
+                    if not self._data[name]:
+                        # like Redis, a hash without fields is gone
+                        self._data.pop(name)
+                        self._expires.pop(name, None)
+                    else:
+                        self._data[name]["_rev"] = str(int(self._data[name].get("_rev") or 0) + 1)
+            return 1
+        if script != HASH_CAS_SCRIPT:
+            raise NotImplementedError("FakeRedis only runs the state.backends scripts")
+        name, revision, ttl_ms, *pairs = keys_and_args
+        with self._lock:
+            if not self._alive(name):
+                return -1
+            current = self._data[name].get("_rev", "")
+            if current != revision:
+                return 0
+            self._data[name]["_rev"] = str(int(current or 0) + 1)
+            self._data[name].update((str(pairs[i]), str(pairs[i + 1])) for i in range(0, len(pairs), 2))
+            if ttl_ms != "":
+                self._expires[name] = time.time() + int(ttl_ms) / 1000
+            return 1
+
+
+class FakeRedisManager(BaseManager):
+    pass
+
+
+_shared = FakeRedis()
+FakeRedisManager.register("redis", callable=lambda: _shared)
+
+
+def connect(address):
+    """proxy to a FakeRedis served by `python -m benchmarks.fake_redis`, address is 'host:port'."""
+    host, port = address.rsplit(":", 1)
+    manager = FakeRedisManager(address=(host, int(port)), authkey=AUTHKEY)
+    manager.connect()
+    return manager.redis()
+
+
+def serve(host="127.0.0.1", port=8902):
+    manager = FakeRedisManager(address=(host, port), authkey=AUTHKEY)
+    manager.get_server().serve_forever()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve an in memory Redis stand-in to other processes.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8902)
+    args = parser.parse_args()
+
+    print(f"fake Redis on {args.host}:{args.port}")
+    serve(args.host, args.port)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,300 @@
+"""
+Local stand-in for the Spotify Web API, for benchmarks and load tests.
+
+Serves the endpoints the recommender uses (token, search, artist top tracks, me,
+top artists / tracks, playlists) with deterministic fake data, an artificial
+latency and optional 429 responses.
+
+    python -m benchmarks.fake_spotify --port 8901 --latency-ms 80 --rate-limit-every 50
+
+then point the backend at it:
+
+    SPOTIFY_API_URL=http://127.0.0.1:8901/v1/ SPOTIFY_TOKEN_URL=http://127.0.0.1:8901/api/token
+"""
+import argparse
+import hashlib
+import json
+import random
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+# genres handed out to the fake user's top artists
+USER_GENRES = ["pop", "indie", "rock", "hip-hop", "jazz", "chill", "metal", "acoustic", "edm", "r-n-b"]
+
+USER_ID = "bench-user"
+
+
+def fake_id(*parts):
+    """stable 22 character base62 like id for the given parts."""
+    digest = hashlib.sha1(":".join(str(p) for p in parts).encode()).hexdigest()
+    return digest[:22]
+
+
+def fake_artist(key):
+    artist_id = fake_id("artist", key)
+    return {"id": artist_id, "name": f"Artist {artist_id[:6]}", "type": "artist",
+            "uri": f"spotify:artist:{artist_id}"}
+
+
+def fake_track(key, artist_key=None):
+    track_id = fake_id("track", key)
+    artist = fake_artist(artist_key if artist_key is not None else key)
+    return {
+        "id": track_id,
+        "name": f"Track {track_id[:6]}",
+        "type": "track",
+        "uri": f"spotify:track:{track_id}",
+        "artists": [artist],
+        "external_urls": {"spotify": f"https://open.spotify.com/track/{track_id}"},
+        "album": {"id": fake_id("album", key), "name": "Fake Album", "images": []},
+        "popularity": 50,
+    }
+
+
+def fake_playlist(playlist_id, name):
+    return {
+        "id": playlist_id,
+        "name": name,
+        "type": "playlist",
+        "uri": f"spotify:playlist:{playlist_id}",
+        "external_urls": {"spotify": f"https://open.spotify.com/playlist/{playlist_id}"},
+        "owner": {"id": USER_ID},
+    }
+
+
+class FakeSpotifyState:
+    """playlists created during a run plus request counters."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.playlists = {}  # id -> {"playlist": ..., "uris": [...]}
+        self.requests = 0
+        self.rate_limited = 0
+        self.by_endpoint = {}
+
+    def count(self, endpoint):
+        with self.lock:
+            self.requests += 1
+            self.by_endpoint[endpoint] = self.by_endpoint.get(endpoint, 0) + 1
+            return self.requests
+
+
+class FakeSpotifyHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # keep-alive, like the real API
+
+    # set by FakeSpotifyServer
+    state = None
+    latency_ms = 0.0
+    jitter_ms = 0.0
+    rate_limit_every = 0
+    retry_after = 1
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        self._handle("GET")
+
+    def do_POST(self):
+        self._handle("POST")
+
+    def do_DELETE(self):
+        self._handle("DELETE")
+
+    def do_PUT(self):
+        self._handle("PUT")
+
+    def _handle(self, method):
+        url = urlparse(self.path)
+        query = {key: values[0] for key, values in parse_qs(url.query).items()}
+        length = int(self.headers.get("Content-Length") or 0)
+        raw = self.rfile.read(length) if length else b""
+
+        endpoint = f"{method} {re.sub(r'/[0-9a-zA-Z]{16,}', '/{id}', url.path)}"
+        count = self.state.count(endpoint)
+
+        if self.latency_ms or self.jitter_ms:
+            time.sleep(max(0.0, self.latency_ms + random.uniform(-self.jitter_ms, self.jitter_ms)) / 1000)
+
+        if self.rate_limit_every and count % self.rate_limit_every == 0:
+            with self.state.lock:
+                self.state.rate_limited += 1
+            return self._send(429, {"error": {"status": 429, "message": "API rate limit exceeded"}},
+                              {"Retry-After": str(self.retry_after)})
+
+        try:
+            body = json.loads(raw) if raw else None
+        except ValueError:
+            body = parse_qs(raw.decode())
+        status, payload = self._route(method, url.path, query, body)
+        self._send(status, payload)
+
+    def _send(self, status, payload, headers=None):
+        data = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _route(self, method, path, query, body):
+        if path == "/api/token" and method == "POST":
+            return 200, {"access_token": "fake-app-token", "token_type": "Bearer", "expires_in": 3600}
+
+        if not path.startswith("/v1/"):
+            return 404, {"error": {"status": 404, "message": "Not found"}}
+        parts = path[len("/v1/"):].strip("/").split("/")
+        limit = int(query.get("limit", 20))
+        offset = int(query.get("offset", 0))
+
+        if parts == ["search"]:
+            q = query.get("q", "")
+            if query.get("type") == "playlist":
+                items = [fake_playlist(fake_id("playlist", q, i), f"{q} vibes {i}") for i in range(limit)]
+                return 200, {"playlists": {"items": items, "total": 100}}
+            items = [fake_track(f"{q}:{offset + i}", f"{q}:{(offset + i) % 7}") for i in range(limit)]
+            return 200, {"tracks": {"items": items, "total": 1000}}
+
+        if len(parts) == 3 and parts[0] == "artists" and parts[2] == "top-tracks":
+            return 200, {"tracks": [fake_track(f"{parts[1]}:top:{i}", parts[1]) for i in range(10)]}
+
+        if len(parts) == 2 and parts[0] == "tracks":
+            return 200, fake_track(parts[1])
+
+        if parts == ["me"]:
+            return 200, {"id": USER_ID, "display_name": "Bench User"}
+
+        if parts == ["me", "top", "artists"]:
+            items = []
+            for i in range(limit):
+                artist = fake_artist(f"top:{i}")
+                artist["genres"] = [USER_GENRES[i % len(USER_GENRES)], USER_GENRES[(i * 3) % len(USER_GENRES)]]
+                items.append(artist)
+            return 200, {"items": items, "total": limit}
+
+        if parts == ["me", "top", "tracks"]:
+            return 200, {"items": [fake_track(f"usertop:{i}") for i in range(limit)], "total": limit}
+
+        if parts == ["me", "playlists"]:
+            with self.state.lock:
+                playlists = [entry["playlist"] for entry in self.state.playlists.values()]
+            page = playlists[offset:offset + limit]
+            has_next = offset + limit < len(playlists)
+            return 200, {"items": page, "total": len(playlists), "next": "more" if has_next else None}
+
+        if len(parts) == 3 and parts[0] == "users" and parts[2] == "playlists" and method == "POST":
+            name = (body or {}).get("name", "playlist")
+            playlist = fake_playlist(fake_id("created", name, time.time(), random.random()), name)
+            with self.state.lock:
+                self.state.playlists[playlist["id"]] = {"playlist": playlist, "uris": []}
+            return 201, playlist
+
+        if len(parts) == 3 and parts[0] == "playlists" and parts[2] in ("items", "tracks"):
+            with self.state.lock:
+                entry = self.state.playlists.get(parts[1])
+                if entry is None:
+                    return 404, {"error": {"status": 404, "message": "Not found"}}
+                if method == "GET":
+                    uris = entry["uris"][offset:offset + limit]
+                    has_next = offset + limit < len(entry["uris"])
+                    return 200, {"items": [{"track": {"uri": uri}} for uri in uris],
+                                 "next": "more" if has_next else None}
+                if method == "POST":
+                    uris = body.get("uris", []) if isinstance(body, dict) else body or []
+                    entry["uris"].extend(uris)
+                    return 201, {"snapshot_id": fake_id("snapshot", len(entry["uris"]))}
+                if method == "DELETE":
+                    items = (body or {}).get("items") or (body or {}).get("tracks") or []
+                    remove = {item["uri"] for item in items}
+                    entry["uris"] = [uri for uri in entry["uris"] if uri not in remove]
+                    return 200, {"snapshot_id": fake_id("snapshot", len(entry["uris"]))}
+
+        return 404, {"error": {"status": 404, "message": "Not found"}}
+
+
+class FakeSpotifyServer:
+    """
+    Runs the fake API on a background thread.
+
+        with FakeSpotifyServer(latency_ms=50) as fake:
+            os.environ["SPOTIFY_API_URL"] = fake.api_url
+    """
+
+    def __init__(self, host="127.0.0.1", port=0, latency_ms=0.0, jitter_ms=0.0, rate_limit_every=0, retry_after=1):
+        self.state = FakeSpotifyState()
+        handler = type("Handler", (FakeSpotifyHandler,), {
+            "state": self.state,
+            "latency_ms": latency_ms,
+            "jitter_ms": jitter_ms,
+            "rate_limit_every": rate_limit_every,
+            "retry_after": retry_after,
+        })
+        self.httpd = ThreadingHTTPServer((host, port), handler)
+        self.httpd.daemon_threads = True
+        self._thread = None
+
+    @property
+    def base_url(self):
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    @property
+    def api_url(self):
+        return f"{self.base_url}/v1/"
+
+    @property
+    def token_url(self):
+        return f"{self.base_url}/api/token"
+
+    def start(self):
+        self._thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def stats(self):
+        with self.state.lock:
+            return {
+                "requests": self.state.requests,
+                "rate_limited": self.state.rate_limited,
+                "by_endpoint": dict(self.state.by_endpoint),
+            }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run a local fake Spotify Web API.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8901)
+    parser.add_argument("--latency-ms", type=float, default=0.0, help="added to every response")
+    parser.add_argument("--jitter-ms", type=float, default=0.0, help="random +/- spread around the latency")
+    parser.add_argument("--rate-limit-every", type=int, default=0, help="answer every Nth request with a 429")
+    parser.add_argument("--retry-after", type=int, default=1, help="Retry-After seconds sent with a 429")
+    args = parser.parse_args()
+
+    server = FakeSpotifyServer(args.host, args.port, args.latency_ms, args.jitter_ms,
+                               args.rate_limit_every, args.retry_after)
+    print(f"fake Spotify API on {server.api_url} (token url {server.token_url})")
+    try:
+        server.httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.httpd.server_close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,118 @@
+"""
+Frame throughput micro-benchmark for the detection loop.
+
+Renders a synthetic video (a moving "face" on a noisy background) and runs
+emotion_detection.detector.process_video on it with the stub classifier, so only
+decoding, sampling, downscaling, face tracking and batching are measured.
+
+    python -m benchmarks.frames
+    python -m benchmarks.frames --seconds 20 --width 1920 --height 1080
+    python -m benchmarks.frames --video clip.mp4 --compare
+"""
+import argparse
+import os
+import sys
+import tempfile
+
+from .baseline import DEFAULT_TOLERANCE, report
+
+# loop configurations compared, from the old per-frame loop to the default pipeline
+# (bundle=True reads the frame bundle the backend writes with UPLOAD_FRAME_EXTRACTION)
+CONFIGS = {
+    "old_loop": dict(batch_size=1, max_side=0, skip_decode=False, early_exit="off", detect_every=1),
+    "sampled": dict(early_exit="off", detect_every=1),
+    "sampled_tracked": dict(early_exit="off"),
+    "default": dict(),
+    "bundle": dict(bundle=True),
+}
+
+
+def render_video(path, seconds, fps, width, height):
+    import cv2
+    import numpy as np
+
+    writer = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*"mp4v"), fps, (width, height))
+    if not writer.isOpened():
+        raise RuntimeError("OpenCV could not open a video writer (mp4v)")
+    rng = np.random.default_rng(0)
+    background = rng.integers(0, 80, (height, width, 3), dtype=np.uint8)
+    face = min(width, height) // 3
+    try:
+        for i in range(int(seconds * fps)):
+            frame = background.copy()
+            x = int((width - face) * (0.5 + 0.4 * np.sin(i / fps)))
+            y = (height - face) // 2
+            cv2.ellipse(frame, (x + face // 2, y + face // 2), (face // 2, face // 2 + face // 6), 0, 0, 360,
+                        (150, 180, 220), -1)
+            writer.write(frame)
+    finally:
+        writer.release()
+
+
+def main():
+    try:
+        import cv2  # noqa: F401
+    except ImportError:
+        sys.exit("benchmarks.frames needs OpenCV: pip install -r emotion_detection/requirements.txt")
+
+    from emotion_detection.bundle import write_bundle
+    from emotion_detection.detector import process_video
+    from emotion_detection.models import StubClassifier
+
+    parser = argparse.ArgumentParser(description="Measure frames per second of the detection loop with a stub model.")
+    parser.add_argument("--video", help="use this video instead of a synthetic one")
+    parser.add_argument("--seconds", type=float, default=10.0)
+    parser.add_argument("--fps", type=int, default=30)
+    parser.add_argument("--width", type=int, default=1280)
+    parser.add_argument("--height", type=int, default=720)
+    parser.add_argument("--repeat", type=int, default=3, help="runs per config, the fastest one counts")
+    parser.add_argument("--configs", default=",".join(CONFIGS))
+    parser.add_argument("--save-baseline", action="store_true")
+    parser.add_argument("--compare", action="store_true")
+    parser.add_argument("--tolerance", type=float, default=DEFAULT_TOLERANCE)
+    parser.add_argument("--baseline-name", default="frames")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        video = args.video
+        if not video:
+            video = os.path.join(tmp, "synthetic.mp4")
+            render_video(video, args.seconds, args.fps, args.width, args.height)
+
+        bundle = None
+        if any(CONFIGS[name].get("bundle") for name in args.configs.split(",")):
+            bundle = os.path.join(tmp, "frames.npz")
+            frames = write_bundle(video, bundle)
+            print(f"frame bundle: {frames} frames, {os.path.getsize(bundle)} bytes "
+                  f"({os.path.getsize(bundle) / os.path.getsize(video):.1%} of the video)")
+
+        classifier = StubClassifier()
+        results = {}
+        print(f"{'config':<18}{'fps':>10}{'seconds':>10}{'classified':>12}{'detections':>12}"
+              f"{'decode s':>10}{'detect s':>10}{'classify s':>12}")
+        for name in args.configs.split(","):
+            options = dict(CONFIGS[name])
+            source = bundle if options.pop("bundle", False) else video
+            runs = [process_video(source, classifier, **options) for _ in range(args.repeat)]
+            best = min(runs, key=lambda run: run["seconds"])
+            timings = best["timings"]
+            results[name] = {
+                "fps": best["fps"],
+                "seconds": best["seconds"],
+                "frames_used": best["frames_used"],
+                "decode_seconds": timings["decode"],
+                "detect_seconds": timings["detect"],
+                "classify_seconds": timings["classify"],
+            }
+            print(f"{name:<18}{best['fps']:>10.1f}{best['seconds']:>10.3f}{best['frames_used']:>12}"
+                  f"{best['detections']:>12}{timings['decode']:>10.3f}{timings['detect']:>10.3f}"
+                  f"{timings['classify']:>12.3f}")
+
+    settings = {"video": args.video or f"synthetic {args.width}x{args.height} {args.fps}fps {args.seconds}s",
+                "repeat": args.repeat}
+    sys.exit(report(args.baseline_name, results, settings, save=args.save_baseline,
+                    check=args.compare, tolerance=args.tolerance))
+
+
+if __name__ == "__main__":
+    main()
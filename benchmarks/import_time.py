@@ -0,0 +1,88 @@
+"""
+Import-time budget for the backend.
+
+Imports `main` in a fresh interpreter with `python -X importtime`, without Spotify
+credentials and with an unreachable Drive settings file, so the import has to
+succeed without env or network. Fails when it takes longer than the budget.
+
+    python -m benchmarks.import_time                   # budget from IMPORT_TIME_BUDGET_MS
+    python -m benchmarks.import_time --budget-ms 800 --top 15
+"""
+import argparse
+import os
+import re
+import subprocess
+import sys
+
+from .baseline import DEFAULT_TOLERANCE, report
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# longest acceptable `import main` (milliseconds, cumulative)
+IMPORT_TIME_BUDGET_MS = float(os.getenv("IMPORT_TIME_BUDGET_MS", "1000"))
+
+# lines look like "import time:       412 |       1320 |   api.routes"
+IMPORTTIME_LINE = re.compile(r"import time:\s+(\d+)\s+\|\s+(\d+)\s+\|(\s*)(\S+)")
+
+
+def measure(module="main"):
+    """
+    Import module in a fresh interpreter.
+    Returns (cumulative ms of module, [(self ms, package)]) or raises if the import fails.
+    """
+    env = {key: value for key, value in os.environ.items()
+           if key not in ("SPOTIFY_CLIENT_ID", "SPOTIFY_CLIENT_SECRET", "REDIRECT_URI")}
+    env["DRIVE_SETTINGS_FILE"] = os.path.join(REPO_ROOT, "does-not-exist.yaml")
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=REPO_ROOT, env=env, capture_output=True, text=True,
+    )
+    if result.returncode != 0:
+        raise RuntimeError(f"import {module} failed:\n{result.stderr[-2000:]}")
+
+    total_ms = None
+    per_package = {}
+    for line in result.stderr.splitlines():
+        match = IMPORTTIME_LINE.match(line)
+        if not match:
+            continue
+        self_us, cumulative_us, _, name = match.groups()
+        package = name.split(".")[0]
+        per_package[package] = per_package.get(package, 0.0) + int(self_us) / 1000
+        if name == module:
+            total_ms = int(cumulative_us) / 1000
+    slowest = sorted(((ms, package) for package, ms in per_package.items()), reverse=True)
+    return total_ms, slowest
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Check how long importing the backend takes.")
+    parser.add_argument("--module", default="main")
+    parser.add_argument("--budget-ms", type=float, default=IMPORT_TIME_BUDGET_MS)
+    parser.add_argument("--repeat", type=int, default=3, help="imports measured, the fastest one counts")
+    parser.add_argument("--top", type=int, default=10, help="show the slowest top level packages")
+    parser.add_argument("--save-baseline", action="store_true")
+    parser.add_argument("--compare", action="store_true")
+    parser.add_argument("--tolerance", type=float, default=DEFAULT_TOLERANCE)
+    parser.add_argument("--baseline-name", default="import_time")
+    args = parser.parse_args()
+
+    runs = [measure(args.module) for _ in range(args.repeat)]
+    total_ms, slowest = min(runs, key=lambda run: run[0])
+
+    print(f"import {args.module}: {total_ms:.1f} ms (budget {args.budget_ms:.0f} ms)")
+    print("slowest packages (self time):")
+    for ms, package in slowest[:args.top]:
+        print(f"  {package:<30}{ms:>10.1f} ms")
+
+    exit_code = report(args.baseline_name, {args.module: {"import_ms": total_ms}},
+                       {"repeat": args.repeat}, save=args.save_baseline,
+                       check=args.compare, tolerance=args.tolerance)
+    if total_ms > args.budget_ms:
+        print(f"over budget by {total_ms - args.budget_ms:.1f} ms")
+        exit_code = 1
+    sys.exit(exit_code)
+
+
+if __name__ == "__main__":
+    main()
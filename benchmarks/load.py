@@ -0,0 +1,278 @@
+"""
+Load generator for the backend.
+
+Starts the fake Spotify API, runs the backend (benchmarks.serve) in a subprocess
+against it and fires requests at increasing concurrency, reporting p50 / p95 / p99
+latency and requests per second per scenario.
+
+    python -m benchmarks.load                                   # all scenarios, default levels
+    python -m benchmarks.load --scenarios recommend,upload_video --concurrency 1,8,32
+    python -m benchmarks.load --latency-ms 80 --rate-limit-every 40
+    python -m benchmarks.load --save-baseline                    # store as benchmarks/baselines/load.json
+    python -m benchmarks.load --compare                          # exit 1 on a regression
+    python -m benchmarks.load --workers 4 --state fake-redis --scenarios job_roundtrip
+"""
+import argparse
+import os
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+import requests
+
+from .baseline import DEFAULT_TOLERANCE, report
+from .fake_redis import FakeRedisManager, AUTHKEY
+from .fake_spotify import FakeSpotifyServer
+from .serve import BENCH_ENV
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+EMOTIONS = ["happy", "sad", "angry", "calm"]
+
+
+def _token(i):
+    # a handful of users so profile / playlist caches see repeat visits
+    return f"bench-user-token-{i % 8}"
+
+
+def _breakdown(emotion):
+    return {emotion: 62.5, "neutral": 25.0, "sad" if emotion != "sad" else "happy": 12.5}
+
+
+def recommend(session, base_url, i):
+    return session.post(f"{base_url}/recommend", json={"emotion": random.choice(EMOTIONS)})
+
+
+def recommend_user(session, base_url, i):
+    return session.post(f"{base_url}/recommend", json={"emotion": random.choice(EMOTIONS), "access_token": _token(i)})
+
+
+def recommend_emotion(session, base_url, i):
+    return session.get(f"{base_url}/recommend/{random.choice(EMOTIONS)}")
+
+
+def colab_callback(session, base_url, i):
+    job_id = session.post(f"{base_url}/_bench/job").json()["job_id"]
+    emotion = random.choice(EMOTIONS)
+    return session.post(f"{base_url}/colab_callback",
+                        json={"emotion": emotion, "breakdown": _breakdown(emotion), "job_id": job_id})
+
+
+def job_roundtrip(session, base_url, i):
+    """a client waiting on /process_latest while the worker posts the result, likely to different workers."""
+    job_id = session.post(f"{base_url}/_bench/job").json()["job_id"]
+    waiter = {}
+
+    def wait():
+        waiter["response"] = requests.post(f"{base_url}/process_latest", params={"job_id": job_id})
+
+    thread = threading.Thread(target=wait)
+    thread.start()
+    emotion = random.choice(EMOTIONS)
+    session.post(f"{base_url}/colab_callback",
+                 json={"emotion": emotion, "breakdown": _breakdown(emotion), "job_id": job_id})
+    thread.join()
+    return waiter["response"]
+
+
+def make_upload_video(upload_bytes):
+    payload = os.urandom(upload_bytes)
+
+    def upload_video(session, base_url, i):
+        files = {"video": (f"bench_{i}.mp4", payload, "video/mp4")}
+        return session.post(f"{base_url}/upload_video", files=files)
+
+    return upload_video
+
+
+def percentile(sorted_values, pct):
+    """nearest rank percentile of an already sorted list."""
+    if not sorted_values:
+        return 0.0
+    rank = max(0, min(len(sorted_values) - 1, int(round(pct / 100 * len(sorted_values) + 0.5)) - 1))
+    return sorted_values[rank]
+
+
+def run_level(base_url, request_fn, concurrency, total_requests, timeout):
+    """send total_requests spread over `concurrency` threads, return latency stats."""
+    latencies = []
+    errors = [0]
+    lock = threading.Lock()
+    counter = iter(range(total_requests))
+
+    def worker():
+        session = requests.Session()
+        while True:
+            with lock:
+                i = next(counter, None)
+            if i is None:
+                return
+            start = time.perf_counter()
+            try:
+                response = request_fn(session, base_url, i)
+                ok = response.status_code < 400
+            except requests.RequestException:
+                ok = False
+            elapsed = time.perf_counter() - start
+            with lock:
+                latencies.append(elapsed)
+                if not ok:
+                    errors[0] += 1
+
+    threads = [threading.Thread(target=worker, daemon=True) for _ in range(concurrency)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(timeout)
+    wall = time.perf_counter() - started
+
+    latencies.sort()
+    return {
+        "requests": len(latencies),
+        "errors": errors[0],
+        "p50_ms": round(percentile(latencies, 50) * 1000, 2),
+        "p95_ms": round(percentile(latencies, 95) * 1000, 2),
+        "p99_ms": round(percentile(latencies, 99) * 1000, 2),
+        "rps": round(len(latencies) / wall, 2) if wall else 0.0,
+    }
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def start_fake_redis():
+    """serve a FakeRedis from a thread of this process, returns its 'host:port'."""
+    port = free_port()
+    server = FakeRedisManager(address=("127.0.0.1", port), authkey=AUTHKEY).get_server()
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return f"127.0.0.1:{port}"
+
+
+def start_backend(fake, port, args, tmp):
+    env = dict(os.environ)
+    env.update(BENCH_ENV)
+    env.update({
+        "SPOTIFY_API_URL": fake.api_url,
+        "SPOTIFY_TOKEN_URL": fake.token_url,
+        "CATALOG_PATH": os.path.join(tmp, "catalog.sqlite3"),
+        "CATALOG_REFRESH_SECONDS": "0",
+        # a job posted to a worker the waiter can't see fails fast instead of hanging the run
+        "PROCESS_TIMEOUT_SECONDS": str(args.job_timeout),
+        "STATE_BACKEND": "sqlite" if args.state == "sqlite" else "memory",
+        "STATE_SQLITE_PATH": os.path.join(tmp, "state.sqlite3"),
+    })
+    command = [sys.executable, "-m", "benchmarks.serve", "--port", str(port), "--workers", str(args.workers),
+               "--drive-latency", str(args.drive_latency), "--drive-bandwidth", str(args.drive_bandwidth)]
+    if args.state == "fake-redis":
+        command += ["--fake-redis", start_fake_redis()]
+    process = subprocess.Popen(command, cwd=REPO_ROOT, env=env)
+
+    base_url = f"http://127.0.0.1:{port}"
+    deadline = time.monotonic() + args.startup_timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError("backend exited during startup")
+        try:
+            if requests.get(f"{base_url}/ready", timeout=1).status_code == 200:
+                return process, base_url
+        except requests.RequestException:
+            pass
+        time.sleep(0.2)
+    process.terminate()
+    raise RuntimeError(f"backend did not start within {args.startup_timeout}s")
+
+
+def build_fake_catalog(fake, catalog_path):
+    """build the anonymous track catalog from the fake API, in this process."""
+    os.environ.update(BENCH_ENV)
+    os.environ["SPOTIFY_API_URL"] = fake.api_url
+    os.environ["SPOTIFY_TOKEN_URL"] = fake.token_url
+    from recommendation.catalog import build_catalog, catalog_client
+
+    return build_catalog(catalog_client(), catalog_path, tracks_per_genre=20)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test the backend against a fake Spotify and Drive.")
+    parser.add_argument("--scenarios", default="recommend,recommend_user,recommend_emotion,colab_callback,upload_video",
+                        help="also available: job_roundtrip")
+    parser.add_argument("--concurrency", default="1,4,16,32", help="comma separated concurrency levels")
+    parser.add_argument("--requests", type=int, default=100, help="requests per scenario and level")
+    parser.add_argument("--warmup", type=int, default=5, help="unmeasured requests before each scenario")
+    parser.add_argument("--latency-ms", type=float, default=50.0, help="fake Spotify latency")
+    parser.add_argument("--jitter-ms", type=float, default=10.0)
+    parser.add_argument("--rate-limit-every", type=int, default=0, help="fake Spotify answers every Nth request with 429")
+    parser.add_argument("--retry-after", type=int, default=1)
+    parser.add_argument("--drive-latency", type=float, default=0.1)
+    parser.add_argument("--drive-bandwidth", type=int, default=0)
+    parser.add_argument("--upload-bytes", type=int, default=1024 * 1024)
+    parser.add_argument("--catalog", action="store_true", help="serve anonymous /recommend/{emotion} from a catalog")
+    parser.add_argument("--workers", type=int, default=1, help="backend worker processes")
+    parser.add_argument("--state", choices=("memory", "sqlite", "fake-redis"), default="memory",
+                        help="state backend shared by the workers")
+    parser.add_argument("--job-timeout", type=float, default=10.0, help="PROCESS_TIMEOUT_SECONDS for the backend")
+    parser.add_argument("--port", type=int, default=0, help="backend port, 0 = pick a free one")
+    parser.add_argument("--startup-timeout", type=float, default=60.0)
+    parser.add_argument("--timeout", type=float, default=600.0, help="give up on a level after this many seconds")
+    parser.add_argument("--save-baseline", action="store_true")
+    parser.add_argument("--compare", action="store_true")
+    parser.add_argument("--tolerance", type=float, default=DEFAULT_TOLERANCE)
+    parser.add_argument("--baseline-name", default="load")
+    args = parser.parse_args()
+
+    scenarios = {
+        "recommend": recommend,
+        "recommend_user": recommend_user,
+        "recommend_emotion": recommend_emotion,
+        "colab_callback": colab_callback,
+        "job_roundtrip": job_roundtrip,
+        "upload_video": make_upload_video(args.upload_bytes),
+    }
+    selected = [name.strip() for name in args.scenarios.split(",") if name.strip()]
+    unknown = [name for name in selected if name not in scenarios]
+    if unknown:
+        parser.error(f"unknown scenarios {unknown}, choose from {sorted(scenarios)}")
+    levels = [int(level) for level in args.concurrency.split(",")]
+
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp, FakeSpotifyServer(
+        latency_ms=args.latency_ms, jitter_ms=args.jitter_ms,
+        rate_limit_every=args.rate_limit_every, retry_after=args.retry_after,
+    ) as fake:
+        catalog_path = os.path.join(tmp, "catalog.sqlite3")
+        if args.catalog:
+            print(f"built catalog with {build_fake_catalog(fake, catalog_path)} tracks")
+
+        process, base_url = start_backend(fake, args.port or free_port(), args, tmp)
+        try:
+            print(f"{'scenario':<20}{'conc':>6}{'reqs':>7}{'errors':>8}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'rps':>9}")
+            for name in selected:
+                request_fn = scenarios[name]
+                run_level(base_url, request_fn, 1, args.warmup, args.timeout)
+                for level in levels:
+                    stats = run_level(base_url, request_fn, level, args.requests, args.timeout)
+                    results[f"{name}@{level}"] = stats
+                    print(f"{name:<20}{level:>6}{stats['requests']:>7}{stats['errors']:>8}"
+                          f"{stats['p50_ms']:>10.1f}{stats['p95_ms']:>10.1f}{stats['p99_ms']:>10.1f}{stats['rps']:>9.1f}")
+        finally:
+            process.terminate()
+            process.wait(timeout=10)
+
+        print(f"fake Spotify served {fake.stats()['requests']} requests ({fake.stats()['rate_limited']} rate limited)")
+
+    settings = {key: value for key, value in vars(args).items()
+                if key not in ("save_baseline", "compare", "tolerance", "baseline_name", "port")}
+    sys.exit(report(args.baseline_name, results, settings, save=args.save_baseline,
+                    check=args.compare, tolerance=args.tolerance))
+
+
+if __name__ == "__main__":
+    main()
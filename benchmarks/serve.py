@@ -0,0 +1,83 @@
+"""
+Run the backend for benchmarks: Google Drive is replaced by FakeGoogleDrive and a
+/_bench/job route creates jobs so /colab_callback can be driven without uploads.
+Point it at the fake Spotify API with SPOTIFY_API_URL / SPOTIFY_TOKEN_URL.
+
+    python -m benchmarks.serve --port 8000 --drive-latency 0.2
+    STATE_BACKEND=sqlite python -m benchmarks.serve --workers 4
+    python -m benchmarks.serve --workers 4 --fake-redis 127.0.0.1:8902   # see benchmarks.fake_redis
+"""
+import argparse
+import os
+
+from .fake_drive import FakeGoogleDrive
+
+# credentials only have to exist, the fake API accepts anything
+BENCH_ENV = {
+    "SPOTIFY_CLIENT_ID": "bench-client",
+    "SPOTIFY_CLIENT_SECRET": "bench-secret",
+    "REDIRECT_URI": "http://127.0.0.1:8000/callback",
+}
+
+
+def build_app(drive_latency=0.0, drive_bandwidth=0, drive_folder=None, fake_redis=None):
+    for key, value in BENCH_ENV.items():
+        os.environ.setdefault(key, value)
+
+    import main
+    from api.jobs import job_registry
+    from api.uploads import set_drive
+
+    if fake_redis:
+        from state.backends import RedisBackend, set_state_backend
+        from .fake_redis import connect
+
+        set_state_backend(RedisBackend(client=connect(fake_redis)))
+
+    # installed before startup, so warm-up never logs in to the real Drive
+    set_drive(FakeGoogleDrive(latency=drive_latency, bandwidth=drive_bandwidth, folder=drive_folder))
+
+    @main.app.post("/_bench/job", include_in_schema=False)
+    def create_bench_job():
+        job_id = job_registry.create()
+        job_registry.set_stage(job_id, "processing_started")
+        return {"job_id": job_id}
+
+    return main.app
+
+
+def create_app():
+    """app factory for uvicorn workers, settings come from the BENCH_* variables main() sets."""
+    return build_app(
+        float(os.getenv("BENCH_DRIVE_LATENCY", "0")),
+        int(os.getenv("BENCH_DRIVE_BANDWIDTH", "0")),
+        os.getenv("BENCH_DRIVE_FOLDER") or None,
+        os.getenv("BENCH_FAKE_REDIS") or None,
+    )
+
+
+def main():
+    import uvicorn
+
+    parser = argparse.ArgumentParser(description="Run the backend against fake Spotify / Drive for benchmarks.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--drive-latency", type=float, default=0.0, help="seconds added to every Drive upload")
+    parser.add_argument("--drive-bandwidth", type=int, default=0, help="Drive upload bytes per second, 0 = unlimited")
+    parser.add_argument("--drive-folder", default=None, help="copy 'uploaded' videos into this folder")
+    parser.add_argument("--workers", type=int, default=1, help="uvicorn worker processes")
+    parser.add_argument("--fake-redis", default=None, help="host:port of benchmarks.fake_redis to use as state backend")
+    args = parser.parse_args()
+
+    os.environ.update({
+        "BENCH_DRIVE_LATENCY": str(args.drive_latency),
+        "BENCH_DRIVE_BANDWIDTH": str(args.drive_bandwidth),
+        "BENCH_DRIVE_FOLDER": args.drive_folder or "",
+        "BENCH_FAKE_REDIS": args.fake_redis or "",
+    })
+    uvicorn.run("benchmarks.serve:create_app", factory=True, host=args.host, port=args.port,
+                workers=args.workers, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
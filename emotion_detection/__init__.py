@@ -0,0 +1 @@
+"""Emotion detection for uploaded videos, usable outside of Colab."""
@@ -0,0 +1,88 @@
+import math
+import os
+from collections import Counter, defaultdict
+
+# when to stop decoding: "off" (scan the whole clip), "certain" (the leader can no longer
+# be caught even if every remaining frame votes for the runner up) or "confident"
+# (the leader's margin is statistically safe for the frames that are left)
+EARLY_EXIT = os.getenv("DETECTION_EARLY_EXIT", "confident")
+
+# z score the leader's margin has to beat in "confident" mode
+EARLY_EXIT_Z = float(os.getenv("DETECTION_EARLY_EXIT_Z", "3.0"))
+
+# never stop before this many frames have been classified
+EARLY_EXIT_MIN_FRAMES = int(os.getenv("DETECTION_EARLY_EXIT_MIN_FRAMES", "20"))
+
+
+class EmotionVote:
+    """
+    Streaming tally of per frame emotions.
+    Keeps the dominant emotion and the top 3 breakdown up to date as frames come in.
+    """
+
+    def __init__(self, criterion=EARLY_EXIT, z=EARLY_EXIT_Z, min_frames=EARLY_EXIT_MIN_FRAMES):
+        if criterion not in ("off", "certain", "confident"):
+            raise ValueError(f"Unknown early exit criterion '{criterion}'.")
+        self.criterion = criterion
+        self.z = z
+        self.min_frames = min_frames
+        self.counts = Counter()
+        self.confidence_totals = defaultdict(float)
+
+    @property
+    def frames_used(self):
+        return sum(self.counts.values())
+
+    def add(self, result):
+        dominant_emotion = result["dominant_emotion"]
+        self.counts[dominant_emotion] += 1
+        self.confidence_totals[dominant_emotion] += result["emotion"][dominant_emotion]
+
+    def dominant(self):
+        """most common emotion so far (occurrence based), None before the first frame."""
+        top = self.counts.most_common(1)
+        return top[0][0] if top else None
+
+    def most_confident(self):
+        """emotion with the highest summed confidence (confidence based)."""
+        if not self.confidence_totals:
+            return None
+        return max(self.confidence_totals, key=self.confidence_totals.get)
+
+    def breakdown(self, top=3):
+        """occurrence percentages for the top emotions, same shape the notebook sends."""
+        total = self.frames_used
+        return {
+            emo: round((count / total) * 100, 2)
+            for emo, count in self.counts.most_common(top)
+        }
+
+    def has_converged(self, frames_left=None):
+        """
+        True once the dominant emotion is settled.
+        frames_left is the number of sampled frames still to come, None if unknown.
+        """
+        if self.criterion == "off" or self.frames_used < self.min_frames:
+            return False
+
+        ranked = self.counts.most_common(2)
+        leader = ranked[0][1]
+        runner_up = ranked[1][1] if len(ranked) > 1 else 0
+        lead = leader - runner_up
+
+        if frames_left is not None and lead > frames_left:
+            return True  # can't be caught any more
+        if self.criterion == "certain":
+            return False
+
+        if not frames_left:
+            # length unknown: sign test on the two leading emotions seen so far
+            return lead > self.z * math.sqrt(leader + runner_up)
+
+        # the runner up gains on the leader by (p2 - p1) per frame on average, the lead is
+        # safe if it outlasts that drift plus z standard deviations over the frames left
+        seen = self.frames_used
+        p1, p2 = leader / seen, runner_up / seen
+        drift = frames_left * (p1 - p2)
+        spread = math.sqrt(frames_left * max((p1 + p2) - (p1 - p2) ** 2, 1e-9))
+        return lead + drift > self.z * spread
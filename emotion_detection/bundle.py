@@ -0,0 +1,100 @@
+"""
+Frame bundles: the sampled, downscaled frames of a video stored as JPEGs in one .npz.
+
+The backend can write a bundle at upload time (UPLOAD_FRAME_EXTRACTION) so only the
+frames the detector looks at travel through Drive, process_video reads bundles
+like videos.
+
+    python -m emotion_detection.bundle clip.mp4 clip.npz     # write one by hand and print the size
+"""
+import argparse
+import os
+
+import cv2
+import numpy as np
+
+from .sampling import MAX_FRAME_SIDE, SAMPLE_FPS, sample_frames
+
+# JPEG quality of bundled frames (0-100), the emotion model doesn't need more
+BUNDLE_JPEG_QUALITY = int(os.getenv("BUNDLE_JPEG_QUALITY", "85"))
+
+BUNDLE_EXTENSION = ".npz"
+
+
+def is_frame_bundle(path):
+    return path.lower().endswith(BUNDLE_EXTENSION)
+
+
+def write_bundle(video_path, bundle_path, sample_fps=SAMPLE_FPS, max_side=MAX_FRAME_SIDE, quality=BUNDLE_JPEG_QUALITY):
+    """
+    Sample and downscale the frames of a video (same rules as the detector) and store
+    them as JPEGs in bundle_path. Returns the number of frames, 0 if the video can't be read.
+    """
+    cap = cv2.VideoCapture(video_path)
+    if not cap.isOpened():
+        return 0
+
+    frame_numbers = []
+    jpegs = []
+    try:
+        for frame_number, frame in sample_frames(cap, sample_fps, max_side):
+            ok, encoded = cv2.imencode(".jpg", frame, [cv2.IMWRITE_JPEG_QUALITY, quality])
+            if ok:
+                frame_numbers.append(frame_number)
+                jpegs.append(encoded.reshape(-1))
+    finally:
+        cap.release()
+
+    if not jpegs:
+        return 0
+
+    # one flat byte array plus offsets, so loading doesn't need pickle
+    offsets = np.cumsum([0] + [len(jpeg) for jpeg in jpegs], dtype=np.int64)
+    with open(bundle_path, "wb") as out:
+        np.savez(
+            out,
+            jpeg=np.concatenate(jpegs),
+            offsets=offsets,
+            frame_numbers=np.asarray(frame_numbers, dtype=np.int64),
+        )
+    return len(jpegs)
+
+
+class FrameBundle:
+    """reads a bundle back, iterating yields (frame_number, frame) like sampling.sample_frames."""
+
+    def __init__(self, path):
+        with np.load(path, allow_pickle=False) as data:
+            self._jpeg = data["jpeg"]
+            self._offsets = data["offsets"]
+            self.frame_numbers = data["frame_numbers"]
+
+    @property
+    def frames_total(self):
+        return len(self.frame_numbers)
+
+    def __iter__(self):
+        for i, frame_number in enumerate(self.frame_numbers):
+            jpeg = self._jpeg[self._offsets[i]:self._offsets[i + 1]]
+            frame = cv2.imdecode(jpeg, cv2.IMREAD_COLOR)
+            if frame is not None:
+                yield int(frame_number), frame
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Write the frame bundle of a video.")
+    parser.add_argument("video")
+    parser.add_argument("bundle")
+    parser.add_argument("--max-side", type=int, default=MAX_FRAME_SIDE)
+    parser.add_argument("--quality", type=int, default=BUNDLE_JPEG_QUALITY)
+    args = parser.parse_args()
+
+    frames = write_bundle(args.video, args.bundle, max_side=args.max_side, quality=args.quality)
+    if not frames:
+        raise SystemExit(f"could not read frames from {args.video}")
+    video_bytes, bundle_bytes = os.path.getsize(args.video), os.path.getsize(args.bundle)
+    print(f"{frames} frames, {bundle_bytes} bytes ({bundle_bytes / video_bytes:.1%} of the {video_bytes} byte video)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,191 @@
+import argparse
+import logging
+import os
+import time
+
+import cv2
+
+from .aggregate import EARLY_EXIT, EmotionVote
+from .bundle import FrameBundle, is_frame_bundle
+from .models import crop_face
+from .sampling import MAX_FRAME_SIDE, SAMPLE_FPS, downscale, sample_frames, sampled_frame_total
+from .tracking import DETECT_EVERY, TRACK_FALLBACK, FaceTracker
+
+# setting up the logger
+logger = logging.getLogger(__name__)
+
+# sampled frames sent to the emotion model per call
+BATCH_SIZE = int(os.getenv("DETECTION_BATCH_SIZE", "8"))
+
+
+def annotate_frame(frame, result):
+    """draw the detected emotion on a frame (for display, e.g. with cv2_imshow in Colab)."""
+    cv2.putText(frame, f"Emotion: {result['dominant_emotion']}", (50, 50),
+                cv2.FONT_HERSHEY_SIMPLEX, 1, (0, 255, 0), 2)
+    return frame
+
+
+def process_video(video_path, classifier, sample_fps=SAMPLE_FPS, batch_size=BATCH_SIZE,
+                  max_side=MAX_FRAME_SIDE, skip_decode=True, on_frame=None, early_exit=EARLY_EXIT,
+                  detect_every=DETECT_EVERY, track_fallback=TRACK_FALLBACK):
+    """
+    Detect the dominant emotion in a video.
+
+    Frames are sampled by time (sample_fps), skipped frames are never fully decoded,
+    sampled frames are downscaled to max_side and classified batch_size at a time.
+    on_frame(frame_number, frame, result) is only called if given, so display and
+    annotation stay off the hot path.
+
+    The face detector only runs every detect_every sampled frames (or when tracking is
+    lost, see tracking.FaceTracker), the box is tracked in between and only the face
+    crop goes to the emotion model.
+
+    Votes are tallied as batches come in and decoding stops once the early_exit
+    criterion says the dominant emotion is settled (see aggregate.EmotionVote).
+
+    video_path can also be a frame bundle (.npz, see bundle.py), its frames were
+    already sampled at upload time so only the JPEGs are decoded.
+
+    Returns {"emotion", "breakdown", "confidence_emotion", "frames_used", "frames_total",
+    "stopped_early", "detections", "seconds", "fps", "timings"} or None if the video can't be
+    opened or no emotion was detected.
+    """
+    start_time = time.time()
+    if is_frame_bundle(video_path):
+        try:
+            bundle = FrameBundle(video_path)
+        except (OSError, ValueError, KeyError) as e:
+            logger.error(f"The frame bundle cannot be read: {video_path} ({e})")
+            return None
+        frames = ((frame_number, downscale(frame, max_side)) for frame_number, frame in bundle)
+        frames_total = bundle.frames_total
+        release = lambda: None
+    else:
+        cap = cv2.VideoCapture(video_path)
+        if not cap.isOpened():
+            logger.error(f"The video file cannot be opened: {video_path}")
+            return None
+        frames = sample_frames(cap, sample_fps, max_side, skip_decode)
+        frames_total = sampled_frame_total(cap, sample_fps)
+        release = cap.release
+
+    last_frame_number = 0
+    frames_sampled = 0
+    vote = EmotionVote(criterion=early_exit)
+    tracker = FaceTracker(classifier, detect_every=detect_every, fallback=track_fallback)
+    stopped_early = False
+    timings = {"decode": 0.0, "detect": 0.0, "classify": 0.0}  # seconds per stage
+
+    def locate(frame_number, frame):
+        started = time.perf_counter()
+        try:
+            return tracker.locate(frame)
+        except Exception as e:
+            logger.warning(f"Error finding a face in frame {frame_number} of {video_path}: {e}")
+            return None
+        finally:
+            timings["detect"] += time.perf_counter() - started
+
+    def classify(batch):
+        faces = [face for _, _, face in batch]
+        started = time.perf_counter()
+        try:
+            results = classifier.classify_faces(faces)
+        except Exception as e:
+            logger.warning(f"Error processing frames {batch[0][0]}-{batch[-1][0]} of {video_path}: {e}")
+            return
+        finally:
+            timings["classify"] += time.perf_counter() - started
+
+        for (frame_number, frame, _), result in zip(batch, results):
+            vote.add(result)
+            if on_frame:
+                on_frame(frame_number, frame, result)
+
+    try:
+        batch = []
+        while True:
+            started = time.perf_counter()
+            sampled = next(frames, None)
+            timings["decode"] += time.perf_counter() - started
+            if sampled is None:
+                break
+
+            frame_number, frame = sampled
+            last_frame_number = frame_number
+            frames_sampled += 1
+            batch.append((frame_number, frame, crop_face(frame, locate(frame_number, frame))))
+            if len(batch) < batch_size:
+                continue
+
+            classify(batch)
+            batch = []
+            frames_left = max(frames_total - frames_sampled, 0) if frames_total else None
+            if vote.has_converged(frames_left):
+                stopped_early = True
+                break
+        if batch:
+            classify(batch)
+    finally:
+        release()
+
+    elapsed = time.time() - start_time
+    fps = last_frame_number / elapsed if elapsed else 0.0
+    logger.info(f"Processed {video_path}: {last_frame_number} frames in {elapsed:.2f}s ({fps:.2f} fps), "
+                f"{vote.frames_used} classified{' (stopped early)' if stopped_early else ''}")
+
+    if not vote.frames_used:
+        return None
+
+    return {
+        "emotion": vote.dominant(),  # occurrence based
+        "confidence_emotion": vote.most_confident(),  # confidence based
+        "breakdown": vote.breakdown(),
+        "frames_used": vote.frames_used,
+        "frames_total": frames_total,
+        "stopped_early": stopped_early,
+        "detections": tracker.detections,
+        "seconds": round(elapsed, 3),
+        "fps": round(fps, 2),
+        "timings": {stage: round(seconds, 4) for stage, seconds in timings.items()},
+    }
+
+
+def main():
+    """
+    Measure detection speed on a video, comparing the old loop (read every frame,
+    full size, face detection and one model call per frame) with the sampling pipeline.
+
+        python -m emotion_detection.detector clip.mp4 --classifier stub
+    """
+    from .models import load_classifier
+
+    parser = argparse.ArgumentParser(description="Compare frames per second of the old and new detection loop.")
+    parser.add_argument("video")
+    parser.add_argument("--classifier", default="deepface", help="'deepface', 'stub' or 'module:Class'")
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE)
+    parser.add_argument("--max-side", type=int, default=MAX_FRAME_SIDE)
+    parser.add_argument("--early-exit", default=EARLY_EXIT, choices=["off", "certain", "confident"])
+    parser.add_argument("--detect-every", type=int, default=DETECT_EVERY)
+    parser.add_argument("--track-fallback", default=TRACK_FALLBACK, choices=["detect", "last_box", "full_frame"])
+    args = parser.parse_args()
+
+    classifier = load_classifier(args.classifier)
+    old = process_video(args.video, classifier, batch_size=1, max_side=0, skip_decode=False,
+                        early_exit="off", detect_every=1)
+    new = process_video(args.video, classifier, batch_size=args.batch_size, max_side=args.max_side,
+                        early_exit=args.early_exit, detect_every=args.detect_every,
+                        track_fallback=args.track_fallback)
+
+    print(f"old loop: {old['fps'] if old else 0:.2f} fps")
+    print(f"new loop: {new['fps'] if new else 0:.2f} fps")
+    if new:
+        print(f"new loop classified {new['frames_used']} of {new['frames_total']} sampled frames "
+              f"with {new['detections']} face detector calls")
+        print("new loop time per stage: " + ", ".join(f"{stage} {seconds:.2f}s" for stage, seconds in new["timings"].items()))
+    if old and new and new["seconds"]:
+        print(f"speedup: {old['seconds'] / new['seconds']:.2f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,133 @@
+import importlib
+
+import cv2
+import numpy as np
+
+# emotions DeepFace can return, in the order of the emotion model's outputs
+EMOTIONS = ["angry", "disgust", "fear", "happy", "sad", "surprise", "neutral"]
+
+
+class EmotionClassifier:
+    """
+    Base class for emotion models used by the detector.
+
+    A classifier finds a face box in a frame (detect_face) and scores face crops
+    (classify_faces). Results look like DeepFace's:
+    {"dominant_emotion": str, "emotion": {emotion: confidence percentage}}.
+    """
+
+    def detect_face(self, frame):
+        """(x, y, w, h) of the main face in a BGR frame, or None if there is no face."""
+        raise NotImplementedError
+
+    def classify_faces(self, faces):
+        """score a list of BGR face crops in one model call, returns one result per crop."""
+        raise NotImplementedError
+
+    def analyze_batch(self, frames):
+        """detect + classify a list of frames, the whole frame is used when no face is found."""
+        crops = [crop_face(frame, self.detect_face(frame)) for frame in frames]
+        return self.classify_faces(crops)
+
+    def analyze(self, frame):
+        return self.analyze_batch([frame])[0]
+
+
+def crop_face(frame, box):
+    """cut a face box out of a frame, falling back to the full frame."""
+    if box is None:
+        return frame
+    x, y, w, h = box
+    height, width = frame.shape[:2]
+    x, y = max(0, int(x)), max(0, int(y))
+    crop = frame[y:min(height, y + int(h)), x:min(width, x + int(w))]
+    return crop if crop.size else frame
+
+
+def scores_to_result(probabilities):
+    """turn one row of model outputs into a DeepFace style result."""
+    total = float(np.sum(probabilities)) or 1.0
+    scores = {emo: 100 * float(p) / total for emo, p in zip(EMOTIONS, probabilities)}
+    return {"dominant_emotion": max(scores, key=scores.get), "emotion": scores}
+
+
+class DeepFaceClassifier(EmotionClassifier):
+    """
+    DeepFace models, same settings the Colab notebook uses.
+    Faces are found one frame at a time, but all crops of a batch go through the
+    emotion CNN in a single predict call.
+    """
+
+    def __init__(self, detector_backend="retinaface"):
+        from deepface import DeepFace  # heavy import, only load it in processes that need it
+
+        self._deepface = DeepFace
+        self.detector_backend = detector_backend
+        self._model = None
+
+    def _emotion_model(self):
+        if self._model is None:
+            try:
+                client = self._deepface.build_model(model_name="Emotion", task="facial_attribute")
+            except TypeError:
+                client = self._deepface.build_model("Emotion")  # older deepface releases
+            self._model = getattr(client, "model", client)  # the underlying keras model takes batches
+        return self._model
+
+    def detect_face(self, frame):
+        faces = self._deepface.extract_faces(
+            img_path=frame,
+            detector_backend=self.detector_backend,
+            enforce_detection=False  # Returns the whole frame rather than an error if no face found.
+        )
+        if not faces or not faces[0].get("confidence"):
+            return None
+        area = faces[0]["facial_area"]
+        return area["x"], area["y"], area["w"], area["h"]
+
+    def classify_faces(self, faces):
+        if not faces:
+            return []
+        batch = np.stack([
+            cv2.resize(cv2.cvtColor(face, cv2.COLOR_BGR2GRAY), (48, 48)) / 255.0
+            for face in faces
+        ])[..., np.newaxis]
+        predictions = self._emotion_model().predict(batch, verbose=0)
+        return [scores_to_result(row) for row in predictions]
+
+
+class StubClassifier(EmotionClassifier):
+    """CPU only stand in that always reports the same emotion, for tests and benchmarks."""
+
+    def __init__(self, emotion="happy", confidence=90.0):
+        self.emotion = emotion
+        self.confidence = confidence
+
+    def detect_face(self, frame):
+        height, width = frame.shape[:2]
+        return width // 4, height // 4, width // 2, height // 2
+
+    def classify_faces(self, faces):
+        rest = (100.0 - self.confidence) / (len(EMOTIONS) - 1)
+        scores = {emo: (self.confidence if emo == self.emotion else rest) for emo in EMOTIONS}
+        return [{"dominant_emotion": self.emotion, "emotion": dict(scores)} for _ in faces]
+
+
+BUILTIN_CLASSIFIERS = {
+    "deepface": DeepFaceClassifier,
+    "stub": StubClassifier,
+}
+
+
+def load_classifier(spec="deepface"):
+    """
+    Build a classifier from a spec string so it can be passed to worker processes.
+    spec is a builtin name ("deepface", "stub") or an import path like "my_module:MyClassifier".
+    """
+    if spec in BUILTIN_CLASSIFIERS:
+        return BUILTIN_CLASSIFIERS[spec]()
+
+    module_name, _, attr = spec.partition(":")
+    if not attr:
+        raise ValueError(f"Unknown classifier '{spec}'. Use one of {sorted(BUILTIN_CLASSIFIERS)} or 'module:Class'.")
+    return getattr(importlib.import_module(module_name), attr)()
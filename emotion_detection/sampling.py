@@ -0,0 +1,65 @@
+import os
+
+import cv2
+
+# frames analysed per second of video (30 fps video / every 5th frame = 6)
+SAMPLE_FPS = float(os.getenv("DETECTION_SAMPLE_FPS", "6"))
+
+# sampled frames are shrunk so their longest side is at most this many pixels (0 = keep full size)
+MAX_FRAME_SIDE = int(os.getenv("DETECTION_MAX_FRAME_SIDE", "640"))
+
+# used when the container doesn't report a frame rate
+DEFAULT_VIDEO_FPS = 30.0
+
+
+def frame_step(video_fps, sample_fps=SAMPLE_FPS):
+    """number of decoded frames between two sampled frames."""
+    if not video_fps or video_fps <= 0:
+        video_fps = DEFAULT_VIDEO_FPS
+    return max(1, round(video_fps / sample_fps))
+
+
+def downscale(frame, max_side=MAX_FRAME_SIDE):
+    """shrink a frame so its longest side is max_side, smaller frames are returned as is."""
+    if not max_side:
+        return frame
+    height, width = frame.shape[:2]
+    longest = max(height, width)
+    if longest <= max_side:
+        return frame
+    scale = max_side / longest
+    return cv2.resize(frame, (int(width * scale), int(height * scale)), interpolation=cv2.INTER_AREA)
+
+
+def sample_frames(cap, sample_fps=SAMPLE_FPS, max_side=MAX_FRAME_SIDE, skip_decode=True):
+    """
+    Yield (frame_number, frame) for the sampled frames of an opened cv2.VideoCapture.
+
+    Frames in between are only grab()'d, so they are never converted into images.
+    frame_number is 1 based like the notebook's frame_count. skip_decode=False reads
+    every frame fully, which is only useful to compare against the old loop.
+    """
+    step = frame_step(cap.get(cv2.CAP_PROP_FPS), sample_fps)
+    frame_number = 0
+
+    while True:
+        frame_number += 1
+        if frame_number % step != 0:
+            ok = cap.grab() if skip_decode else cap.read()[0]
+            if not ok:
+                return
+            continue
+
+        ok, frame = cap.read()
+        if not ok:
+            return
+        yield frame_number, downscale(frame, max_side)
+
+
+
+def sampled_frame_total(cap, sample_fps=SAMPLE_FPS):
+    """how many frames sample_frames will yield, None if the container doesn't say."""
+    total = int(cap.get(cv2.CAP_PROP_FRAME_COUNT) or 0)
+    if total <= 0:
+        return None
+    return total // frame_step(cap.get(cv2.CAP_PROP_FPS), sample_fps)
@@ -0,0 +1,107 @@
+import os
+
+import cv2
+
+# run the (expensive) face detector on every Nth sampled frame, track the box in between
+DETECT_EVERY = int(os.getenv("DETECTION_DETECT_EVERY", "5"))
+
+# template match score (0-1) below which tracking counts as lost
+TRACK_MIN_CONFIDENCE = float(os.getenv("DETECTION_TRACK_MIN_CONFIDENCE", "0.6"))
+
+# what to do when tracking is lost before the next scheduled detection:
+# "detect" runs the detector straight away, "last_box" keeps the previous box,
+# "full_frame" classifies the whole frame until the next detection
+TRACK_FALLBACK = os.getenv("DETECTION_TRACK_FALLBACK", "detect")
+
+# how far around the last box (as a fraction of its size) the face is searched for
+TRACK_SEARCH_MARGIN = 0.5
+
+
+class FaceTracker:
+    """
+    Finds the face box in consecutive sampled frames.
+
+    The classifier's detector runs every detect_every frames, or when tracking is lost
+    (depending on fallback). In between, the last face crop is template matched
+    in a window around the previous box, which is far cheaper than RetinaFace.
+    """
+
+    def __init__(self, classifier, detect_every=DETECT_EVERY, min_confidence=TRACK_MIN_CONFIDENCE,
+                 fallback=TRACK_FALLBACK, search_margin=TRACK_SEARCH_MARGIN):
+        if fallback not in ("detect", "last_box", "full_frame"):
+            raise ValueError(f"Unknown tracking fallback '{fallback}'.")
+        self.classifier = classifier
+        self.detect_every = max(1, detect_every)
+        self.min_confidence = min_confidence
+        self.fallback = fallback
+        self.search_margin = search_margin
+
+        self._box = None
+        self._template = None
+        self._since_detect = 0
+
+        # counters
+        self.detections = 0
+        self.tracked = 0
+        self.lost = 0
+
+    def locate(self, frame):
+        """face box (x, y, w, h) for this frame, or None to use the whole frame."""
+        if self._template is None or self._since_detect >= self.detect_every:
+            return self._detect(frame)
+
+        box, score = self._track(frame)
+        if score >= self.min_confidence:
+            self.tracked += 1
+            self._since_detect += 1
+            self._remember(frame, box)
+            return box
+
+        self.lost += 1
+        if self.fallback == "detect":
+            return self._detect(frame)
+        self._since_detect += 1
+        return self._box if self.fallback == "last_box" else None
+
+    def _detect(self, frame):
+        self.detections += 1
+        self._since_detect = 1
+        box = self.classifier.detect_face(frame)
+        if box is None:
+            self._box = self._template = None
+        else:
+            self._remember(frame, box)
+        return box
+
+    def _remember(self, frame, box):
+        x, y, w, h = (int(v) for v in box)
+        template = _gray(frame[max(0, y):y + h, max(0, x):x + w])
+        if template.size == 0:
+            self._box = self._template = None
+            return
+        self._box = (x, y, w, h)
+        self._template = template
+
+    def _track(self, frame):
+        """template match the last face around its previous position, returns (box, score)."""
+        x, y, w, h = self._box
+        th, tw = self._template.shape[:2]
+        height, width = frame.shape[:2]
+
+        pad_x, pad_y = int(w * self.search_margin), int(h * self.search_margin)
+        x0, y0 = max(0, x - pad_x), max(0, y - pad_y)
+        x1, y1 = min(width, x + w + pad_x), min(height, y + h + pad_y)
+        window = _gray(frame[y0:y1, x0:x1])
+        if window.shape[0] < th or window.shape[1] < tw:
+            return self._box, 0.0
+
+        scores = cv2.matchTemplate(window, self._template, cv2.TM_CCOEFF_NORMED)
+        _, best, _, (bx, by) = cv2.minMaxLoc(scores)
+        return (x0 + bx, y0 + by, tw, th), best
+
+    def stats(self):
+        return {"detections": self.detections, "tracked": self.tracked, "lost": self.lost}
+
+
+def _gray(image):
+    return cv2.cvtColor(image, cv2.COLOR_BGR2GRAY) if image.ndim == 3 else image
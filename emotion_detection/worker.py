@@ -0,0 +1,269 @@
+"""
+Local emotion detection worker, replaces the Colab polling loop.
+
+Videos are pulled from a queue and processed in parallel across a process pool,
+results are posted to the backend through the same /status_update and
+/colab_callback contract the notebook uses.
+
+    python -m emotion_detection.worker --folder /path/to/uploads --workers 4
+"""
+import argparse
+import glob
+import logging
+import os
+import queue
+import re
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import requests
+
+from .detector import process_video
+from .models import load_classifier
+
+# setting up the logger
+logger = logging.getLogger(__name__)
+
+# backend the results are sent to (ngrok / hosted / local)
+RECOMMENDER_API_URL = os.getenv("RECOMMENDER_API_URL", "http://localhost:8000")
+
+# number of videos processed at the same time
+DETECTION_WORKERS = int(os.getenv("DETECTION_WORKERS", str(os.cpu_count() or 1)))
+
+# classifier used inside the worker processes, see models.load_classifier
+DETECTION_CLASSIFIER = os.getenv("DETECTION_CLASSIFIER", "deepface")
+
+# classifier of the current worker process, built once by _init_process
+_classifier = None
+
+
+def _init_process(classifier_spec):
+    """runs once in every pool process so the model is only loaded once per process."""
+    global _classifier
+    _classifier = load_classifier(classifier_spec)
+
+
+def _detect(video_path):
+    return process_video(video_path, _classifier)
+
+
+def get_job_id(video_path):
+    """the backend puts the job id in the uploaded filename (temp_<time>_<job id>_<name>.mp4 or .npz)."""
+    match = re.match(r"temp_\d+_([0-9a-f]{32})_", os.path.basename(video_path))
+    return match.group(1) if match else None
+
+
+class EmotionWorker:
+    """
+    Pulls video paths from a queue and runs detection on a process pool.
+    At most `workers` videos are in the pool at once, the rest wait in the queue.
+    Every call to the backend (status updates and finished detections) is made from a
+    sender thread, in order, so slow HTTP never holds up the pool's result handling or
+    the dispatch of queued videos.
+    """
+
+    def __init__(self, api_url=RECOMMENDER_API_URL, workers=DETECTION_WORKERS,
+                 classifier=DETECTION_CLASSIFIER, delete_processed=True, session=None):
+        self.api_url = api_url.rstrip("/")
+        self.workers = max(1, workers)
+        self.classifier = classifier
+        self.delete_processed = delete_processed
+        self.session = session or requests.Session()
+        self.jobs = queue.Queue()
+        self._outbox = queue.Queue()  # (method, args) backend calls waiting for the sender thread
+        self._slots = threading.Semaphore(self.workers)
+        self._pool = None
+        self._dispatcher = None
+        self._sender = None
+
+    def submit(self, video_path):
+        """queue a video for detection."""
+        self.jobs.put(video_path)
+
+    def start(self):
+        self._pool = ProcessPoolExecutor(
+            max_workers=self.workers,
+            initializer=_init_process,
+            initargs=(self.classifier,),
+        )
+        self._dispatcher = threading.Thread(target=self._dispatch, daemon=True)
+        self._dispatcher.start()
+        self._sender = threading.Thread(target=self._send, daemon=True)
+        self._sender.start()
+
+    def stop(self, wait=True):
+        """stop taking new jobs, finish the ones already in the pool."""
+        self.jobs.put(None)
+        if self._dispatcher:
+            self._dispatcher.join()
+        if self._pool:
+            self._pool.shutdown(wait=wait)
+        if self._sender:
+            self._outbox.put(None)
+            if wait:
+                self._sender.join()
+
+    def _dispatch(self):
+        while True:
+            video_path = self.jobs.get()
+            if video_path is None:
+                break
+
+            self._slots.acquire()  # wait for a free process
+            logger.info(f"📂 Processing {video_path}")
+            self._outbox.put((self.post_status, (get_job_id(video_path), "processing_started")))
+            future = self._pool.submit(_detect, video_path)
+            future.add_done_callback(lambda f, path=video_path: self._done(path, f))
+
+    def _done(self, video_path, future):
+        # runs on the pool's management thread: free the slot and hand over, no I/O here
+        self._slots.release()
+        self._outbox.put((self._finish, (video_path, future)))
+
+    def _send(self):
+        while True:
+            item = self._outbox.get()
+            if item is None:
+                break
+            method, args = item
+            try:
+                method(*args)
+            except Exception as e:
+                logger.error(f"❌ Could not report to the backend ({method.__name__}{args}): {e}", exc_info=True)
+
+    def _finish(self, video_path, future):
+        job_id = get_job_id(video_path)
+
+        try:
+            result = future.result()
+            detail = "No emotion could be detected in the video."
+        except Exception as e:
+            logger.error(f"❌ Detection failed for {video_path}: {e}", exc_info=True)
+            result, detail = None, f"Detection failed: {e}"
+
+        if not result:
+            # a terminal stage, the backend ends the job with this error so nobody keeps waiting
+            self.post_status(job_id, "detection_failed", detail)
+            return
+
+        if self.post_result(job_id, result) and self.delete_processed:
+            try:
+                os.remove(video_path)
+            except OSError as e:
+                logger.warning(f"⚠️ Could not delete video file: {e}")
+
+    def post_status(self, job_id, status, detail=None):
+        payload = {"status": status, "job_id": job_id}
+        if detail:
+            payload["detail"] = detail
+        try:
+            self.session.post(f"{self.api_url}/status_update", json=payload, timeout=10)
+        except requests.RequestException as e:
+            logger.warning(f"⚠️ Could not send status '{status}': {e}")
+
+    def post_result(self, job_id, result):
+        """send the detected emotion to /colab_callback, returns True on success."""
+        payload = {
+            "emotion": result["emotion"],
+            "breakdown": result["breakdown"],
+            "job_id": job_id,
+            "timings": result.get("timings"),  # seconds per detection stage, for /metrics
+        }
+        access_token = self.get_access_token()  # fetch a fresh token before sending, in case user logged out
+        if access_token:
+            payload["access_token"] = access_token
+
+        try:
+            response = self.session.post(f"{self.api_url}/colab_callback", json=payload, timeout=120)
+        except requests.RequestException as e:
+            logger.error(f"❌ Error sending emotion to API: {e}")
+            return False
+
+        if response.status_code != 200:
+            logger.warning(f"⚠️ Failed to send emotion to API. Status Code: {response.status_code}")
+            return False
+
+        logger.info(f"✅ Sent {result['emotion']} for job {job_id}")
+        return True
+
+    def get_access_token(self):
+        """latest Spotify token from the backend, only if Spotify still accepts it."""
+        try:
+            response = self.session.get(f"{self.api_url}/token", timeout=10)
+            if response.status_code != 200:
+                return None
+            token = response.json().get("access_token")
+            if not token:
+                return None
+            test_response = self.session.get(
+                "https://api.spotify.com/v1/me",
+                headers={"Authorization": f"Bearer {token}"},
+                timeout=10,
+            )
+            return token if test_response.status_code == 200 else None
+        except requests.RequestException as e:
+            logger.warning(f"❌ Error fetching or validating token: {e}")
+            return None
+
+
+class FolderWatcher:
+    """
+    Queues every new video that shows up in a folder (not only the latest one).
+    Frame bundles (.npz) written by the backend's UPLOAD_FRAME_EXTRACTION are picked up too.
+    """
+
+    def __init__(self, folder, worker, patterns=("*.mp4", "*.npz"), interval=5):
+        self.folder = folder
+        self.worker = worker
+        self.patterns = patterns
+        self.interval = interval
+        self._seen = set()
+
+    def scan(self):
+        """queue unseen videos, oldest first. returns how many were queued."""
+        video_files = sorted(path for pattern in self.patterns for path in glob.glob(os.path.join(self.folder, pattern)))
+        new_files = [path for path in video_files if path not in self._seen]
+        for path in new_files:
+            self._seen.add(path)
+            self.worker.submit(path)
+
+        # forget files that are gone so the set doesn't grow forever
+        self._seen.intersection_update(video_files)
+        return len(new_files)
+
+    def run_forever(self):
+        logger.info(f"🔄 Waiting for new uploads in {self.folder}...")
+        while True:
+            if self.scan():
+                logger.info(f"queued new videos, {self.worker.jobs.qsize()} waiting")
+            time.sleep(self.interval)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run the emotion detection worker.")
+    parser.add_argument("--folder", required=True, help="folder the uploaded videos land in")
+    parser.add_argument("--api-url", default=RECOMMENDER_API_URL, help="backend base url")
+    parser.add_argument("--workers", type=int, default=DETECTION_WORKERS, help="videos processed in parallel")
+    parser.add_argument("--classifier", default=DETECTION_CLASSIFIER, help="'deepface', 'stub' or 'module:Class'")
+    parser.add_argument("--interval", type=float, default=5, help="seconds between folder scans")
+    parser.add_argument("--keep-videos", action="store_true", help="don't delete videos after a successful callback")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+
+    worker = EmotionWorker(
+        api_url=args.api_url,
+        workers=args.workers,
+        classifier=args.classifier,
+        delete_processed=not args.keep_videos,
+    )
+    worker.start()
+    try:
+        FolderWatcher(args.folder, worker, interval=args.interval).run_forever()
+    except KeyboardInterrupt:
+        worker.stop()
+
+
+if __name__ == "__main__":
+    main()
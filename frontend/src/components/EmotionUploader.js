@@ -1,5 +1,5 @@
 import React, { useState, useEffect } from "react";
-import {checkToken, loginUrl, logout, uploadVideo,triggerProcessing,pollStatus,} from "../services/api";
+import {checkToken, loginUrl, logout, uploadVideo,triggerProcessing,pollStatus,streamJob,} from "../services/api";
 
 import EmotionBreakdown from "../components/EmotionBreakdown"; // animated breakdown
 
@@ -32,10 +32,10 @@ export default function EmotionUploader() {
   };
 
   // polls backend until Colab sends "processing_started"
-  const pollForProcessingStarted = () => {
+  const pollForProcessingStarted = (jobId) => {
     const interval = setInterval(async () => {
       try {
-        const res = await pollStatus();
+        const res = await pollStatus(jobId);
         if (res.status === "processing_started") {
           clearInterval(interval);
           setProgressStage("analyzing"); // switch to analyzing
@@ -46,6 +46,21 @@ export default function EmotionUploader() {
     }, 2000);
   };
 
+  // waits for the job result, using the push stream when the browser supports it
+  const waitForResult = (jobId) => {
+    if (!window.EventSource) {
+      // start polling until colab sends "processing_started"
+      pollForProcessingStarted(jobId);
+      return triggerProcessing(jobId);
+    }
+
+    return streamJob(jobId, (status) => {
+      if (status === "processing_started") {
+        setProgressStage("analyzing"); // switch to analyzing
+      }
+    });
+  };
+
   const handleUploadAndProcess = async () => {
     if (!file) return alert("Please select a video");
 
@@ -63,10 +78,7 @@ export default function EmotionUploader() {
         return alert("Upload failed. Try again.");
       }
 
-      // start polling until colab sends "processing_started"
-      pollForProcessingStarted();
-
-      const data = await triggerProcessing();
+      const data = await waitForResult(uploadRes.job_id);
 
       if (data.emotion) {
         setDetectedEmotion(data.emotion);
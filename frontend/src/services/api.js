@@ -14,10 +14,37 @@ export const uploadVideo = (formData) =>
     body: formData
   }).then(res => res.json());
 
-export const triggerProcessing = () =>
-  fetch(`${API_BASE}/process_latest`, {
+export const triggerProcessing = (jobId) =>
+  fetch(`${API_BASE}/process_latest?job_id=${encodeURIComponent(jobId)}`, {
     method: "POST"
   }).then(res => res.json());
 
-export const pollStatus = () =>
-  fetch(`${API_BASE}/status_check`).then(res => res.json());
+export const pollStatus = (jobId) =>
+  fetch(`${API_BASE}/status_check?job_id=${encodeURIComponent(jobId)}`).then(res => res.json());
+
+// how long to wait for a result before giving up (same as the backend's PROCESS_TIMEOUT_SECONDS)
+const STREAM_TIMEOUT_MS = 400 * 1000;
+
+// listens to the server push stream for a job and resolves with the final result
+export const streamJob = (jobId, onStatus, timeoutMs = STREAM_TIMEOUT_MS) =>
+  new Promise((resolve, reject) => {
+    const source = new EventSource(`${API_BASE}/status_stream?job_id=${encodeURIComponent(jobId)}`);
+
+    const finish = (settle, value) => {
+      clearTimeout(timer);
+      source.close();
+      settle(value);
+    };
+    const timer = setTimeout(() => finish(reject, new Error("Timed out waiting for the result")), timeoutMs);
+
+    source.addEventListener("status", (e) => onStatus(JSON.parse(e.data).status));
+
+    source.addEventListener("result", (e) => finish(resolve, JSON.parse(e.data)));
+
+    source.addEventListener("error", (e) => {
+      // "error" events sent by the server carry data (e.g. a failed job), dropped connections are retried by the browser
+      if (e.data || source.readyState === EventSource.CLOSED) {
+        finish(reject, new Error(e.data ? JSON.parse(e.data).detail : "Status stream closed"));
+      }
+    });
+  });
@@ -1,8 +1,24 @@
-from fastapi import FastAPI
+import time
+from contextlib import asynccontextmanager
+
+from dotenv import load_dotenv
+
+# load .env once, before any module reads its settings
+load_dotenv()
+
+from fastapi import FastAPI, Request
 from api.routes import router
+from api.warmup import start_warmup
 from fastapi.middleware.cors import CORSMiddleware
+from metrics import REQUEST_LATENCY, server_timing_header, start_trace
 
-app = FastAPI()
+@asynccontextmanager
+async def lifespan(app):
+    # Spotify token, Drive login and the catalog load in the background, see /ready
+    start_warmup()
+    yield
+
+app = FastAPI(lifespan=lifespan)
 
 app.add_middleware(
     CORSMiddleware,
@@ -15,6 +31,25 @@ app.add_middleware(
 # Register routes
 app.include_router(router)
 
+@app.middleware("http")
+async def record_timings(request: Request, call_next):
+    # opt-in trace of where the time went, returned as a Server-Timing header
+    spans = start_trace() if request.headers.get("X-Timing-Trace") == "1" else None
+    start = time.perf_counter()
+    status = 500
+    try:
+        response = await call_next(request)
+        status = response.status_code
+    finally:
+        elapsed = time.perf_counter() - start
+        # label by the route template (/recommend/{emotion}) so ids don't blow up the label set
+        route = request.scope.get("route")
+        REQUEST_LATENCY.observe(elapsed, method=request.method,
+                                route=getattr(route, "path", "unmatched"), status=status)
+    if spans is not None:
+        response.headers["Server-Timing"] = server_timing_header(spans + [("total", elapsed)])
+    return response
+
 @app.get("/")
 def read_root():
     return {"message": "Welcome to EmotionalRec API"}
@@ -0,0 +1,209 @@
+"""
+Small in-process metrics registry with Prometheus text output, plus an optional
+per-request timing trace (returned as a Server-Timing header).
+"""
+import contextvars
+import threading
+import time
+from contextlib import contextmanager
+
+# default latency buckets in seconds
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 400)
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels_text(names, values, extra=None):
+    pairs = list(zip(names, values)) + (list(extra.items()) if extra else [])
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in pairs) + "}"
+
+
+class _Metric:
+    kind = None
+
+    def __init__(self, name, help_text, labels=()):
+        self.name = name
+        self.help = help_text
+        self.label_names = tuple(labels)
+        self._lock = threading.Lock()
+
+    def _key(self, labels):
+        return tuple(str(labels.get(name, "")) for name in self.label_names)
+
+    def header(self):
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, name, help_text, labels=()):
+        super().__init__(name, help_text, labels)
+        self._values = {}
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def render(self):
+        with self._lock:
+            values = dict(self._values)
+        return self.header() + [
+            f"{self.name}{_labels_text(self.label_names, key)} {value}" for key, value in sorted(values.items())
+        ]
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name, help_text, labels=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, help_text, labels)
+        self.buckets = tuple(buckets)
+        self._values = {}  # key -> [bucket counts..., sum, count]
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            data = self._values.get(key)
+            if data is None:
+                data = self._values[key] = [0] * len(self.buckets) + [0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    data[i] += 1
+            data[-2] += value
+            data[-1] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def render(self):
+        with self._lock:
+            values = {key: list(data) for key, data in self._values.items()}
+        lines = self.header()
+        for key, data in sorted(values.items()):
+            for bound, count in zip(self.buckets, data):
+                lines.append(f"{self.name}_bucket{_labels_text(self.label_names, key, {'le': bound})} {count}")
+            lines.append(f"{self.name}_bucket{_labels_text(self.label_names, key, {'le': '+Inf'})} {data[-1]}")
+            lines.append(f"{self.name}_sum{_labels_text(self.label_names, key)} {data[-2]}")
+            lines.append(f"{self.name}_count{_labels_text(self.label_names, key)} {data[-1]}")
+        return lines
+
+
+class Gauge(_Metric):
+    """value read at scrape time from a callback returning {label values tuple: value} or a number."""
+
+    kind = "gauge"
+
+    def __init__(self, name, help_text, callback, labels=()):
+        super().__init__(name, help_text, labels)
+        self.callback = callback
+
+    def render(self):
+        values = self.callback()
+        if not isinstance(values, dict):
+            values = {(): values}
+        return self.header() + [
+            f"{self.name}{_labels_text(self.label_names, key)} {value}"
+            for key, value in sorted(values.items()) if value is not None
+        ]
+
+
+class CallbackCounter(Gauge):
+    """cumulative count read at scrape time, for counts kept elsewhere (e.g. cache hits). Exported as a counter."""
+
+    kind = "counter"
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def register(self, metric):
+        with self._lock:
+            # re-registering (e.g. module reload) keeps the first metric
+            return self._metrics.setdefault(metric.name, metric)
+
+    def counter(self, name, help_text, labels=()):
+        return self.register(Counter(name, help_text, labels))
+
+    def histogram(self, name, help_text, labels=(), buckets=DEFAULT_BUCKETS):
+        return self.register(Histogram(name, help_text, labels, buckets))
+
+    def gauge(self, name, help_text, callback, labels=()):
+        return self.register(Gauge(name, help_text, callback, labels))
+
+    def counter_callback(self, name, help_text, callback, labels=()):
+        """like gauge(), for values that only ever go up (name them *_total so rate() works)."""
+        return self.register(CallbackCounter(name, help_text, callback, labels))
+
+    def render(self):
+        """all metrics in the Prometheus text exposition format."""
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines = []
+        for metric in metrics:
+            try:
+                lines.extend(metric.render())
+            except Exception as e:
+                lines.append(f"# {metric.name} failed: {_escape(e)}")
+        return "\n".join(lines) + "\n"
+
+
+# process wide registry
+registry = Registry()
+
+REQUEST_LATENCY = registry.histogram(
+    "http_request_duration_seconds", "Request latency per route.", labels=("method", "route", "status"))
+SPOTIFY_CALLS = registry.counter(
+    "spotify_calls_total", "Spotify API calls per endpoint and outcome.", labels=("endpoint", "outcome"))
+SPOTIFY_LATENCY = registry.histogram(
+    "spotify_call_duration_seconds", "Spotify API call latency per endpoint, including scheduler wait.",
+    labels=("endpoint",))
+# detection stages a worker may report timings for (anything else is dropped, labels must stay bounded)
+DETECTION_STAGES = ("decode", "detect", "classify")
+DETECTION_STAGE_SECONDS = registry.histogram(
+    "detection_stage_seconds", "Emotion detection time per stage (decode, detect, classify) per video.",
+    labels=("stage",))
+
+
+# per request timing trace, only set when a trace was asked for
+_trace = contextvars.ContextVar("timing_trace", default=None)
+
+
+def start_trace():
+    """start collecting spans for the current request, returns the span list."""
+    spans = []
+    _trace.set(spans)
+    return spans
+
+
+def add_span(name, seconds):
+    """record a finished span on the current trace, if there is one."""
+    spans = _trace.get()
+    if spans is not None:
+        spans.append((name, seconds))
+
+
+@contextmanager
+def span(name):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        add_span(name, time.perf_counter() - start)
+
+
+def server_timing_header(spans):
+    """format spans as a Server-Timing header value (durations in ms)."""
+    return ", ".join(f"{name.replace(' ', '_')};dur={seconds * 1000:.1f}" for name, seconds in spans)
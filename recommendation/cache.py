@@ -0,0 +1,287 @@
+import hashlib
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from metrics import registry
+from state.backends import get_state_backend
+
+# setting up the logger
+logger = logging.getLogger(__name__)
+
+# cache settings for public spotify responses
+SPOTIFY_CACHE_TTL = float(os.getenv("SPOTIFY_CACHE_TTL", "3600"))  # seconds a response counts as fresh
+SPOTIFY_CACHE_STALE_TTL = float(os.getenv("SPOTIFY_CACHE_STALE_TTL", "86400"))  # extra seconds a stale response may be served
+SPOTIFY_CACHE_MAXSIZE = int(os.getenv("SPOTIFY_CACHE_MAXSIZE", "2048"))
+
+# cache settings for per user taste profiles (top artists, tracks, genres)
+USER_PROFILE_CACHE_TTL = float(os.getenv("USER_PROFILE_CACHE_TTL", "1800"))
+USER_PROFILE_CACHE_MAXSIZE = int(os.getenv("USER_PROFILE_CACHE_MAXSIZE", "1000"))
+
+
+class TTLCache:
+    """
+    Thread safe LRU cache where every entry has a time to live.
+
+    Entries past their ttl but still inside the stale window are returned straight away
+    while a background thread refreshes them (stale-while-revalidate).
+
+    With shared=True and a shared state backend (sqlite / redis) the backend is a second
+    level: local misses are looked up there and new values are written through, so
+    worker processes reuse each other's responses. Values have to be JSON serialisable.
+    """
+
+    def __init__(self, ttl, maxsize, stale_ttl=0, name="cache", shared=False):
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self.maxsize = maxsize
+        self.name = name
+        self.shared = shared
+        self._data = OrderedDict()  # key -> (value, expires_at)
+        self._lock = threading.Lock()
+        self._refreshing = set()  # keys with a background refresh in flight
+
+        # counters
+        self.hits = 0
+        self.misses = 0
+        self.stale_hits = 0
+        self.l2_hits = 0
+
+    def _l2(self):
+        """the shared backend, or None if this cache is process local."""
+        if not self.shared:
+            return None
+        backend = get_state_backend()
+        return backend if backend.shared else None
+
+    def _l2_key(self, key):
+        return f"cache:{self.name}:{hashlib.sha256(repr(key).encode('utf-8')).hexdigest()}"
+
+    def _l2_get(self, key):
+        backend = self._l2()
+        if backend is None:
+            return None
+        try:
+            entry = backend.get(self._l2_key(key))
+        except Exception as e:
+            logger.warning(f"shared cache read failed for {self.name}: {str(e)}")
+            return None
+        if not entry or entry["expires_at"] <= time.time():
+            return None
+        # keep it locally for the rest of its life
+        self._set_local(key, entry["value"], entry["expires_at"] - time.time())
+        with self._lock:
+            self.l2_hits += 1
+        return entry
+
+    def _l2_set(self, key, value, ttl):
+        backend = self._l2()
+        if backend is None:
+            return
+        try:
+            backend.set(self._l2_key(key), {"value": value, "expires_at": time.time() + ttl}, ttl=ttl)
+        except Exception as e:
+            logger.warning(f"shared cache write failed for {self.name}: {str(e)}")
+
+    def get(self, key, default=None):
+        """return a fresh value for key, or default if missing or expired."""
+        now = time.monotonic()
+        with self._lock:
+            entry = self._data.get(key)
+            if entry and entry[1] > now:
+                self._data.move_to_end(key)
+                self.hits += 1
+                return entry[0]
+
+        shared_entry = self._l2_get(key)
+        if shared_entry is not None:
+            return shared_entry["value"]
+        with self._lock:
+            self.misses += 1
+        return default
+
+    def _set_local(self, key, value, ttl):
+        expires_at = time.monotonic() + ttl
+        with self._lock:
+            self._data[key] = (value, expires_at)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def set(self, key, value, ttl=None):
+        """store value under key, evicting the least recently used entries over maxsize."""
+        ttl = self.ttl if ttl is None else ttl
+        self._set_local(key, value, ttl)
+        self._l2_set(key, value, ttl)
+
+    def invalidate(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+        backend = self._l2()
+        if backend is not None:
+            try:
+                backend.delete(self._l2_key(key))
+            except Exception as e:
+                logger.warning(f"shared cache delete failed for {self.name}: {str(e)}")
+
+    def clear(self):
+        """
+        Drop every entry here and in the shared backend. Other workers still serve
+        the copies they already hold locally until those expire (at most ttl).
+        """
+        with self._lock:
+            self._data.clear()
+        backend = self._l2()
+        if backend is not None:
+            try:
+                backend.delete_prefix(f"cache:{self.name}:")
+            except Exception as e:
+                logger.warning(f"shared cache clear failed for {self.name}: {str(e)}")
+
+    def get_or_load(self, key, loader):
+        """
+        Return the cached value for key, calling loader() on a miss.
+        Stale entries are served immediately and refreshed in the background.
+        """
+        now = time.monotonic()
+        with self._lock:
+            entry = self._data.get(key)
+            if entry:
+                value, expires_at = entry
+                if expires_at > now:
+                    self._data.move_to_end(key)
+                    self.hits += 1
+                    return value
+                if expires_at + self.stale_ttl > now:
+                    self._data.move_to_end(key)
+                    self.stale_hits += 1
+                    if key not in self._refreshing:
+                        self._refreshing.add(key)
+                        threading.Thread(target=self._refresh, args=(key, loader), daemon=True).start()
+                    return value
+
+        shared_entry = self._l2_get(key)
+        if shared_entry is not None:
+            return shared_entry["value"]
+        with self._lock:
+            self.misses += 1
+
+        value = loader()
+        self.set(key, value)
+        return value
+
+    def _refresh(self, key, loader):
+        try:
+            # another worker may have refreshed it already
+            if self._l2_get(key) is None:
+                self.set(key, loader())
+        except Exception as e:
+            # keep serving the stale value, the next stale hit will try again
+            logger.warning(f"background refresh failed for {self.name} key {key}: {str(e)}")
+        finally:
+            with self._lock:
+                self._refreshing.discard(key)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "size": len(self._data),
+                "maxsize": self.maxsize,
+                "hits": self.hits,
+                "misses": self.misses,
+                "stale_hits": self.stale_hits,
+                "l2_hits": self.l2_hits,
+            }
+
+
+# process wide cache shared by every request
+spotify_response_cache = TTLCache(
+    ttl=SPOTIFY_CACHE_TTL,
+    maxsize=SPOTIFY_CACHE_MAXSIZE,
+    stale_ttl=SPOTIFY_CACHE_STALE_TTL,
+    name="spotify_responses",
+    shared=True,
+)
+
+# per user taste profiles, keyed by a hash of the access token
+user_profile_cache = TTLCache(
+    ttl=USER_PROFILE_CACHE_TTL,
+    maxsize=USER_PROFILE_CACHE_MAXSIZE,
+    name="user_profiles",
+    shared=True,
+)
+
+# spotify user id per token hash, and mood playlist per (user id, playlist name)
+user_id_cache = TTLCache(ttl=USER_PROFILE_CACHE_TTL, maxsize=USER_PROFILE_CACHE_MAXSIZE, name="user_ids",
+                         shared=True)
+playlist_cache = TTLCache(ttl=USER_PROFILE_CACHE_TTL, maxsize=USER_PROFILE_CACHE_MAXSIZE, name="mood_playlists",
+                          shared=True)
+
+CACHES = (spotify_response_cache, user_profile_cache, user_id_cache, playlist_cache)
+
+
+def _cache_lookups():
+    return {(cache.name, stat): value for cache in CACHES
+            for stat, value in cache.stats().items() if stat in ("hits", "misses", "stale_hits", "l2_hits")}
+
+
+def _cache_hit_ratios():
+    ratios = {}
+    for cache in CACHES:
+        stats = cache.stats()
+        served = stats["hits"] + stats["stale_hits"] + stats["l2_hits"]
+        lookups = served + stats["misses"]
+        ratios[(cache.name,)] = round(served / lookups, 4) if lookups else None
+    return ratios
+
+
+registry.counter_callback("cache_lookups_total", "Cache lookups per cache and outcome since start.", _cache_lookups,
+                          labels=("cache", "outcome"))
+registry.gauge("cache_hit_ratio", "Share of lookups served from cache (fresh or stale).", _cache_hit_ratios,
+               labels=("cache",))
+registry.gauge("cache_entries", "Entries currently held per cache.",
+               lambda: {(cache.name,): cache.stats()["size"] for cache in CACHES}, labels=("cache",))
+
+
+def token_key(access_token):
+    """hash the access token so raw tokens are never kept as cache keys."""
+    return hashlib.sha256(access_token.encode("utf-8")).hexdigest()
+
+
+def invalidate_user_profile(access_token=None):
+    """
+    drop the cached profile (and user id) for a token, or every profile if no token is given.
+    Shared (L2) entries go too, copies other workers already hold locally live out their ttl.
+    """
+    if access_token:
+        user_profile_cache.invalidate(token_key(access_token))
+        user_id_cache.invalidate(token_key(access_token))
+    else:
+        user_profile_cache.clear()
+        user_id_cache.clear()
+
+
+class CachedSpotify:
+    """
+    Wraps a spotipy client and caches the public, non user endpoints.
+    Everything else is passed straight through to the wrapped client.
+    """
+
+    CACHED_METHODS = {"search", "artist_top_tracks"}
+
+    def __init__(self, sp, cache=spotify_response_cache):
+        self._sp = sp
+        self._cache = cache
+
+    def __getattr__(self, name):
+        attr = getattr(self._sp, name)
+        if name not in self.CACHED_METHODS:
+            return attr
+
+        def cached_call(*args, **kwargs):
+            key = (name, args, tuple(sorted(kwargs.items())))
+            return self._cache.get_or_load(key, lambda: attr(*args, **kwargs))
+
+        return cached_call
@@ -0,0 +1,260 @@
+"""
+Local emotion -> track catalog for anonymous recommendations.
+
+A snapshot of tracks per mood genre is stored in SQLite and loaded into memory,
+so /recommend/{emotion} can sample from it without calling Spotify.
+
+    python -m recommendation.catalog build            # offline build (atomic swap)
+    python -m recommendation.catalog status           # size and staleness
+"""
+import argparse
+import logging
+import os
+import random
+import sqlite3
+import tempfile
+import threading
+import time
+
+from metrics import registry
+from .recommender import MOOD_GENRE_MAPPING
+
+# setting up the logger
+logger = logging.getLogger(__name__)
+
+# where the snapshot lives
+CATALOG_PATH = os.getenv("CATALOG_PATH", "catalog.sqlite3")
+
+# tracks fetched per mood genre when building (Spotify search allows 50 per page)
+CATALOG_TRACKS_PER_GENRE = int(os.getenv("CATALOG_TRACKS_PER_GENRE", "50"))
+
+# rebuild the snapshot in the background every N seconds (0 = only offline builds)
+CATALOG_REFRESH_SECONDS = float(os.getenv("CATALOG_REFRESH_SECONDS", "0"))
+
+# how often the serving side checks the file for a newer snapshot (seconds)
+CATALOG_RELOAD_CHECK_SECONDS = 5
+
+# emotions the API accepts that are stored under another mood
+CATALOG_EMOTION_ALIASES = {"calm": "neutral"}
+
+SCHEMA = """
+CREATE TABLE tracks (
+    emotion TEXT NOT NULL,
+    genre TEXT NOT NULL,
+    track_id TEXT NOT NULL,
+    title TEXT NOT NULL,
+    artist TEXT NOT NULL,
+    url TEXT NOT NULL
+);
+CREATE INDEX tracks_by_emotion_genre ON tracks (emotion, genre);
+CREATE TABLE meta (key TEXT PRIMARY KEY, value TEXT NOT NULL);
+"""
+
+
+def fetch_genre_tracks(sp, genre, limit=CATALOG_TRACKS_PER_GENRE):
+    """search Spotify for tracks of one genre, paging 50 at a time."""
+    items = []
+    while len(items) < limit:
+        page_size = min(50, limit - len(items))
+        results = sp.search(q=f'genre:"{genre}"', type="track", limit=page_size, offset=len(items))
+        page = (results or {}).get("tracks", {}).get("items", [])
+        items.extend(item for item in page if item)
+        if len(page) < page_size:
+            break
+    return items
+
+
+def build_catalog(sp, path=CATALOG_PATH, tracks_per_genre=CATALOG_TRACKS_PER_GENRE):
+    """
+    Build a new snapshot from Spotify and swap it in atomically.
+    Readers either see the old file or the complete new one, never a half written one.
+    Returns the number of tracks stored, 0 (and the old snapshot is kept) if no genre could be fetched.
+    """
+    rows = []
+    for emotion, genres in MOOD_GENRE_MAPPING.items():
+        for genre in genres:
+            try:
+                items = fetch_genre_tracks(sp, genre, tracks_per_genre)
+            except Exception as e:
+                logger.warning(f"catalog: skipping genre '{genre}': {str(e)}")
+                continue
+            rows.extend(
+                (emotion, genre, item["id"], item["name"],
+                 ", ".join(artist["name"] for artist in item["artists"]),
+                 item["external_urls"]["spotify"])
+                for item in items
+            )
+
+    if not rows:
+        # e.g. Spotify down or rate limited, an empty snapshot would replace a good one
+        logger.warning(f"catalog: no tracks fetched, keeping the current snapshot at {path}")
+        return 0
+
+    # a temp file of our own, several workers may be building at the same time
+    fd, tmp_path = tempfile.mkstemp(prefix=f"{os.path.basename(path)}.", suffix=".building",
+                                    dir=os.path.dirname(os.path.abspath(path)))
+    os.close(fd)
+    try:
+        conn = sqlite3.connect(tmp_path)
+        try:
+            conn.executescript(SCHEMA)
+            conn.executemany("INSERT INTO tracks VALUES (?, ?, ?, ?, ?, ?)", rows)
+            conn.execute("INSERT INTO meta VALUES ('built_at', ?)", (str(time.time()),))
+            conn.commit()
+        finally:
+            conn.close()
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    logger.info(f"catalog: built {len(rows)} tracks into {path}")
+    return len(rows)
+
+
+class TrackCatalog:
+    """
+    In memory index of the SQLite snapshot (emotion -> list of songs).
+    Picks up a newer snapshot file automatically, the swap is a single reference assignment.
+    """
+
+    def __init__(self, path=CATALOG_PATH):
+        self.path = path
+        self._index = {}
+        self._built_at = None
+        self._mtime = None
+        self._last_check = 0.0
+        self._lock = threading.Lock()
+
+    def load(self):
+        """(re)load the snapshot from disk, returns False if there is none."""
+        if not os.path.exists(self.path):
+            return False
+
+        mtime = os.path.getmtime(self.path)
+        conn = sqlite3.connect(f"file:{self.path}?mode=ro", uri=True)
+        try:
+            index = {}
+            for emotion, title, artist, url in conn.execute("SELECT emotion, title, artist, url FROM tracks"):
+                index.setdefault(emotion, []).append({"title": title, "artist": artist, "url": url})
+            built_at = conn.execute("SELECT value FROM meta WHERE key = 'built_at'").fetchone()
+        finally:
+            conn.close()
+
+        # swap the whole index at once so readers never see a mix of snapshots
+        self._index = index
+        self._built_at = float(built_at[0]) if built_at else mtime
+        self._mtime = mtime
+        return True
+
+    def _reload_if_changed(self):
+        now = time.monotonic()
+        if now - self._last_check < CATALOG_RELOAD_CHECK_SECONDS:
+            return
+        with self._lock:
+            if now - self._last_check < CATALOG_RELOAD_CHECK_SECONDS:
+                return
+            self._last_check = now
+            try:
+                if os.path.exists(self.path) and os.path.getmtime(self.path) != self._mtime:
+                    self.load()
+            except Exception as e:
+                logger.error(f"catalog: failed to load {self.path}: {str(e)}")
+
+    def sample(self, emotion, count):
+        """random songs for an emotion, an empty list if the catalog has none."""
+        self._reload_if_changed()
+        songs = self._index.get(CATALOG_EMOTION_ALIASES.get(emotion, emotion), [])
+        if not songs:
+            return []
+        return random.sample(songs, min(count, len(songs)))
+
+    def staleness_seconds(self):
+        """seconds since the loaded snapshot was built, None if nothing is loaded."""
+        self._reload_if_changed()
+        return time.time() - self._built_at if self._built_at else None
+
+    def status(self):
+        return {
+            "path": self.path,
+            "tracks": sum(len(songs) for songs in self._index.values()),
+            "built_at": self._built_at,
+            "staleness_seconds": self.staleness_seconds(),
+        }
+
+
+_catalog = None
+_catalog_lock = threading.Lock()
+
+
+def get_catalog():
+    """process wide catalog, also starts the background refresh if CATALOG_REFRESH_SECONDS is set."""
+    global _catalog
+    with _catalog_lock:
+        if _catalog is None:
+            _catalog = TrackCatalog()
+            _catalog.load()
+            if CATALOG_REFRESH_SECONDS > 0:
+                threading.Thread(target=_refresh_forever, args=(CATALOG_REFRESH_SECONDS,), daemon=True).start()
+        return _catalog
+
+
+registry.gauge("catalog_staleness_seconds", "Seconds since the loaded catalog snapshot was built.",
+               lambda: _catalog.staleness_seconds() if _catalog else None)
+
+
+def catalog_client():
+    """
+    Spotify client for builds: the app client through the scheduler but without CachedSpotify,
+    a rebuild has to see fresh search results and shouldn't fill the shared response cache.
+    """
+    from .scheduler import ScheduledSpotify
+    from .spotify_auth import get_app_client
+
+    return ScheduledSpotify(get_app_client())
+
+
+def _refresh_forever(interval):
+    while True:
+        catalog = _catalog
+        staleness = catalog.staleness_seconds()
+        if staleness is not None and staleness < interval:
+            time.sleep(interval - staleness)
+            continue
+        try:
+            if not build_catalog(catalog_client(), catalog.path):
+                time.sleep(min(interval, 300))  # nothing fetched, don't retry straight away
+            catalog.load()
+        except Exception as e:
+            logger.error(f"catalog: background refresh failed: {str(e)}", exc_info=True)
+            time.sleep(min(interval, 300))
+
+
+def main():
+    from dotenv import load_dotenv
+
+    load_dotenv()
+
+    parser = argparse.ArgumentParser(description="Build or inspect the local track catalog.")
+    parser.add_argument("command", choices=["build", "status"])
+    # this module's settings were read before .env was loaded, look again
+    parser.add_argument("--path", default=os.getenv("CATALOG_PATH", CATALOG_PATH))
+    parser.add_argument("--per-genre", type=int,
+                        default=int(os.getenv("CATALOG_TRACKS_PER_GENRE", str(CATALOG_TRACKS_PER_GENRE))))
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+
+    if args.command == "build":
+        count = build_catalog(catalog_client(), args.path, args.per_genre)
+        if not count:
+            raise SystemExit(f"no tracks fetched, {args.path} left as it was")
+        print(f"built {count} tracks into {args.path}")
+    else:
+        catalog = TrackCatalog(args.path)
+        catalog.load()
+        print(catalog.status())
+
+
+if __name__ == "__main__":
+    main()
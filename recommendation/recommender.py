@@ -1,6 +1,13 @@
+import contextvars
 import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+from spotipy.exceptions import SpotifyException
 from .spotify_auth import get_spotify_client
-from .spotify_utils import format_song_response
+from .cache import playlist_cache, user_id_cache, user_profile_cache, token_key
+from .spotify_utils import format_track_response
+from .tracks import Track
+from .scoring import ScoringEngine
 import random
 
 # logger
@@ -19,11 +26,33 @@ MOOD_GENRE_MAPPING = {
 FALLBACK_ARTIST_ID = "4NHQUGzhtTLFvgF5SZesLK"
 FALLBACK_TRACKS = ["3n3Ppam7vgaVa1iaRUc9Lp"]
 
+# max number of spotify calls sent at once per request (1 = run them one after another)
+SPOTIFY_MAX_CONCURRENCY = int(os.getenv("SPOTIFY_MAX_CONCURRENCY", "5"))
+
+# songs returned per recommendation, and how many come from each top artist
+MAX_RECOMMENDATIONS = 30
+TRACKS_PER_ARTIST = 5
+
+# reuse the user's existing "<Emotion> Vibes" playlist and only add / remove changed tracks,
+# instead of creating a new playlist on every run
+PLAYLIST_UPDATE_IN_PLACE = os.getenv("PLAYLIST_UPDATE_IN_PLACE", "true").lower() in ("1", "true", "yes")
+
+# genre vocabulary / mood matrix shared by every request
+scoring_engine = ScoringEngine(MOOD_GENRE_MAPPING)
+
+def format_recommendations(tracks):
+    """API output for recommend_tracks results (None means the Spotify calls failed)."""
+    if tracks is None:
+        return {"error": "Spotify API request failed"}
+    return format_track_response(tracks)
+
 class EmotionRecommender:
-    def __init__(self, user_authenticated=False, user_token=None):
+    def __init__(self, user_authenticated=False, user_token=None, max_concurrency=None):
         """initialise the recommender system with spotifiy"""
         self.sp = get_spotify_client(user_authenticated, user_token)
         self.user_authenticated = user_authenticated
+        self.user_token = user_token
+        self.max_concurrency = max_concurrency or SPOTIFY_MAX_CONCURRENCY
 
         if not self.sp:
             logger.error("Spotify client initialization failed.")
@@ -77,89 +106,215 @@ class EmotionRecommender:
             }
 
     
-    def get_top_artists_tracks_genres(self):
-        """get the users top artists, tracks, and genres."""
+    def get_taste_profile(self):
+        """
+        get the users top artists, tracks and genres as a dict.
+        profiles are cached per token so repeat calls skip the two heavy user API calls.
+        """
         if not self.user_authenticated:
-            return [], [], [], []
+            return None
+
+        cache_key = token_key(self.user_token) if self.user_token else None
+        if cache_key:
+            profile = user_profile_cache.get(cache_key)
+            if profile is not None:
+                return profile
 
         try:
             top_artists_response = self.sp.current_user_top_artists(limit=50, time_range='medium_term')
             artist_data = [(artist['name'], artist['id'], artist['genres']) for artist in top_artists_response.get('items', [])]
-            artist_names = [artist[0] for artist in artist_data]
-            artist_ids = [artist[1] for artist in artist_data]
-            genres = list(set(genre for artist in artist_data for genre in artist[2]))
 
             top_tracks_response = self.sp.current_user_top_tracks(limit=50, time_range='medium_term')
             track_ids = [track['id'] for track in top_tracks_response.get('items', [])]
-
-            return artist_names, artist_ids, track_ids, genres
         except Exception as e:
             logger.error(f"Error fetching users top artists/tracks/genres: {str(e)}")
+            return None
+
+        profile = {
+            "artist_names": [artist[0] for artist in artist_data],
+            "artist_ids": [artist[1] for artist in artist_data],
+            "artist_genres": [artist[2] for artist in artist_data],
+            "track_ids": track_ids,
+            "genres": list(set(genre for artist in artist_data for genre in artist[2])),
+        }
+
+        if cache_key:
+            user_profile_cache.set(cache_key, profile)
+        return profile
+
+    def get_top_artists_tracks_genres(self):
+        """get the users top artists, tracks, and genres."""
+        profile = self.get_taste_profile()
+        if not profile:
             return [], [], [], []
 
-    def recommend_songs(self, emotion):
-        """generate song recomendations based on user preferences and mood genre mapping."""
+        return profile["artist_names"], profile["artist_ids"], profile["track_ids"], profile["genres"]
+
+    def _fan_out(self, fn, args):
+        """
+        Call fn once per arg, sending up to max_concurrency calls at once.
+        Results come back in the same order as args so the output stays deterministic.
+        """
+        args = list(args)
+        if self.max_concurrency <= 1 or len(args) <= 1:
+            return [fn(arg) for arg in args]
+
+        # each call runs in a copy of the caller's context so timing traces follow the request
+        with ThreadPoolExecutor(max_workers=min(self.max_concurrency, len(args))) as executor:
+            futures = [executor.submit(contextvars.copy_context().run, fn, arg) for arg in args]
+            return [future.result() for future in futures]
+
+    def recommend_songs(self, emotion, breakdown=None):
+        """
+        generate song recomendations based on user preferences and mood genre mapping.
+        breakdown ({emotion: percentage}, as sent by colab) blends the moods of the top emotions.
+        """
         if not self.sp:
             return {"error": "Spotify authentication failed"}
 
-        top_artists, top_artist_ids, top_tracks, user_genres = self.get_top_artists_tracks_genres()
+        return format_recommendations(self.recommend_tracks(emotion, breakdown))
+
+    def recommend_tracks(self, emotion, breakdown=None):
+        """
+        same as recommend_songs but returns compact Track records (None if Spotify failed),
+        so callers like create_playlist can work with ids instead of urls.
+        """
+        profile = self.get_taste_profile() or {}
+        top_artist_ids = profile.get("artist_ids", [])
+        artist_genres = profile.get("artist_genres", [])
+        top_tracks = profile.get("track_ids", [])
+        user_genres = profile.get("genres", [])
+
+        mood = scoring_engine.mood_vector(emotion, breakdown)
+        taste = scoring_engine.taste_vector(artist_genres) if artist_genres else None
         mood_genres = MOOD_GENRE_MAPPING.get(emotion, [])
-        matched_genres = [genre for genre in user_genres if genre in mood_genres]
-
-        valid_artist_ids = [artist_id for artist_id, genres in zip(top_artist_ids, user_genres) if any(g in mood_genres for g in genres)][:5]
+        matched_genres = scoring_engine.rank_genres(user_genres, mood)
+
+        # top artists whose own genres fit the mood best
+        artist_scores = scoring_engine.score(artist_genres, mood)
+        valid_artist_ids = [
+            top_artist_ids[i] for i in scoring_engine.rank(artist_scores, top_artist_ids, top_artist_ids, top_n=5)
+            if artist_scores[i] > 0
+        ]
         valid_tracks = top_tracks[:5] if top_tracks else FALLBACK_TRACKS
-        valid_genres = matched_genres[:5] if matched_genres else mood_genres[:5]
+        valid_genres = matched_genres[:5] if matched_genres else (
+            scoring_engine.rank_genres(list(dict.fromkeys(mood_genres + scoring_engine.genres)), mood)[:5]
+        )
+        genres_by_artist = dict(zip(top_artist_ids, artist_genres))
 
+        # compact records tagged with the genres they were found through (used for ranking),
+        # the raw spotipy dicts are dropped as soon as each response is read
         all_recommendations = []
 
         try:
-            # get songs based on top artists
-            for artist_id in valid_artist_ids:
-                top_tracks_by_artist = self.sp.artist_top_tracks(artist_id)['tracks'][:5]
-                all_recommendations.extend(top_tracks_by_artist)
+            # get songs based on top artists (all artists fetched at once)
+            artist_results = self._fan_out(self.sp.artist_top_tracks, valid_artist_ids)
+            for artist_id, result in zip(valid_artist_ids, artist_results):
+                genres = genres_by_artist.get(artist_id, ())
+                all_recommendations.extend(
+                    Track.from_api(item, genres) for item in result['tracks'][:TRACKS_PER_ARTIST] if item
+                )
 
             # fallback 1: Fetch songs based on genres
             if len(all_recommendations) < 30 and valid_genres:
-                for genre in valid_genres:
-                    search_results = self.sp.search(q=f'genre:"{genre}"', type="track", limit=10)
+                genre_results = self._fan_out(
+                    lambda genre: self.sp.search(q=f'genre:"{genre}"', type="track", limit=10),
+                    valid_genres
+                )
+                # extend in the original genre order so the 30 track cutoff picks the same songs
+                for genre, search_results in zip(valid_genres, genre_results):
                     if search_results and "tracks" in search_results and "items" in search_results["tracks"]:
-                        all_recommendations.extend(search_results["tracks"]["items"])
+                        all_recommendations.extend(
+                            Track.from_api(item, (genre,)) for item in search_results["tracks"]["items"] if item
+                        )
                         if len(all_recommendations) >= 30:
                             break
 
             # Last fallback: Use top tracks
             if len(all_recommendations) < 30 and valid_tracks:
-                for track_id in valid_tracks:
-                    track_info = self.sp.track(track_id)
+                track_results = self._fan_out(self.sp.track, valid_tracks)
+                for track_info in track_results:
                     if track_info:
-                        all_recommendations.append(track_info)
+                        genres = [g for artist in track_info["artists"] for g in genres_by_artist.get(artist["id"], ())]
+                        all_recommendations.append(Track.from_api(track_info, genres))
                         if len(all_recommendations) >= 30:
                             break
 
-            return format_song_response({"tracks": {"items": all_recommendations}})
+            # rank the pool against the (blended) mood, ties keep the fetch order
+            scores = scoring_engine.score([track.genres for track in all_recommendations], mood, taste)
+            picked = scoring_engine.rank(
+                scores,
+                artist_keys=[track.main_artist_id for track in all_recommendations],
+                item_keys=[track.id for track in all_recommendations],
+                top_n=MAX_RECOMMENDATIONS,
+                max_per_artist=TRACKS_PER_ARTIST,
+            )
+            return [all_recommendations[i] for i in picked]
         except Exception as e:
             logger.error(f"Error fetching recommended songs: {str(e)}", exc_info=True)
-            return {"error": "Spotify API request failed"}
+            return None
         
 
-    def create_playlist(self, emotion, access_token):
-        """Create a balanced Spotify playlist based on emotion."""
+    def get_user_id(self):
+        """the users Spotify id, cached per token so repeat playlist runs skip current_user()."""
+        cache_key = token_key(self.user_token) if self.user_token else None
+        user_id = user_id_cache.get(cache_key) if cache_key else None
+        if user_id is None:
+            user_id = self.sp.current_user()["id"]
+            if cache_key:
+                user_id_cache.set(cache_key, user_id)
+        return user_id
+
+    def find_mood_playlist(self, user_id, playlist_name):
+        """the users own playlist with this name, or None."""
+        cache_key = (user_id, playlist_name)
+        playlist = playlist_cache.get(cache_key)
+        if playlist is not None:
+            return playlist
+
+        offset = 0
+        while True:
+            page = self.sp.current_user_playlists(limit=50, offset=offset)
+            items = page.get("items", []) if page else []
+            for item in items:
+                if item and item.get("name") == playlist_name and item.get("owner", {}).get("id") == user_id:
+                    playlist_cache.set(cache_key, item)
+                    return item
+            if not page or not page.get("next"):
+                return None
+            offset += len(items)
+
+    def get_playlist_track_uris(self, playlist_id):
+        """uris of every track currently in a playlist."""
+        uris = []
+        offset = 0
+        while True:
+            page = self.sp.playlist_items(playlist_id, fields="items(track(uri)),next", limit=100, offset=offset)
+            items = page.get("items", []) if page else []
+            uris.extend(item["track"]["uri"] for item in items if item and item.get("track"))
+            if not page or not page.get("next"):
+                return uris
+            offset += len(items)
+
+    def create_playlist(self, emotion, access_token, recommendations=None, update_in_place=None):
+        """
+        Create a balanced Spotify playlist based on emotion.
+
+        recommendations (Track records from recommend_tracks) can be passed in when they were
+        already fetched, so the recommender doesn't run twice.
+        With update_in_place (default PLAYLIST_UPDATE_IN_PLACE) the users existing "<Emotion> Vibes"
+        playlist is reused and only the tracks that changed are added / removed.
+        """
         if not self.sp:
             return {"error": "Spotify authentication failed"}
 
+        if update_in_place is None:
+            update_in_place = PLAYLIST_UPDATE_IN_PLACE
+
         try:
-            # Get user's Spotify ID
-            user_id = self.sp.current_user()["id"]
-            playlist_name = f"{emotion.capitalize()} Vibes"
-            
-            # Create a private playlist
-            playlist = self.sp.user_playlist_create(user=user_id, name=playlist_name, public=False)
-            playlist_id = playlist["id"]
-            
             # get song recommendations
-            recommendation_response = self.recommend_songs(emotion)  
-            song_recommendations = recommendation_response # Ensures that its a list
-            
+            song_recommendations = recommendations if recommendations is not None else self.recommend_tracks(emotion)
+
             if not song_recommendations:
                 return {"error": "No recommendations found to create a playlist"}
 
@@ -168,7 +323,7 @@ class EmotionRecommender:
             balanced_tracks = []
             
             for track in song_recommendations:
-                artist = track["artist"]
+                artist = track.main_artist_id
                 if artist not in unique_artists:
                     unique_artists[artist] = 0  # track artist occurrences
                 if unique_artists[artist] < 3:  # max 2 songs per artist
@@ -184,23 +339,55 @@ class EmotionRecommender:
             for track in balanced_tracks:
                 if len(genre_diverse_tracks) >= 20:  # sets playlist size
                     break
-                if track["artist"] in seen_genres:
+                if track.main_artist_id in seen_genres:
                     continue
                 genre_diverse_tracks.append(track)
-                seen_genres.add(track["artist"])
+                seen_genres.add(track.main_artist_id)
 
-            # convert to Spotify track URI
-            track_uris = [track["url"].replace("https://open.spotify.com/track/", "spotify:track:") for track in genre_diverse_tracks]
+            # Spotify track URIs straight from the ids
+            track_uris = [track.uri for track in genre_diverse_tracks]
+
+            # Get user's Spotify ID
+            user_id = self.get_user_id()
+            playlist_name = f"{emotion.capitalize()} Vibes"
 
-            # Add songs to playlist
-            if track_uris:
-                self.sp.playlist_add_items(playlist_id, track_uris)
+            playlist = self.find_mood_playlist(user_id, playlist_name) if update_in_place else None
+            current_uris = []
+            if playlist is not None:
+                try:
+                    current_uris = self.get_playlist_track_uris(playlist["id"])
+                except SpotifyException as e:
+                    if e.http_status != 404:
+                        raise
+                    # the user deleted the playlist since it was cached
+                    playlist_cache.invalidate((user_id, playlist_name))
+                    playlist = None
+
+            created = playlist is None
+            if created:
+                # Create a private playlist
+                playlist = self.sp.user_playlist_create(user=user_id, name=playlist_name, public=False)
+                if update_in_place:
+                    playlist_cache.set((user_id, playlist_name), playlist)
+
+            # only send what changed
+            wanted = set(track_uris)
+            current = set(current_uris)
+            to_remove = list(dict.fromkeys(uri for uri in current_uris if uri not in wanted))
+            to_add = [uri for uri in track_uris if uri not in current]
+
+            for start in range(0, len(to_remove), 100):
+                self.sp.playlist_remove_all_occurrences_of_items(playlist["id"], to_remove[start:start + 100])
+            for start in range(0, len(to_add), 100):
+                self.sp.playlist_add_items(playlist["id"], to_add[start:start + 100])
 
             return {
-                "message": "Playlist created successfully!",
-                "playlist_url": playlist["external_urls"]["spotify"]
+                "message": "Playlist created successfully!" if created else "Playlist updated successfully!",
+                "playlist_url": playlist["external_urls"]["spotify"],
+                "tracks_added": len(to_add),
+                "tracks_removed": len(to_remove),
             }
         
         except Exception as e:
             logger.error(f"Error creating playlist: {str(e)}", exc_info=True)
-            return {"error": "Failed to create playlist"}
\ No newline at end of file
+            return {"error": "Failed to create playlist"}
@@ -0,0 +1,243 @@
+import heapq
+import itertools
+import logging
+import os
+import threading
+import time
+from concurrent.futures import Future
+
+from spotipy.exceptions import SpotifyException
+
+from metrics import SPOTIFY_CALLS, SPOTIFY_LATENCY, add_span, registry
+
+# setting up the logger
+logger = logging.getLogger(__name__)
+
+# process wide request budget towards Spotify (token bucket)
+SPOTIFY_RATE_LIMIT = float(os.getenv("SPOTIFY_RATE_LIMIT", "10"))  # requests per second
+SPOTIFY_BURST = int(os.getenv("SPOTIFY_BURST", "20"))  # requests allowed at once after an idle period
+
+# how often a 429 response is retried, and the longest Retry-After we are willing to sleep
+SPOTIFY_MAX_RETRIES = int(os.getenv("SPOTIFY_MAX_RETRIES", "3"))
+SPOTIFY_MAX_RETRY_AFTER = float(os.getenv("SPOTIFY_MAX_RETRY_AFTER", "30"))
+
+# lower number = served first
+PRIORITY_WRITE = 0  # playlist creation / updates
+PRIORITY_USER = 1  # user scoped reads
+PRIORITY_FALLBACK = 2  # speculative public fetches (genre search, top tracks)
+
+METHOD_PRIORITIES = {
+    "current_user": PRIORITY_WRITE,
+    "current_user_playlists": PRIORITY_WRITE,
+    "playlist_items": PRIORITY_WRITE,
+    "user_playlist_create": PRIORITY_WRITE,
+    "playlist_add_items": PRIORITY_WRITE,
+    "playlist_remove_all_occurrences_of_items": PRIORITY_WRITE,
+    "playlist_replace_items": PRIORITY_WRITE,
+    "search": PRIORITY_FALLBACK,
+    "artist_top_tracks": PRIORITY_FALLBACK,
+    "track": PRIORITY_FALLBACK,
+    "tracks": PRIORITY_FALLBACK,
+}
+
+# public endpoints whose identical concurrent calls (through the same client) are merged into one upstream request
+COALESCED_METHODS = {"search", "artist_top_tracks", "track", "tracks"}
+
+
+class SpotifyScheduler:
+    """
+    Gate in front of every Spotify request of the process.
+
+    - token bucket: at most `rate` requests per second with bursts of `burst`
+    - priority: when requests queue up, lower priority numbers go first
+    - 429 handling: Retry-After pauses the whole process, then the request is retried
+    - single flight: identical concurrent calls (same key) share one upstream request
+    """
+
+    def __init__(self, rate=SPOTIFY_RATE_LIMIT, burst=SPOTIFY_BURST, max_retries=SPOTIFY_MAX_RETRIES,
+                 max_retry_after=SPOTIFY_MAX_RETRY_AFTER):
+        self.rate = rate
+        self.burst = burst
+        self.max_retries = max_retries
+        self.max_retry_after = max_retry_after
+
+        self._cond = threading.Condition()
+        self._tokens = float(burst)
+        self._last_refill = time.monotonic()
+        self._blocked_until = 0.0
+        self._waiting = []  # heap of (priority, ticket number)
+        self._tickets = itertools.count()
+
+        self._inflight = {}  # key -> Future of the leading call
+        self._inflight_lock = threading.Lock()
+
+        # counters
+        self.requests = 0
+        self.rate_limited = 0
+        self.coalesced = 0
+
+    def call(self, fn, priority=PRIORITY_USER, key=None):
+        """run fn() within the budget. calls with the same key at the same time share one result."""
+        if key is None:
+            return self._run(fn, priority)
+
+        with self._inflight_lock:
+            future = self._inflight.get(key)
+            leader = future is None
+            if leader:
+                future = Future()
+                self._inflight[key] = future
+            else:
+                self.coalesced += 1
+
+        if not leader:
+            return future.result()
+
+        try:
+            result = self._run(fn, priority)
+            future.set_result(result)
+            return result
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        finally:
+            with self._inflight_lock:
+                self._inflight.pop(key, None)
+
+    def _run(self, fn, priority):
+        attempt = 0
+        while True:
+            self.acquire(priority)
+            try:
+                return fn()
+            except SpotifyException as e:
+                if e.http_status != 429 or attempt >= self.max_retries:
+                    raise
+                attempt += 1
+                self.rate_limited += 1
+                wait = self._retry_after(e)
+                logger.warning(f"Spotify rate limit hit, pausing requests for {wait:.1f}s (retry {attempt})")
+                self.pause(wait)
+
+    def _retry_after(self, error):
+        headers = getattr(error, "headers", None) or {}
+        try:
+            wait = float(headers.get("Retry-After", 1))
+        except (TypeError, ValueError):
+            wait = 1.0
+        return min(max(wait, 0.0), self.max_retry_after)
+
+    def pause(self, seconds):
+        """stop handing out requests for `seconds` (e.g. after a 429)."""
+        with self._cond:
+            self._blocked_until = max(self._blocked_until, time.monotonic() + seconds)
+            self._tokens = 0.0
+            self._cond.notify_all()
+
+    def acquire(self, priority=PRIORITY_USER):
+        """block until this caller may send one request."""
+        with self._cond:
+            ticket = (priority, next(self._tickets))
+            heapq.heappush(self._waiting, ticket)
+            try:
+                while True:
+                    now = time.monotonic()
+                    self._refill(now)
+                    timeout = None  # not first in line, wait to be woken up
+                    if self._waiting[0] == ticket:
+                        if now < self._blocked_until:
+                            timeout = self._blocked_until - now
+                        elif self._tokens >= 1:
+                            self._tokens -= 1
+                            heapq.heappop(self._waiting)
+                            self.requests += 1
+                            self._cond.notify_all()
+                            return
+                        else:
+                            timeout = (1 - self._tokens) / self.rate
+                    self._cond.wait(timeout=timeout)
+            except BaseException:
+                self._waiting.remove(ticket)
+                heapq.heapify(self._waiting)
+                self._cond.notify_all()
+                raise
+
+    def _refill(self, now):
+        self._tokens = min(self.burst, self._tokens + (now - self._last_refill) * self.rate)
+        self._last_refill = now
+
+    def stats(self):
+        with self._cond:
+            queued = len(self._waiting)
+        return {
+            "requests": self.requests,
+            "rate_limited": self.rate_limited,
+            "coalesced": self.coalesced,
+            "queued": queued,
+        }
+
+
+# process wide scheduler shared by every Spotify client
+spotify_scheduler = SpotifyScheduler()
+
+registry.counter_callback("spotify_scheduler_requests_total", "Spotify calls sent through the scheduler.",
+                          lambda: spotify_scheduler.stats()["requests"])
+registry.counter_callback("spotify_scheduler_rate_limited_total", "429 responses seen by the scheduler.",
+                          lambda: spotify_scheduler.stats()["rate_limited"])
+registry.counter_callback("spotify_scheduler_coalesced_total", "Identical in-flight Spotify calls that shared one request.",
+                          lambda: spotify_scheduler.stats()["coalesced"])
+registry.gauge("spotify_scheduler_queue_length", "Spotify calls waiting for a scheduler token.",
+               lambda: spotify_scheduler.stats()["queued"])
+
+
+class ScheduledSpotify:
+    """
+    Wraps a spotipy client so every API call goes through the scheduler,
+    with a priority picked from the method name.
+    """
+
+    def __init__(self, sp, scheduler=spotify_scheduler):
+        self._sp = sp
+        self._scheduler = scheduler
+
+    def __getattr__(self, name):
+        attr = getattr(self._sp, name)
+        if not callable(attr):
+            return attr
+
+        priority = METHOD_PRIORITIES.get(name, PRIORITY_USER)
+
+        def scheduled_call(*args, **kwargs):
+            key = _call_key(self._sp, name, args, kwargs) if name in COALESCED_METHODS else None
+            start = time.perf_counter()
+            outcome = "ok"
+            try:
+                return self._scheduler.call(lambda: attr(*args, **kwargs), priority=priority, key=key)
+            except SpotifyException as e:
+                outcome = str(e.http_status)
+                raise
+            except Exception:
+                outcome = "error"
+                raise
+            finally:
+                elapsed = time.perf_counter() - start
+                SPOTIFY_CALLS.inc(endpoint=name, outcome=outcome)
+                SPOTIFY_LATENCY.observe(elapsed, endpoint=name)
+                add_span(f"spotify.{name}", elapsed)
+
+        return scheduled_call
+
+
+def _call_key(sp, name, args, kwargs):
+    """
+    hashable key for a call, None if the arguments can't be hashed (e.g. lists of ids).
+    Only calls through the same client are merged: a user's call failing with their token
+    (e.g. a 401) must not fail the app client's calls, or another user's. The client is
+    alive while its call is in flight, so its id() can't be reused meanwhile.
+    """
+    key = (id(sp), name, args, tuple(sorted(kwargs.items())))
+    try:
+        hash(key)
+    except TypeError:
+        return None
+    return key
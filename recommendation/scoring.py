@@ -0,0 +1,111 @@
+import numpy as np
+
+# emotions without a genre list of their own are scored with the closest mood
+EMOTION_ALIASES = {"calm": "neutral", "surprise": "happy", "fear": "sad", "disgust": "angry"}
+
+# how much a genre the user already listens to adds to a candidate's score
+USER_TASTE_WEIGHT = 0.25
+
+# diversity: at most this many tracks by the same (first) artist in a ranking
+MAX_TRACKS_PER_ARTIST = 3
+
+
+class ScoringEngine:
+    """
+    Ranks artists and tracks against a mood using genre vectors.
+
+    Every genre gets a column in a vocabulary matrix. Moods, artists and candidate
+    tracks are encoded as rows over that vocabulary, so a whole candidate pool is
+    scored with one matrix-vector product.
+    """
+
+    def __init__(self, mood_genre_mapping):
+        self.emotions = list(mood_genre_mapping)
+        self.genres = []
+        self.genre_index = {}
+        for genres in mood_genre_mapping.values():
+            self._add_genres(genres)
+
+        self.mood_matrix = np.zeros((len(self.emotions), len(self.genres)), dtype=np.float32)
+        for row, emotion in enumerate(self.emotions):
+            self.mood_matrix[row, [self.genre_index[g] for g in mood_genre_mapping[emotion]]] = 1.0
+
+    def _add_genres(self, genres):
+        for genre in genres:
+            if genre not in self.genre_index:
+                self.genre_index[genre] = len(self.genres)
+                self.genres.append(genre)
+
+    def encode(self, genre_lists):
+        """(n, vocabulary) 0/1 matrix, genres outside the mood vocabulary are ignored."""
+        rows, cols = [], []
+        for row, genres in enumerate(genre_lists):
+            for genre in genres:
+                col = self.genre_index.get(genre)
+                if col is not None:
+                    rows.append(row)
+                    cols.append(col)
+        matrix = np.zeros((len(genre_lists), len(self.genres)), dtype=np.float32)
+        matrix[rows, cols] = 1.0
+        return matrix
+
+    def mood_vector(self, emotion, breakdown=None):
+        """
+        Genre weights for a mood. With a breakdown ({emotion: percentage}) the moods of
+        the top emotions are blended by their share, otherwise only `emotion` counts.
+        """
+        weights = np.zeros(len(self.emotions), dtype=np.float32)
+        shares = breakdown if isinstance(breakdown, dict) and breakdown else {emotion: 100.0}
+        for emo, share in shares.items():
+            emo = EMOTION_ALIASES.get(emo, emo)
+            if emo in self.emotions:
+                weights[self.emotions.index(emo)] += float(share)
+
+        if not weights.any():
+            return np.zeros(len(self.genres), dtype=np.float32)
+        return (weights / weights.sum()) @ self.mood_matrix
+
+    def taste_vector(self, genre_lists):
+        """how often each genre shows up in the user's top artists, scaled to 0-1."""
+        counts = self.encode(genre_lists).sum(axis=0)
+        peak = counts.max() if counts.size else 0
+        return counts / peak if peak else counts
+
+    def score(self, genre_lists, mood, taste=None):
+        """
+        Score every row at once: the share of its genres that fit the mood (weighted
+        by the blend), plus a small bonus for genres the user already likes.
+        """
+        matrix = self.encode(genre_lists)
+        genre_counts = np.maximum(matrix.sum(axis=1), 1.0)
+        scores = (matrix @ mood) / genre_counts
+        if taste is not None and taste.any():
+            scores += USER_TASTE_WEIGHT * (matrix @ taste) / genre_counts
+        return scores
+
+    def rank_genres(self, genres, mood):
+        """genres sorted by their mood weight, keeping the given order on ties."""
+        weights = np.array([mood[self.genre_index[g]] if g in self.genre_index else 0.0 for g in genres])
+        order = np.argsort(-weights, kind="stable")
+        return [genres[i] for i in order if weights[i] > 0]
+
+    def rank(self, scores, artist_keys, item_keys, top_n, max_per_artist=MAX_TRACKS_PER_ARTIST):
+        """
+        Indices of the best top_n rows, highest score first (ties keep their original
+        order), skipping duplicate items and artists over max_per_artist.
+        """
+        picked = []
+        per_artist = {}
+        seen_items = set()
+        for i in np.argsort(-scores, kind="stable"):
+            if item_keys[i] in seen_items:
+                continue
+            artist = artist_keys[i]
+            if per_artist.get(artist, 0) >= max_per_artist:
+                continue
+            seen_items.add(item_keys[i])
+            per_artist[artist] = per_artist.get(artist, 0) + 1
+            picked.append(int(i))
+            if len(picked) >= top_n:
+                break
+        return picked
@@ -1,49 +1,196 @@
 import os
+import threading
+import time
+import requests
 import spotipy
-from spotipy.oauth2 import SpotifyOAuth, SpotifyClientCredentials
-from dotenv import load_dotenv
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from spotipy.cache_handler import CacheHandler
+from spotipy.oauth2 import SpotifyOAuth
+import json
 import logging
+from state.backends import get_state_backend
+from .cache import CachedSpotify
+from .scheduler import ScheduledSpotify
 
 # setting up the logger
 logger = logging.getLogger(__name__)
 
-# load environment variables
-load_dotenv()
+# endpoints (can point at a local fake for tests / benchmarks)
+SPOTIFY_API_URL = os.getenv("SPOTIFY_API_URL", "https://api.spotify.com/v1/")
+SPOTIFY_TOKEN_URL = os.getenv("SPOTIFY_TOKEN_URL", "https://accounts.spotify.com/api/token")
 
-# get the Spotify credentials from .env
-SPOTIFY_CLIENT_ID = os.getenv("SPOTIFY_CLIENT_ID")
-SPOTIFY_CLIENT_SECRET = os.getenv("SPOTIFY_CLIENT_SECRET")
-REDIRECT_URI = os.getenv("REDIRECT_URI")
+# keep-alive connections kept open to Spotify, shared by every client in the process
+SPOTIFY_POOL_SIZE = int(os.getenv("SPOTIFY_POOL_SIZE", "20"))
+
+# the app token is refreshed this many seconds before it expires
+TOKEN_REFRESH_MARGIN = float(os.getenv("SPOTIFY_TOKEN_REFRESH_MARGIN", "60"))
+
+SPOTIFY_REQUEST_TIMEOUT = 5
+
+def spotify_credentials():
+    """
+    get the Spotify credentials from the environment (.env is loaded by main.py / the CLIs).
+    read on first use so importing this module never fails.
+    """
+    client_id = os.getenv("SPOTIFY_CLIENT_ID")
+    client_secret = os.getenv("SPOTIFY_CLIENT_SECRET")
+    redirect_uri = os.getenv("REDIRECT_URI")
+
+    if not client_id or not client_secret or not redirect_uri:
+        raise ValueError("Spotify credentials are missing. Double check your .env file.")
+    return client_id, client_secret, redirect_uri
+
+
+_session = None
+_session_lock = threading.Lock()
+
+
+def get_http_session():
+    """process wide requests session with a keep-alive connection pool to Spotify."""
+    global _session
+    with _session_lock:
+        if _session is None:
+            session = requests.Session()
+            retry = Retry(
+                total=3,
+                status_forcelist=(500, 502, 503, 504),
+                # only idempotent methods, a retried POST could create a playlist / add tracks twice
+                allowed_methods=Retry.DEFAULT_ALLOWED_METHODS,
+                backoff_factor=0.3,
+                raise_on_status=False,
+                # 429s go back to SpotifyScheduler (capped backoff, token bucket), not slept on here
+                respect_retry_after_header=False,
+            )
+            adapter = HTTPAdapter(pool_connections=4, pool_maxsize=SPOTIFY_POOL_SIZE, max_retries=retry)
+            session.mount("http://", adapter)
+            session.mount("https://", adapter)
+            _session = session
+        return _session
+
+
+class AppTokenManager:
+    """
+    One client credentials token for the whole process.
+    Refreshed once, under a lock, shortly before it expires. Works as a spotipy auth_manager.
+    """
+
+    def __init__(self, client_id, client_secret, token_url=SPOTIFY_TOKEN_URL,
+                 refresh_margin=TOKEN_REFRESH_MARGIN, session=None):
+        self.client_id = client_id
+        self.client_secret = client_secret
+        self.token_url = token_url
+        self.refresh_margin = refresh_margin
+        self.session = session or get_http_session()
+        self._token = None
+        self._expires_at = 0.0
+        self._lock = threading.Lock()
+
+    def get_access_token(self, as_dict=False):
+        with self._lock:
+            if self._token is None or time.time() >= self._expires_at - self.refresh_margin:
+                self._refresh()
+            if as_dict:
+                return {"access_token": self._token, "expires_at": int(self._expires_at)}
+            return self._token
+
+    def _refresh(self):
+        response = self.session.post(
+            self.token_url,
+            data={"grant_type": "client_credentials"},
+            auth=(self.client_id, self.client_secret),
+            timeout=SPOTIFY_REQUEST_TIMEOUT,
+        )
+        response.raise_for_status()
+        token_info = response.json()
+        self._token = token_info["access_token"]
+        self._expires_at = time.time() + token_info.get("expires_in", 3600)
+        logger.info("fetched a new Spotify app token")
+
+
+class PooledSpotify(spotipy.Spotify):
+    """spotipy client on the shared session, it must not close the pool when it is garbage collected."""
+
+    def __init__(self, **kwargs):
+        super().__init__(requests_session=get_http_session(), requests_timeout=SPOTIFY_REQUEST_TIMEOUT, **kwargs)
+        self.prefix = SPOTIFY_API_URL
+
+    def __del__(self):
+        pass
+
+
+_app_client = None
+_app_client_lock = threading.Lock()
+
+
+def get_app_client():
+    """the one public (client credentials) spotipy client of this process."""
+    global _app_client
+    with _app_client_lock:
+        if _app_client is None:
+            client_id, client_secret, _ = spotify_credentials()
+            _app_client = PooledSpotify(auth_manager=AppTokenManager(client_id, client_secret))
+        return _app_client
+
+class StateTokenCache(CacheHandler):
+    """
+    spotipy token cache kept in the state backend instead of the .cache file,
+    so every worker sees the logged in user's token.
+    A token left in an old .cache file is picked up once.
+    """
+
+    def __init__(self, key="spotify:token", legacy_path=".cache"):
+        self.key = key
+        self.legacy_path = legacy_path
+
+    def get_cached_token(self):
+        token_info = get_state_backend().get(self.key)
+        if token_info is None and self.legacy_path and os.path.exists(self.legacy_path):
+            try:
+                with open(self.legacy_path, "r") as file:
+                    token_info = json.load(file)
+                self.save_token_to_cache(token_info)
+            except (OSError, ValueError) as e:
+                logger.warning(f"could not read token from {self.legacy_path}: {str(e)}")
+                return None
+        return token_info
+
+    def save_token_to_cache(self, token_info):
+        get_state_backend().set(self.key, token_info)
+
+    def clear(self):
+        get_state_backend().delete(self.key)
+        if self.legacy_path and os.path.exists(self.legacy_path):
+            os.remove(self.legacy_path)
 
-if not SPOTIFY_CLIENT_ID or not SPOTIFY_CLIENT_SECRET or not REDIRECT_URI:
-    raise ValueError("Spotify credentials are missing. Double check your .env file.")
 
 def get_spotify_oauth():
     """returns a Spotify0Auth instance with correct configuration."""
+    client_id, client_secret, redirect_uri = spotify_credentials()
     return SpotifyOAuth(
-        client_id=SPOTIFY_CLIENT_ID,
-        client_secret=SPOTIFY_CLIENT_SECRET,
-        redirect_uri=REDIRECT_URI,
+        client_id=client_id,
+        client_secret=client_secret,
+        redirect_uri=redirect_uri,
+        cache_handler=StateTokenCache(),
         scope="user-top-read playlist-modify-private user-read-recently-played user-library-read"
     )
 
 def get_spotify_client(user_authenticated=False, user_token=None):
     """
     Returns a Spotipy client. If token is invalid or expired, falls back to unauthenticated (public) mode.
+    Public endpoints (genre searches, artist top tracks) are served from a process wide cache.
+
+    All clients share one connection pool, public requests share one app token and
+    user clients are lightweight wrappers around the user's token. Every call goes
+    through the process wide scheduler (rate budget, 429 backoff, priorities, coalescing).
     """
     if user_authenticated and user_token:
         try:
             # use token directly (skip .cache/refresh flow)
-            return spotipy.Spotify(auth=user_token)
+            return CachedSpotify(ScheduledSpotify(PooledSpotify(auth=user_token)))
         except Exception as e:
             logger.error(f"error with Spotify authentication: {str(e)}")
             logger.warning("falling back to public client due to auth failure.")
-            return spotipy.Spotify(auth_manager=SpotifyClientCredentials(
-                client_id=SPOTIFY_CLIENT_ID,
-                client_secret=SPOTIFY_CLIENT_SECRET
-            ))
-
-    return spotipy.Spotify(auth_manager=SpotifyClientCredentials(
-        client_id=SPOTIFY_CLIENT_ID,
-        client_secret=SPOTIFY_CLIENT_SECRET
-    ))
+            return CachedSpotify(ScheduledSpotify(get_app_client()))
+
+    return CachedSpotify(ScheduledSpotify(get_app_client()))
@@ -30,3 +30,18 @@ def format_song_response(song_data):
         }
         for item in items
     ]
+
+
+def format_track_response(tracks):
+    """formatting compact Track records for correct API output."""
+    if not tracks:
+        return [{"message": "No songs found"}]
+
+    return [
+        {
+            "title": track.title,
+            "artist": track.artist,
+            "url": track.url
+        }
+        for track in tracks
+    ]
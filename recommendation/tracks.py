@@ -0,0 +1,46 @@
+class Track:
+    """
+    Compact track record used inside the recommender instead of the full spotipy JSON
+    (album art, markets, ...). Only ids, names and genres are kept, urls / uris are
+    built from the id when needed.
+    """
+
+    __slots__ = ("id", "title", "artist_ids", "artist_names", "genres")
+
+    def __init__(self, id, title, artist_ids, artist_names, genres=()):
+        self.id = id
+        self.title = title
+        self.artist_ids = artist_ids
+        self.artist_names = artist_names
+        self.genres = genres
+
+    @classmethod
+    def from_api(cls, item, genres=()):
+        """build a track from a spotipy track object, the raw dict can be dropped afterwards."""
+        artists = item.get("artists") or []
+        return cls(
+            item["id"],
+            item["name"],
+            tuple(artist["id"] for artist in artists),
+            tuple(artist["name"] for artist in artists),
+            tuple(genres),
+        )
+
+    @property
+    def artist(self):
+        return ", ".join(self.artist_names)
+
+    @property
+    def main_artist_id(self):
+        return self.artist_ids[0] if self.artist_ids else None
+
+    @property
+    def url(self):
+        return f"https://open.spotify.com/track/{self.id}"
+
+    @property
+    def uri(self):
+        return f"spotify:track:{self.id}"
+
+    def __repr__(self):
+        return f"Track({self.id!r}, {self.title!r})"
@@ -0,0 +1,462 @@
+"""
+Pluggable state shared by every worker process: job status / results, Spotify
+tokens and the shared (L2) caches.
+
+    STATE_BACKEND=memory   # default, one process only (uvicorn without --workers)
+    STATE_BACKEND=sqlite   # several workers on one host, STATE_SQLITE_PATH (WAL mode)
+    STATE_BACKEND=redis    # several hosts, STATE_REDIS_URL (needs the redis package)
+
+Every backend offers the same small Redis like interface: JSON values with an
+optional ttl, and hashes with atomic per-field writes and read-modify-write
+updates. Cross-process waiting is done by polling (see api.jobs).
+"""
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+
+# setting up the logger
+logger = logging.getLogger(__name__)
+
+STATE_BACKEND = os.getenv("STATE_BACKEND", "memory")
+STATE_SQLITE_PATH = os.getenv("STATE_SQLITE_PATH", "state.sqlite3")
+STATE_REDIS_URL = os.getenv("STATE_REDIS_URL", "redis://localhost:6379/0")
+
+# prefix for every key, so several deployments can share one Redis
+STATE_KEY_PREFIX = os.getenv("STATE_KEY_PREFIX", "emotionalrec:")
+
+
+def _dumps(value):
+    return json.dumps(value, separators=(",", ":"))
+
+
+def _loads(raw):
+    return None if raw is None else json.loads(raw)
+
+
+class StateBackend:
+    """
+    Interface of a state backend. ttl arguments are seconds (None = keep forever).
+    shared tells whether other processes see the same data.
+    """
+
+    name = "base"
+    shared = False
+
+    def get(self, key):
+        raise NotImplementedError
+
+    def set(self, key, value, ttl=None):
+        raise NotImplementedError
+
+    def delete(self, key):
+        raise NotImplementedError
+
+    def delete_prefix(self, prefix):
+        """delete every key starting with prefix (e.g. a whole cache namespace)."""
+        raise NotImplementedError
+
+    def hset(self, key, mapping, ttl=None):
+        """set several fields of a hash at once, ttl (if given) applies to the whole hash."""
+        raise NotImplementedError
+
+    def hgetall(self, key):
+        """all fields of a hash as a dict, {} if it doesn't exist."""
+        raise NotImplementedError
+
+    def hupdate(self, key, update, ttl=None):
+        """
+        Atomic read-modify-write of an existing hash: update(fields) returns the fields to
+        set (or None / {} to leave it alone), no other writer can change the hash in between.
+        Returns what was written, or None if the hash doesn't exist (nothing is created).
+        update may run more than once (Redis retries on a conflict), so it must not have side effects.
+        """
+        raise NotImplementedError
+
+    def hdel(self, key, field):
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+
+class MemoryBackend(StateBackend):
+    """dicts in this process, the behaviour before state backends existed."""
+
+    name = "memory"
+
+    # expired keys are dropped when they are read, and all of them at most every N seconds
+    # (finished jobs are rarely read again, they would stay in memory otherwise)
+    PURGE_SECONDS = 60
+
+    def __init__(self):
+        self._data = {}  # key -> [value, expires_at]
+        self._lock = threading.Lock()
+        self._last_purge = time.time()
+
+    def _purge_expired(self):
+        now = time.time()
+        if now - self._last_purge < self.PURGE_SECONDS:
+            return
+        self._last_purge = now
+        for key in [key for key, entry in self._data.items() if entry[1] is not None and entry[1] <= now]:
+            del self._data[key]
+
+    def _live(self, key):
+        self._purge_expired()
+        entry = self._data.get(key)
+        if entry and entry[1] is not None and entry[1] <= time.time():
+            del self._data[key]
+            return None
+        return entry
+
+    @staticmethod
+    def _expires(ttl):
+        return time.time() + ttl if ttl is not None else None
+
+    def get(self, key):
+        with self._lock:
+            entry = self._live(key)
+            return _loads(entry[0]) if entry else None
+
+    def set(self, key, value, ttl=None):
+        # stored encoded so callers can't mutate what other readers get back
+        with self._lock:
+            self._purge_expired()
+            self._data[key] = [_dumps(value), self._expires(ttl)]
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def delete_prefix(self, prefix):
+        with self._lock:
+            for key in [key for key in self._data if key.startswith(prefix)]:
+                del self._data[key]
+
+    def hset(self, key, mapping, ttl=None):
+        with self._lock:
+            entry = self._live(key)
+            if entry is None:
+                entry = self._data[key] = [{}, None]
+            entry[0].update((field, _dumps(value)) for field, value in mapping.items())
+            if ttl is not None:
+                entry[1] = self._expires(ttl)
+
+    def hgetall(self, key):
+        with self._lock:
+            entry = self._live(key)
+            return {field: _loads(raw) for field, raw in entry[0].items()} if entry else {}
+
+    def hupdate(self, key, update, ttl=None):
+        with self._lock:
+            entry = self._live(key)
+            if entry is None:
+                return None
+            mapping = update({field: _loads(raw) for field, raw in entry[0].items()}) or {}
+            if mapping:
+                entry[0].update((field, _dumps(value)) for field, value in mapping.items())
+                if ttl is not None:
+                    entry[1] = self._expires(ttl)
+            return mapping
+
+    def hdel(self, key, field):
+        with self._lock:
+            entry = self._live(key)
+            if entry:
+                entry[0].pop(field, None)
+
+
+SQLITE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS kv (key TEXT PRIMARY KEY, value TEXT NOT NULL, expires_at REAL);
+CREATE TABLE IF NOT EXISTS hashes (
+    key TEXT NOT NULL, field TEXT NOT NULL, value TEXT NOT NULL, expires_at REAL,
+    PRIMARY KEY (key, field)
+);
+"""
+
+
+class SQLiteBackend(StateBackend):
+    """
+    One SQLite file shared by every worker on the host.
+    WAL mode lets readers run while another process writes, each thread gets its own connection.
+    """
+
+    name = "sqlite"
+    shared = True
+
+    # expired rows are deleted on every Nth write
+    PURGE_EVERY = 500
+
+    def __init__(self, path=STATE_SQLITE_PATH):
+        self.path = path
+        self._local = threading.local()
+        self._writes = 0
+        self._connection().executescript(SQLITE_SCHEMA)
+
+    def _connection(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=10, isolation_level=None, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute("PRAGMA busy_timeout=10000")
+            self._local.conn = conn
+        return conn
+
+    def _conn(self):
+        return _Transaction(self._connection())
+
+    def _after_write(self, conn):
+        self._writes += 1
+        if self._writes % self.PURGE_EVERY == 0:
+            now = time.time()
+            for table in ("kv", "hashes"):
+                conn.execute(f"DELETE FROM {table} WHERE expires_at IS NOT NULL AND expires_at <= ?", (now,))
+
+    @staticmethod
+    def _expires(ttl):
+        return time.time() + ttl if ttl is not None else None
+
+    # reads run outside a write transaction, WAL gives them a consistent snapshot
+
+    def get(self, key):
+        row = self._connection().execute(
+            "SELECT value FROM kv WHERE key = ? AND (expires_at IS NULL OR expires_at > ?)", (key, time.time())
+        ).fetchone()
+        return _loads(row[0]) if row else None
+
+    def set(self, key, value, ttl=None):
+        with self._conn() as conn:
+            conn.execute(
+                "INSERT INTO kv (key, value, expires_at) VALUES (?, ?, ?) "
+                "ON CONFLICT(key) DO UPDATE SET value = excluded.value, expires_at = excluded.expires_at",
+                (key, _dumps(value), self._expires(ttl)),
+            )
+            self._after_write(conn)
+
+    def delete(self, key):
+        with self._conn() as conn:
+            conn.execute("DELETE FROM kv WHERE key = ?", (key,))
+            conn.execute("DELETE FROM hashes WHERE key = ?", (key,))
+
+    def delete_prefix(self, prefix):
+        # substr instead of LIKE, key names contain "_" (a LIKE wildcard)
+        with self._conn() as conn:
+            for table in ("kv", "hashes"):
+                conn.execute(f"DELETE FROM {table} WHERE substr(key, 1, ?) = ?", (len(prefix), prefix))
+
+    def _hash_expiry(self, conn, key):
+        row = conn.execute("SELECT expires_at FROM hashes WHERE key = ? LIMIT 1", (key,)).fetchone()
+        return row[0] if row else None
+
+    def _drop_expired_hash(self, conn, key):
+        conn.execute("DELETE FROM hashes WHERE key = ? AND expires_at IS NOT NULL AND expires_at <= ?",
+                     (key, time.time()))
+
+    def _hset(self, conn, key, mapping, ttl):
+        expires_at = self._expires(ttl) if ttl is not None else self._hash_expiry(conn, key)
+        conn.executemany(
+            "INSERT INTO hashes (key, field, value, expires_at) VALUES (?, ?, ?, ?) "
+            "ON CONFLICT(key, field) DO UPDATE SET value = excluded.value",
+            [(key, field, _dumps(value), expires_at) for field, value in mapping.items()],
+        )
+        if ttl is not None:
+            conn.execute("UPDATE hashes SET expires_at = ? WHERE key = ?", (expires_at, key))
+        self._after_write(conn)
+
+    def hset(self, key, mapping, ttl=None):
+        with self._conn() as conn:
+            self._drop_expired_hash(conn, key)
+            self._hset(conn, key, mapping, ttl)
+
+    @staticmethod
+    def _hgetall(conn, key):
+        rows = conn.execute(
+            "SELECT field, value FROM hashes WHERE key = ? AND (expires_at IS NULL OR expires_at > ?)",
+            (key, time.time()),
+        ).fetchall()
+        return {field: _loads(value) for field, value in rows}
+
+    def hgetall(self, key):
+        return self._hgetall(self._connection(), key)
+
+    def hupdate(self, key, update, ttl=None):
+        # BEGIN IMMEDIATE takes the write lock before reading, so the read and the write can't interleave
+        with self._conn() as conn:
+            record = self._hgetall(conn, key)
+            if not record:
+                return None
+            mapping = update(record) or {}
+            if mapping:
+                self._hset(conn, key, mapping, ttl)
+            return mapping
+
+    def hdel(self, key, field):
+        with self._conn() as conn:
+            conn.execute("DELETE FROM hashes WHERE key = ? AND field = ?", (key, field))
+
+    def close(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is not None:
+            conn.close()
+            self._local.conn = None
+
+
+class _Transaction:
+    """`with` block that runs as one immediate transaction (writers queue instead of failing)."""
+
+    def __init__(self, conn):
+        self.conn = conn
+
+    def __enter__(self):
+        self.conn.execute("BEGIN IMMEDIATE")
+        return self.conn
+
+    def __exit__(self, exc_type, exc, tb):
+        self.conn.execute("ROLLBACK" if exc_type else "COMMIT")
+
+
+# compare-and-set of a hash for RedisBackend.hupdate: applies the field / value pairs only if
+# the hash exists and its revision is still the one the update was computed from.
+# KEYS[1] hash, ARGV[1] expected revision ('' = none yet), ARGV[2] ttl in ms ('' = keep), ARGV[3..] fields / values
+HASH_CAS_SCRIPT = """
+if redis.call('EXISTS', KEYS[1]) == 0 then return -1 end
+local rev = redis.call('HGET', KEYS[1], '_rev') or ''
+if rev ~= ARGV[1] then return 0 end
+redis.call('HSET', KEYS[1], '_rev', (tonumber(rev) or 0) + 1, unpack(ARGV, 3))
+if ARGV[2] ~= '' then redis.call('PEXPIRE', KEYS[1], ARGV[2]) end
+return 1
+"""
+
+# deletes hash fields and bumps the revision in one step, so a concurrent hupdate can't bring them back
+# KEYS[1] hash, ARGV fields
+HASH_DEL_SCRIPT = """
+redis.call('HDEL', KEYS[1], unpack(ARGV))
+if redis.call('EXISTS', KEYS[1]) == 1 then redis.call('HINCRBY', KEYS[1], '_rev', 1) end
+return 1
+"""
+
+# field holding the hash revision used by HASH_CAS_SCRIPT, hidden from readers
+# (hset doesn't bump it, so it must not write fields that hupdate also writes)
+REVISION_FIELD = "_rev"
+
+
+class RedisBackend(StateBackend):
+    """
+    Redis (or anything speaking its API). client can be passed in, e.g. a redis.Redis
+    built elsewhere or benchmarks.fake_redis.FakeRedis, otherwise one is created from url.
+    """
+
+    name = "redis"
+    shared = True
+
+    def __init__(self, url=STATE_REDIS_URL, client=None, prefix=STATE_KEY_PREFIX):
+        if client is None:
+            try:
+                import redis
+            except ImportError:
+                raise RuntimeError("STATE_BACKEND=redis needs the redis package: pip install redis")
+            client = redis.Redis.from_url(url, decode_responses=True)
+        self.client = client
+        self.prefix = prefix
+
+    def _key(self, key):
+        return f"{self.prefix}{key}"
+
+    @staticmethod
+    def _ttl_ms(ttl):
+        return max(1, int(ttl * 1000)) if ttl is not None else None
+
+    def get(self, key):
+        return _loads(self.client.get(self._key(key)))
+
+    def set(self, key, value, ttl=None):
+        self.client.set(self._key(key), _dumps(value), px=self._ttl_ms(ttl))
+
+    def delete(self, key):
+        self.client.delete(self._key(key))
+
+    def delete_prefix(self, prefix):
+        # SCAN walks the keyspace in steps instead of blocking Redis like KEYS would
+        pattern = "".join(f"\\{char}" if char in "*?[]\\" else char for char in self._key(prefix)) + "*"
+        batch = []
+        for name in self.client.scan_iter(match=pattern, count=500):
+            batch.append(name)
+            if len(batch) >= 500:
+                self.client.delete(*batch)
+                batch = []
+        if batch:
+            self.client.delete(*batch)
+
+    def hset(self, key, mapping, ttl=None):
+        name = self._key(key)
+        self.client.hset(name, mapping={field: _dumps(value) for field, value in mapping.items()})
+        if ttl is not None:
+            self.client.pexpire(name, self._ttl_ms(ttl))
+
+    def hgetall(self, key):
+        return {field: _loads(raw) for field, raw in (self.client.hgetall(self._key(key)) or {}).items()
+                if field != REVISION_FIELD}
+
+    def hupdate(self, key, update, ttl=None):
+        # optimistic: compute the change from a snapshot, the script only applies it if nobody wrote in between
+        name = self._key(key)
+        ttl_ms = self._ttl_ms(ttl)
+        while True:
+            raw = self.client.hgetall(name) or {}
+            if not raw:
+                return None
+            revision = raw.pop(REVISION_FIELD, "")
+            mapping = update({field: _loads(value) for field, value in raw.items()}) or {}
+            if not mapping:
+                return mapping
+            pairs = [item for field, value in mapping.items() for item in (field, _dumps(value))]
+            applied = self.client.eval(HASH_CAS_SCRIPT, 1, name, revision, ttl_ms or "", *pairs)
+            if applied == 1:
+                return mapping
+            if applied == -1:
+                return None
+
+    def hdel(self, key, field):
+        self.client.eval(HASH_DEL_SCRIPT, 1, self._key(key), field)
+
+    def close(self):
+        close = getattr(self.client, "close", None)
+        if close:
+            close()
+
+
+def create_backend(kind=None):
+    """build the backend named by kind (or STATE_BACKEND)."""
+    kind = (kind or STATE_BACKEND).lower()
+    if kind == "memory":
+        return MemoryBackend()
+    if kind == "sqlite":
+        return SQLiteBackend(STATE_SQLITE_PATH)
+    if kind == "redis":
+        return RedisBackend(STATE_REDIS_URL)
+    raise ValueError(f"Unknown STATE_BACKEND '{kind}', use memory, sqlite or redis.")
+
+
+_backend = None
+_backend_lock = threading.Lock()
+
+
+def get_state_backend():
+    """process wide backend, created on first use."""
+    global _backend
+    with _backend_lock:
+        if _backend is None:
+            _backend = create_backend()
+            logger.info(f"using the {_backend.name} state backend")
+        return _backend
+
+
+def set_state_backend(backend):
+    """swap the process wide backend (benchmarks, or an app factory building its own)."""
+    global _backend
+    with _backend_lock:
+        _backend = backend